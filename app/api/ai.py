@@ -1,27 +1,191 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Response
+import json
+import logging
+import time
+from dataclasses import asdict
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.core.tracing import span
 
 from app.schemas.ai import (
+    BatchChatItem,
+    BatchChatRequest,
+    BatchChatResponse,
+    CacheStatsResponse,
     ChatRequest,
     ChatResponse,
     ExplainRequest,
     ExplainResponse,
+    RateLimitStatsResponse,
+    RouterBackendStats,
+    SingleFlightStatsResponse,
+    TokenCountRequest,
+    TokenCountResponse,
 )
 from app.services.ai import service as ai_service
+from app.services.ai.cache import get_cache
+from app.services.ai.prompts import get_prompt
+from app.services.ai.providers import get_provider
+from app.services.ai.ratelimit import limiter_stats
+from app.services.ai.tokenizer import get_tokenizer
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
+logger = logging.getLogger("ai")
+
+
+def _use_cache(request: Request) -> bool:
+    """Clients opt out of cached answers with X-Cache-Bypass or Cache-Control: no-cache."""
+    if request.headers.get("X-Cache-Bypass", "").lower() in ("1", "true", "yes"):
+        return False
+    return "no-cache" not in request.headers.get("Cache-Control", "").lower()
+
+
+def _json_response(model: BaseModel, request_id: str) -> Response:
+    """Serialize once, inside a span; skips FastAPI's re-validation of the return value."""
+    with span("response.serialize", model=type(model).__name__):
+        body = model.model_dump_json()
+    return Response(body, media_type="application/json", headers={"X-Request-ID": request_id})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_stream(events: AsyncIterator[Tuple[str, dict]], name: str) -> AsyncIterator[str]:
+    try:
+        async for event, data in events:
+            yield _sse(event, data)
+    except Exception:
+        # Headers are already sent, so report the failure in-band
+        logger.exception(f"ai.{name}.stream_failed")
+        yield _sse("error", {"detail": "upstream generation failed"})
+
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 
 @router.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest, response: Response) -> ChatResponse:
-    data = ai_service.chat(req.prompt)
-    response.headers["X-Request-ID"] = data["request_id"]
-    return ChatResponse(**data)
+async def chat(req: ChatRequest, request: Request) -> Response:
+    data = await ai_service.achat(
+        req.prompt,
+        use_cache=_use_cache(request),
+        request_id=request.state.request_id,
+        template_version=req.template_version,
+    )
+    return _json_response(ChatResponse(**data), data["request_id"])
+
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request) -> StreamingResponse:
+    """Server-Sent Events variant of /ai/chat."""
+    # Resolve the template before the 200 goes out so a bad version is a 400
+    get_prompt("chat", req.template_version)
+    events = ai_service.achat_stream(
+        req.prompt, request_id=request.state.request_id, template_version=req.template_version
+    )
+    return StreamingResponse(_sse_stream(events, "chat"), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+@router.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(req: BatchChatRequest, request: Request) -> BatchChatResponse:
+    t0 = time.perf_counter()
+    items = [
+        BatchChatItem(**item)
+        async for item in ai_service.achat_batch(
+            [item.prompt for item in req.items],
+            concurrency=req.concurrency,
+            ordered=req.ordered,
+            use_cache=_use_cache(request),
+            template_versions=[item.template_version for item in req.items],
+        )
+    ]
+    succeeded = sum(1 for item in items if item.ok)
+    return BatchChatResponse(
+        latency_ms=int((time.perf_counter() - t0) * 1000),
+        succeeded=succeeded,
+        failed=len(items) - succeeded,
+        items=items,
+    )
+
+
+async def _ndjson_batch(req: BatchChatRequest, use_cache: bool) -> AsyncIterator[str]:
+    async for item in ai_service.achat_batch(
+        [item.prompt for item in req.items],
+        concurrency=req.concurrency,
+        ordered=req.ordered,
+        use_cache=use_cache,
+        template_versions=[item.template_version for item in req.items],
+    ):
+        yield BatchChatItem(**item).model_dump_json() + "\n"
+
+
+@router.post("/chat/batch/stream")
+async def chat_batch_stream(req: BatchChatRequest, request: Request) -> StreamingResponse:
+    """NDJSON variant of /ai/chat/batch: one item per line as soon as it is ready."""
+    return StreamingResponse(
+        _ndjson_batch(req, _use_cache(request)),
+        media_type="application/x-ndjson",
+    )
 
 
 @router.post("/explain", response_model=ExplainResponse)
-def explain(req: ExplainRequest, response: Response) -> ExplainResponse:
-    data = ai_service.explain(req.topic, req.context)
-    response.headers["X-Request-ID"] = data["request_id"]
-    return ExplainResponse(**data)
+async def explain(req: ExplainRequest, request: Request) -> Response:
+    data = await ai_service.aexplain(
+        req.topic,
+        req.context,
+        use_cache=_use_cache(request),
+        request_id=request.state.request_id,
+        template_version=req.template_version,
+    )
+    return _json_response(ExplainResponse(**data), data["request_id"])
+
+
+@router.post("/tokens", response_model=TokenCountResponse)
+def count_tokens(req: TokenCountRequest) -> TokenCountResponse:
+    """Token counts for budgeting prompts before sending them."""
+    tokenizer = get_tokenizer()
+    counts = tokenizer.count_batch(req.texts)
+    return TokenCountResponse(tokenizer=tokenizer.name, counts=counts, total=sum(counts))
+
+
+@router.post("/explain/stream")
+async def explain_stream(req: ExplainRequest, request: Request) -> StreamingResponse:
+    """Server-Sent Events variant of /ai/explain with fields as soon as they parse."""
+    get_prompt("explain", req.template_version)
+    events = ai_service.aexplain_stream(
+        req.topic, req.context, request_id=request.state.request_id, template_version=req.template_version
+    )
+    return StreamingResponse(_sse_stream(events, "explain"), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+def cache_stats() -> CacheStatsResponse:
+    cache = get_cache()
+    return CacheStatsResponse(backend=cache.backend, **asdict(cache.stats()))
+
+
+@router.get("/singleflight/stats", response_model=SingleFlightStatsResponse)
+def singleflight_stats() -> SingleFlightStatsResponse:
+    return SingleFlightStatsResponse(**asdict(ai_service.single_flight.stats()))
+
+
+@router.get("/ratelimit/stats", response_model=List[RateLimitStatsResponse])
+def ratelimit_stats() -> List[RateLimitStatsResponse]:
+    return [RateLimitStatsResponse(**asdict(stats)) for stats in limiter_stats()]
+
+
+@router.get("/router/stats", response_model=List[RouterBackendStats])
+def router_stats() -> List[RouterBackendStats]:
+    # imported here: the router module is only loaded when AI_BACKENDS is set
+    from app.services.ai.router import ProviderRouter
+
+    provider = get_provider()
+    if not isinstance(provider, ProviderRouter):
+        return []
+    return [RouterBackendStats(**asdict(stats)) for stats in provider.stats()]
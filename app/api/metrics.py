@@ -0,0 +1,21 @@
+from dataclasses import asdict
+from typing import Any, Dict, List
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.admission import admission_stats
+from app.core.metrics import registry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/admission")
+def admission() -> List[Dict[str, Any]]:
+    """Per-route admission control state: adaptive limit, in-flight, queue and shed counts."""
+    return [asdict(stats) for stats in admission_stats()]
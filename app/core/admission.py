@@ -0,0 +1,328 @@
+"""Adaptive admission control for HTTP routes.
+
+Each route template gets a concurrency limit that adapts to the latency
+it observes, a bounded FIFO queue in front of it and an estimate of how
+long a newcomer would wait. A request that would wait longer than
+max_wait_s, or finds the queue full, is rejected straight away with 503
+and Retry-After instead of piling up behind a slow upstream until the
+client times out anyway. See AdmissionControlMiddleware.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional
+
+from app.core.metrics import Sample, registry
+from app.core.settings import Settings, get_settings
+
+logger = logging.getLogger("http")
+
+admission_queue_time = registry.histogram(
+    "http_admission_queue_seconds", "Time requests waited for admission per route.", ("route",)
+)
+
+
+class Overloaded(RuntimeError):
+    """Request shed by admission control."""
+
+    def __init__(self, message: str, retry_after_s: float = 1.0) -> None:
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class FixedLimit:
+    name = "fixed"
+
+    def __init__(self, limit: int) -> None:
+        self.limit = float(limit)
+
+    def update(self, rtt_s: float, inflight: int, dropped: bool) -> None:
+        pass
+
+
+class AIMDLimit:
+    """Additive increase while saturated, multiplicative decrease on failures or timeouts."""
+
+    name = "aimd"
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, backoff: float = 0.9, timeout_s: float = 30.0) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.timeout_s = timeout_s
+
+    def update(self, rtt_s: float, inflight: int, dropped: bool) -> None:
+        if dropped or rtt_s > self.timeout_s:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif inflight * 2 >= self.limit:
+            # +1 per limit's worth of successes, i.e. roughly +1 per round trip
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class GradientLimit:
+    """Latency-gradient limit in the style of Netflix's Gradient2.
+
+    Compares a short-term latency average with a long-term one: while they
+    match the limit grows by about sqrt(limit) per update; when recent
+    latency rises above the long-term baseline (queueing upstream or in
+    the threadpool) the limit shrinks in proportion, down to half per
+    update. Failures count as a doubled latency.
+    """
+
+    name = "gradient"
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        smoothing: float = 0.2,
+        tolerance: float = 1.5,
+        short_window: int = 10,
+        long_window: int = 600,
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self._short_alpha = 2 / (short_window + 1)
+        self._long_alpha = 2 / (long_window + 1)
+        self._short_rtt = 0.0
+        self._long_rtt = 0.0
+
+    def update(self, rtt_s: float, inflight: int, dropped: bool) -> None:
+        if dropped:
+            rtt_s *= 2
+        if self._long_rtt == 0.0:
+            self._short_rtt = self._long_rtt = rtt_s
+        else:
+            self._short_rtt += (rtt_s - self._short_rtt) * self._short_alpha
+            self._long_rtt += (rtt_s - self._long_rtt) * self._long_alpha
+        # After a slow period the long average lags; let it catch up faster
+        if self._long_rtt > 2 * self._short_rtt:
+            self._long_rtt *= 0.95
+        if inflight * 2 < self.limit and not dropped:
+            return  # not saturated: latency says nothing about the limit
+        gradient = max(0.5, min(1.0, self.tolerance * self._long_rtt / max(self._short_rtt, 1e-6)))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(float(self.min_limit), min(float(self.max_limit), limit))
+
+
+def build_limit(cfg: Settings):
+    kind = cfg.admission_algorithm.lower()
+    if kind == "gradient":
+        return GradientLimit(cfg.admission_initial_limit, cfg.admission_min_limit, cfg.admission_max_limit)
+    if kind == "aimd":
+        return AIMDLimit(
+            cfg.admission_initial_limit,
+            cfg.admission_min_limit,
+            cfg.admission_max_limit,
+            timeout_s=cfg.admission_aimd_timeout_s,
+        )
+    if kind == "fixed":
+        return FixedLimit(cfg.admission_initial_limit)
+    raise RuntimeError(f"Unknown ADMISSION_ALGORITHM={cfg.admission_algorithm}")
+
+
+@dataclass
+class AdmissionStats:
+    route: str
+    algorithm: str
+    limit: int
+    inflight: int
+    queue_depth: int
+    admitted: int = 0
+    queued: int = 0
+    rejected: int = 0
+    queue_ms_total: float = 0.0
+    queue_ms_max: float = 0.0
+    latency_ms_avg: float = 0.0
+
+
+class RouteAdmitter:
+    """Concurrency limit plus FIFO wait queue for one route template.
+
+    Runs on the event loop only, so counters need no lock. A released slot
+    is handed straight to the next waiter, which keeps the queue FIFO and
+    stops newcomers from overtaking it.
+    """
+
+    def __init__(self, route: str, limit, max_queue: int, max_wait_s: float) -> None:
+        self.route = route
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self._limit = limit
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._latency_s = 0.0  # EWMA of time from admission to response start
+        self._stats = AdmissionStats(route=route, algorithm=limit.name, limit=0, inflight=0, queue_depth=0)
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self._limit.limit))
+
+    def estimated_wait_s(self) -> float:
+        """How long a request arriving now would queue, from the queue length and recent latency."""
+        if self._inflight < self.limit and not self._waiters:
+            return 0.0
+        return (len(self._waiters) + 1) / self.limit * self._latency_s
+
+    def _reject(self, reason: str, retry_after_s: float) -> Overloaded:
+        self._stats.rejected += 1
+        logger.warning(
+            "http.admission.rejected",
+            extra={"extra": {
+                "route": self.route,
+                "reason": reason,
+                "limit": self.limit,
+                "inflight": self._inflight,
+                "queue_depth": len(self._waiters),
+            }},
+        )
+        return Overloaded(f"server overloaded: {reason}", retry_after_s=retry_after_s)
+
+    def _record_admit(self, queued_s: float) -> None:
+        stats = self._stats
+        stats.admitted += 1
+        queued_ms = queued_s * 1000
+        stats.queue_ms_total += queued_ms
+        stats.queue_ms_max = max(stats.queue_ms_max, queued_ms)
+        admission_queue_time.labels(self.route).observe(queued_s)
+
+    async def acquire(self) -> float:
+        """Take a slot, queueing if needed; return seconds spent in the queue."""
+        if self._inflight < self.limit and not self._waiters:
+            self._inflight += 1
+            self._record_admit(0.0)
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue full", max(self.estimated_wait_s(), 1.0))
+        estimate = self.estimated_wait_s()
+        if estimate > self.max_wait_s:
+            raise self._reject("wait too long", estimate)
+
+        t0 = time.perf_counter()
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self._stats.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            if not fut.done():
+                self._waiters.remove(fut)
+                fut.cancel()
+                raise self._reject("timed out in queue", self.max_wait_s) from None
+        except asyncio.CancelledError:
+            # Client went away while queued; give back a slot handed to us meanwhile
+            if fut.done() and not fut.cancelled():
+                self._release_slot()
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            raise
+        queued_s = time.perf_counter() - t0
+        self._record_admit(queued_s)
+        return queued_s
+
+    def _release_slot(self) -> None:
+        self._inflight -= 1
+        while self._waiters and self._inflight < self.limit:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self._inflight += 1
+                fut.set_result(None)
+
+    def release(self, latency_s: float, dropped: bool) -> None:
+        """Return a slot and feed the request's latency to the limit."""
+        self._latency_s += (latency_s - self._latency_s) * 0.1 if self._latency_s else latency_s
+        self._limit.update(latency_s, self._inflight, dropped)
+        self._release_slot()
+
+    def stats(self) -> AdmissionStats:
+        stats = AdmissionStats(**vars(self._stats))
+        stats.limit = self.limit
+        stats.inflight = self._inflight
+        stats.queue_depth = len(self._waiters)
+        stats.latency_ms_avg = round(self._latency_s * 1000, 2)
+        return stats
+
+
+class AdmissionController:
+    """One RouteAdmitter per route template, created on first request."""
+
+    def __init__(self, cfg: Settings) -> None:
+        self.cfg = cfg
+        self.exempt = frozenset(p.strip() for p in cfg.admission_exempt.split(",") if p.strip())
+        self._routes: Dict[str, RouteAdmitter] = {}
+
+    def for_route(self, route: str) -> Optional[RouteAdmitter]:
+        """Admitter for a route template, or None for exempt and unmatched paths."""
+        admitter = self._routes.get(route)
+        if admitter is None:
+            # An unmatched path is a cheap 404; it needs no limit of its own
+            if route in self.exempt or route == "unmatched":
+                return None
+            admitter = self._routes[route] = RouteAdmitter(
+                route,
+                build_limit(self.cfg),
+                max_queue=self.cfg.admission_max_queue,
+                max_wait_s=self.cfg.admission_max_wait_s,
+            )
+        return admitter
+
+    def stats(self) -> List[AdmissionStats]:
+        return [admitter.stats() for admitter in self._routes.values()]
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission() -> Optional[AdmissionController]:
+    """Return the process-wide admission controller, or None when disabled."""
+    global _controller
+    cfg = get_settings()
+    if not cfg.admission_control:
+        return None
+    if _controller is None or _controller.cfg is not cfg:
+        # Rebuilt when settings are reloaded
+        _controller = AdmissionController(cfg)
+    return _controller
+
+
+def admission_stats() -> List[AdmissionStats]:
+    return _controller.stats() if _controller is not None else []
+
+
+def _admission_samples() -> Iterable[Sample]:
+    for stats in admission_stats():
+        yield "http_admission_limit", {"route": stats.route}, stats.limit
+
+
+def _inflight_samples() -> Iterable[Sample]:
+    for stats in admission_stats():
+        yield "http_admission_inflight", {"route": stats.route}, stats.inflight
+
+
+def _queue_samples() -> Iterable[Sample]:
+    for stats in admission_stats():
+        yield "http_admission_queue_depth", {"route": stats.route}, stats.queue_depth
+
+
+def _rejected_samples() -> Iterable[Sample]:
+    for stats in admission_stats():
+        yield "http_admission_rejected_total", {"route": stats.route}, stats.rejected
+
+
+registry.register_collector("http_admission_limit", "gauge", "Current adaptive concurrency limit per route.", _admission_samples)
+registry.register_collector("http_admission_inflight", "gauge", "Admitted requests in flight per route.", _inflight_samples)
+registry.register_collector("http_admission_queue_depth", "gauge", "Requests waiting for admission per route.", _queue_samples)
+registry.register_collector("http_admission_rejected_total", "counter", "Requests shed by admission control per route.", _rejected_samples)
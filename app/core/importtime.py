@@ -0,0 +1,126 @@
+"""Import-time profiling for cold starts.
+
+Runs a fresh interpreter with `python -X importtime`, keeps the part of
+its report caused by importing one module (interpreter startup is left
+out) and summarizes it per package and per module. Used by
+`python -m app.serve --profile-startup` and benchmarks/startup.py.
+"""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int  # 0 for an import made directly by the profiled statement
+
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    """Parse `-X importtime` lines; children are listed before their parent."""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        stripped = name.lstrip(" ")
+        depth = (len(name) - len(stripped) - 1) // 2
+        records.append(ImportRecord(stripped, int(self_us), int(cumulative_us), depth))
+    return records
+
+
+def _subtree(records: List[ImportRecord], module: str) -> List[ImportRecord]:
+    """The records of `module` and everything its import pulled in."""
+    for end in range(len(records) - 1, -1, -1):
+        if records[end].depth == 0 and records[end].module == module:
+            break
+    else:
+        raise RuntimeError(f"{module} not found in the -X importtime output")
+    start = end
+    while start > 0 and records[start - 1].depth > 0:
+        start -= 1
+    return records[start:end + 1]
+
+
+def _package(module: str) -> str:
+    # Our own modules are listed one by one, third-party code per top-level package
+    return module if module.split(".", 1)[0] == "app" else module.split(".", 1)[0]
+
+
+def _python(code: str, python: str, *flags: str) -> subprocess.CompletedProcess:
+    # -c puts the working directory on sys.path, so run from the repo root
+    proc = subprocess.run([python, *flags, "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{python} -c {code!r} failed:\n{proc.stderr[-2000:]}")
+    return proc
+
+
+@dataclass
+class ImportProfile:
+    module: str
+    records: List[ImportRecord]
+
+    @property
+    def total_us(self) -> int:
+        return self.records[-1].cumulative_us
+
+    @property
+    def own_us(self) -> int:
+        """Self time of the profiled module's own package, e.g. everything under app."""
+        package = self.module.split(".", 1)[0]
+        return sum(r.self_us for r in self.records if r.module.split(".", 1)[0] == package)
+
+    def by_package(self) -> Dict[str, int]:
+        """Self time per package in microseconds, largest first."""
+        totals: Dict[str, int] = {}
+        for record in self.records:
+            key = _package(record.module)
+            totals[key] = totals.get(key, 0) + record.self_us
+        return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+    def slowest(self, n: int = 20) -> List[ImportRecord]:
+        return sorted(self.records, key=lambda r: r.self_us, reverse=True)[:n]
+
+    def report(self, top: int = 20) -> str:
+        total = self.total_us
+        lines = [
+            f"import {self.module}: {total / 1000:.1f} ms, {len(self.records)} modules"
+            f" ({self.own_us / 1000:.1f} ms in {self.module.split('.', 1)[0]} itself)",
+            "",
+            "by package (self time):",
+        ]
+        for package, us in list(self.by_package().items())[:top]:
+            lines.append(f"  {package:<40} {us / 1000:8.1f} ms {100 * us / total:5.1f}%")
+        lines += ["", "slowest modules (self time):"]
+        for record in self.slowest(top):
+            lines.append(f"  {record.module:<40} {record.self_us / 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+def profile_imports(module: str = "app.main", python: Optional[str] = None) -> ImportProfile:
+    """Import `module` in a fresh interpreter under -X importtime."""
+    proc = _python(f"import {module}", python or sys.executable, "-X", "importtime")
+    return ImportProfile(module, _subtree(parse_importtime(proc.stderr), module))
+
+
+def measure_import_ms(module: str = "app.main", runs: int = 5, python: Optional[str] = None) -> List[float]:
+    """Wall time of `import module` in `runs` fresh interpreters, without -X importtime overhead."""
+    code = (
+        "import time, importlib; t = time.perf_counter(); "
+        f"importlib.import_module({module!r}); print((time.perf_counter() - t) * 1000)"
+    )
+    return [float(_python(code, python or sys.executable).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+
+
+def loaded_modules(module: str = "app.main", python: Optional[str] = None) -> List[str]:
+    """Every module in sys.modules after a cold `import module`."""
+    code = f"import sys, {module}; print('\\n'.join(sorted(sys.modules)))"
+    return _python(code, python or sys.executable).stdout.split()
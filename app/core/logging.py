@@ -1,18 +1,45 @@
 from __future__ import annotations
 
+import atexit
 import json
 import logging
 import sys
+import threading
 import time
-from typing import Any, Dict
+from collections import deque
+from typing import IO, Any, Callable, Dict, List, Optional
+
+
+def _json_dumps() -> Callable[[Dict[str, Any]], str]:
+    """Fastest available serializer: orjson when installed, else a reused encoder."""
+    try:
+        import orjson  # optional; several times faster than json for small dicts
+    except ImportError:
+        return json.JSONEncoder(ensure_ascii=False, default=str).encode
+    return lambda payload: orjson.dumps(payload, default=str).decode("utf-8")
 
 
 class JsonFormatter(logging.Formatter):
     """Minimal JSON formatter for structured logs."""
 
+    def __init__(self) -> None:
+        super().__init__()
+        self._dumps = _json_dumps()
+        # strftime is the costliest part of a small record; cache it per second.
+        # (second, text) is swapped as one tuple so threads never mix the two.
+        self._ts_cache = (-1, "")
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        cached_second, text = self._ts_cache
+        if second != cached_second:
+            text = time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(second))
+            self._ts_cache = (second, text)
+        return text
+
     def format(self, record: logging.LogRecord) -> str:
         payload: Dict[str, Any] = {
-            "ts": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(record.created)),
+            "ts": self._timestamp(record.created),
             "level": record.levelname,
             "logger": record.name,
             "msg": record.getMessage(),
@@ -27,20 +54,140 @@ class JsonFormatter(logging.Formatter):
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
 
-        return json.dumps(payload, ensure_ascii=False)
+        return self._dumps(payload)
+
+
+class AsyncQueueHandler(logging.Handler):
+    """Hands records to a background writer thread instead of writing inline.
+
+    emit() only enqueues; formatting and stream I/O happen on the writer,
+    which flushes in batches. The queue is bounded: when it is full, records
+    are dropped and counted rather than blocking the request, and the writer
+    reports the drop count as a log line of its own.
+    """
+
+    def __init__(
+        self,
+        stream: IO[str],
+        queue_size: int = 10000,
+        batch_size: int = 256,
+        flush_interval_s: float = 0.05,
+    ) -> None:
+        super().__init__()
+        self.stream = stream
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.dropped = 0
+        self._reported_dropped = 0
+        # deque.append/popleft are atomic under the GIL and far cheaper than
+        # queue.Queue, which takes a lock and notifies a condition per put.
+        self._buffer: "deque[logging.LogRecord]" = deque()
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._writer.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if len(self._buffer) >= self.queue_size:
+            self.dropped += 1
+            return
+        if record.args:
+            # Freeze the message now; args may be mutated before the writer runs
+            record.msg = record.getMessage()
+            record.args = None
+        extra = getattr(record, "extra", None)
+        if isinstance(extra, dict):
+            # Callers often reuse or keep updating the dict they logged
+            record.extra = dict(extra)
+        self._buffer.append(record)
+
+    def _dropped_line(self) -> str:
+        dropped = self.dropped
+        newly = dropped - self._reported_dropped
+        self._reported_dropped = dropped
+        record = logging.LogRecord("logging", logging.WARNING, __file__, 0, "log.dropped", None, None)
+        record.extra = {"dropped": newly, "dropped_total": dropped}
+        return self.format(record)
+
+    def _flush_buffer(self) -> None:
+        """Format and write everything buffered, one stream write per batch."""
+        buffer = self._buffer
+        while buffer:
+            lines = []
+            for _ in range(min(self.batch_size, len(buffer))):
+                record = buffer.popleft()
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.handleError(record)
+            if lines:
+                self.stream.write("\n".join(lines) + "\n")
+        if self.dropped != self._reported_dropped:
+            self.stream.write(self._dropped_line() + "\n")
+        self.stream.flush()
 
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval_s):
+            if self._buffer or self.dropped != self._reported_dropped:
+                try:
+                    self._flush_buffer()
+                except Exception:
+                    # Never let a broken stream kill the writer thread
+                    self.dropped += len(self._buffer)
+                    self._buffer.clear()
+        self._flush_buffer()
+
+    def flush(self) -> None:
+        # Best effort: the writer owns the stream, so just wait for it to catch up
+        deadline = time.monotonic() + 1.0
+        while self._buffer and self._writer.is_alive() and time.monotonic() < deadline:
+            time.sleep(self.flush_interval_s / 10)
+
+    def close(self) -> None:
+        """Flush everything buffered so far and stop the writer."""
+        if self._writer.is_alive():
+            self._stop.set()
+            self._writer.join(timeout=5)
+        super().close()
+
+
+_async_handler: Optional[AsyncQueueHandler] = None
+
+
+def setup_logging(level: str = "INFO", async_writer: bool = True) -> None:
+    """Configure root logger to output JSON logs to stdout.
+
+    With async_writer (the default) records are written by a background
+    thread; pass async_writer=False for a plain synchronous StreamHandler.
+    """
+    global _async_handler
+    shutdown_logging()
 
-def setup_logging(level: str = "INFO") -> None:
-    """Configure root logger to output JSON logs to stdout."""
     root = logging.getLogger()
     root.handlers.clear()
     root.setLevel(level.upper())
 
-    handler = logging.StreamHandler(sys.stdout)
+    handler: logging.Handler
+    if async_writer:
+        handler = _async_handler = AsyncQueueHandler(sys.stdout)
+    else:
+        handler = logging.StreamHandler(sys.stdout)
     handler.setLevel(level.upper())
     handler.setFormatter(JsonFormatter())
 
     root.addHandler(handler)
 
     # Reduce noise from uvicorn access logs if desired
-    logging.getLogger("uvicorn.access").setLevel("WARNING")
\ No newline at end of file
+    logging.getLogger("uvicorn.access").setLevel("WARNING")
+
+
+def shutdown_logging() -> None:
+    """Flush and stop the background writer, if one is running."""
+    global _async_handler
+    handler, _async_handler = _async_handler, None
+    if handler is not None:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+
+
+atexit.register(shutdown_logging)
@@ -1,15 +1,104 @@
 from __future__ import annotations
 
+import math
 import time
 import uuid
 import logging
-from typing import Callable
+from typing import Callable, Dict, Optional
 
 from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.admission import Overloaded, get_admission
+from app.core.metrics import http_inflight, http_latency, http_requests
+from app.core.tracing import span, start_trace
 
 logger = logging.getLogger("http")
 
 
+def route_template(request: Request) -> str:
+    """Matched route path (e.g. /todos/{todo_id}) to keep metric labels bounded."""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+# path -> route template; bounded because paths with parameters are unbounded
+_route_by_path: Dict[str, str] = {}
+_ROUTE_CACHE_MAX = 4096
+
+
+def match_route_template(request: Request) -> str:
+    """Route template a request will be routed to, before routing runs."""
+    path = request.url.path
+    template = _route_by_path.get(path)
+    if template is None:
+        template = "unmatched"
+        for route in request.app.router.routes:
+            match, _ = route.matches(request.scope)
+            if match is not Match.NONE:
+                template = getattr(route, "path", None) or template
+                break
+        if len(_route_by_path) >= _ROUTE_CACHE_MAX:
+            _route_by_path.clear()
+        _route_by_path[path] = template
+    return template
+
+
+class AdmissionControlMiddleware:
+    """Shed load per route before it queues up in handlers and the threadpool.
+
+    Exempt routes (by default /, /health and the /metrics endpoints) and
+    paths that match no route bypass it entirely. Written as plain ASGI
+    rather than as an @app.middleware("http") function, so it adds no extra
+    task or body re-streaming per request. The slot is held until the app
+    returns, i.e. until the last body chunk has been sent, so streaming
+    responses count for as long as they run.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = get_admission() if scope["type"] == "http" else None
+        admitter = controller.for_route(match_route_template(Request(scope))) if controller is not None else None
+        if admitter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            queued_s = await admitter.acquire()
+        except Overloaded as exc:
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": str(exc)},
+                headers={"Retry-After": str(max(1, math.ceil(exc.retry_after_s)))},
+            )
+            await response(scope, receive, send)
+            return
+
+        t0 = time.perf_counter()
+        # Latency to the response start drives the limit; a long stream is not slowness
+        latency_s: Optional[float] = None
+        dropped = True
+
+        async def send_timed(message: Message) -> None:
+            nonlocal latency_s, dropped
+            if message["type"] == "http.response.start":
+                latency_s = time.perf_counter() - t0
+                dropped = message["status"] >= 500
+                if queued_s:
+                    MutableHeaders(scope=message).append("X-Queue-Time-Ms", str(int(queued_s * 1000)))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            admitter.release(latency_s if latency_s is not None else time.perf_counter() - t0, dropped)
+
+
 async def request_logging_middleware(request: Request, call_next: Callable) -> Response:
     t0 = time.perf_counter()
 
@@ -17,13 +106,25 @@ async def request_logging_middleware(request: Request, call_next: Callable) -> R
     request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
     request.state.request_id = request_id
 
+    start_trace(request_id)
+
     status_code = 500
+    http_inflight.inc()
     try:
-        response: Response = await call_next(request)
-        status_code = response.status_code
+        with span("http.request", method=request.method, path=request.url.path) as root:
+            response: Response = await call_next(request)
+            status_code = response.status_code
+            if root is not None:
+                root.attributes["route"] = route_template(request)
+                root.attributes["status_code"] = status_code
         return response
     finally:
-        latency_ms = int((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - t0
+        latency_ms = int(elapsed * 1000)
+        http_inflight.dec()
+        route = route_template(request)
+        http_requests.labels(route, request.method, str(status_code)).inc()
+        http_latency.labels(route, request.method).observe(elapsed)
 
         # Ensure response carries request id (even if exception happens, may not be available)
         try:
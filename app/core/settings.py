@@ -1,15 +1,132 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+def _env(name: str, default: str, cast: Callable[[str], Any] = str) -> Any:
+    """Field whose default is read from the environment at construction time."""
+    return field(default_factory=lambda: cast(os.getenv(name, default)))
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
 
 
 @dataclass(frozen=True)
 class Settings:
-    ai_provider: str = os.getenv("AI_PROVIDER", "stub")  # stub | openai
-    openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
-    openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    openai_timeout_s: float = float(os.getenv("OPENAI_TIMEOUT_S", "30"))
+    ai_provider: str = _env("AI_PROVIDER", "stub")  # stub | openai
+    # Comma-separated kind[:model][@API_KEY_ENV] list; when set, requests are
+    # routed across these backends instead of AI_PROVIDER.
+    ai_backends: str = _env("AI_BACKENDS", "")
+    openai_api_key: str = _env("OPENAI_API_KEY", "")
+    openai_model: str = _env("OPENAI_MODEL", "gpt-4o-mini")
+    openai_timeout_s: float = _env("OPENAI_TIMEOUT_S", "30", float)
+    openai_max_connections: int = _env("OPENAI_MAX_CONNECTIONS", "100", int)
+    openai_max_keepalive: int = _env("OPENAI_MAX_KEEPALIVE", "20", int)
+    stub_delay_ms: int = _env("STUB_DELAY_MS", "0", int)  # synthetic upstream latency
+    stub_chunk_delay_ms: int = _env("STUB_CHUNK_DELAY_MS", "0", int)  # per streamed chunk
+    stub_failure_rate: float = _env("STUB_FAILURE_RATE", "0", float)  # fault injection
+    stub_hang_rate: float = _env("STUB_HANG_RATE", "0", float)
+    ai_resilience: bool = _env("AI_RESILIENCE", "1", _flag)
+    ai_attempt_timeout_s: float = _env("AI_ATTEMPT_TIMEOUT_S", "30", float)
+    ai_deadline_s: float = _env("AI_DEADLINE_S", "60", float)
+    ai_max_attempts: int = _env("AI_MAX_ATTEMPTS", "3", int)
+    ai_backoff_base_ms: int = _env("AI_BACKOFF_BASE_MS", "100", int)
+    ai_backoff_max_ms: int = _env("AI_BACKOFF_MAX_MS", "2000", int)
+    ai_retry_budget_ratio: float = _env("AI_RETRY_BUDGET_RATIO", "0.2", float)
+    ai_breaker_failures: int = _env("AI_BREAKER_FAILURES", "5", int)
+    ai_breaker_reset_s: float = _env("AI_BREAKER_RESET_S", "30", float)
+    ai_hedge_after_ms: int = _env("AI_HEDGE_AFTER_MS", "0", int)  # 0 disables hedging
+    ai_rpm: int = _env("AI_RPM", "0", int)  # upstream requests/min per provider/model; 0 = unlimited
+    ai_tpm: int = _env("AI_TPM", "0", int)  # upstream tokens/min per provider/model; 0 = unlimited
+    ai_queue_max: int = _env("AI_QUEUE_MAX", "1000", int)
+    ai_queue_max_wait_s: float = _env("AI_QUEUE_MAX_WAIT_S", "30", float)
+    # auto (tiktoken when its vocabulary loads, else an offline estimate) | tiktoken | estimate
+    tokenizer: str = _env("TOKENIZER", "auto")
+    tokenizer_encoding: str = _env("TOKENIZER_ENCODING", "o200k_base")
+    tokenizer_cache_entries: int = _env("TOKENIZER_CACHE_ENTRIES", "4096", int)
+    # Prompts over this many tokens are truncated before the call; 0 disables
+    ai_max_input_tokens: int = _env("AI_MAX_INPUT_TOKENS", "8000", int)
+    # Unix socket of the shared-state sidecar; set by app.serve for its workers
+    shared_state_address: str = _env("SHARED_STATE_ADDRESS", "")
+    shared_state_authkey: str = _env("SHARED_STATE_AUTHKEY", "")
+    # Adaptive per-route concurrency limits; excess requests get 503 + Retry-After
+    admission_control: bool = _env("ADMISSION_CONTROL", "1", _flag)
+    admission_algorithm: str = _env("ADMISSION_ALGORITHM", "gradient")  # gradient | aimd | fixed
+    admission_initial_limit: int = _env("ADMISSION_INITIAL_LIMIT", "64", int)
+    admission_min_limit: int = _env("ADMISSION_MIN_LIMIT", "4", int)
+    admission_max_limit: int = _env("ADMISSION_MAX_LIMIT", "1000", int)
+    admission_max_queue: int = _env("ADMISSION_MAX_QUEUE", "256", int)  # waiting requests per route
+    admission_max_wait_s: float = _env("ADMISSION_MAX_WAIT_S", "5", float)
+    # aimd: a request slower than this counts as a drop; matches AI_ATTEMPT_TIMEOUT_S
+    # so normal LLM latency never shrinks the limit
+    admission_aimd_timeout_s: float = _env("ADMISSION_AIMD_TIMEOUT_S", "30", float)
+    admission_exempt: str = _env("ADMISSION_EXEMPT", "/,/health,/metrics,/metrics/admission")  # route templates
+    trace_sample_rate: float = _env("TRACE_SAMPLE_RATE", "0", float)  # 0..1
+    # none | jsonl:<path> | otlp:<collector url>
+    trace_export: str = _env("TRACE_EXPORT", "none")
+    cache_backend: str = _env("CACHE_BACKEND", "memory")  # memory | sqlite | shared | none
+    cache_ttl_s: float = _env("CACHE_TTL_S", "300", float)
+    cache_max_entries: int = _env("CACHE_MAX_ENTRIES", "1024", int)
+    cache_path: str = _env("CACHE_PATH", "ai_cache.db")  # sqlite backend only
+    batch_concurrency: int = _env("BATCH_CONCURRENCY", "8", int)  # default fan-out per batch
+    batch_max_concurrency: int = _env("BATCH_MAX_CONCURRENCY", "64", int)
+    semantic_cache: bool = _env("SEMANTIC_CACHE", "0", _flag)  # requires numpy
+    semantic_cache_threshold: float = _env("SEMANTIC_CACHE_THRESHOLD", "0.9", float)
+    semantic_cache_index: str = _env("SEMANTIC_CACHE_INDEX", "flat")  # flat | ivf
+    semantic_cache_max_entries: int = _env("SEMANTIC_CACHE_MAX_ENTRIES", "100000", int)
+    # "hashing" or a sentence-transformers model name, e.g. all-MiniLM-L6-v2
+    semantic_cache_embedder: str = _env("SEMANTIC_CACHE_EMBEDDER", "hashing")
+
+
+# Keys that the last SETTINGS_FILE read put into os.environ
+_file_keys: set = set()
+
 
+def _apply_settings_file() -> None:
+    """Copy KEY=VALUE lines from $SETTINGS_FILE into the environment.
 
+    The process environment cannot change after start-up, so this file is what
+    a reload re-reads. Keys deleted from the file since the last read are
+    dropped again; blank lines and # comments are ignored.
+    """
+    path = os.getenv("SETTINGS_FILE", "")
+    if not path:
+        return
+    values = {}
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            values[key.strip()] = value.strip().strip("'\"")
+    for key in _file_keys - values.keys():
+        os.environ.pop(key, None)
+    os.environ.update(values)
+    _file_keys.clear()
+    _file_keys.update(values)
+
+
+_apply_settings_file()
 settings = Settings()
+
+
+def get_settings() -> Settings:
+    """Return the current settings snapshot."""
+    return settings
+
+
+def reload_settings() -> Settings:
+    """Re-read SETTINGS_FILE and the environment and swap in a new snapshot.
+
+    Consumers that call get_settings() (e.g. the provider registry) pick up the
+    new values on their next call. A running server reloads on SIGHUP (see
+    app.main), so edit SETTINGS_FILE and signal the process to apply changes.
+    """
+    global settings
+    _apply_settings_file()
+    settings = Settings()
+    return settings
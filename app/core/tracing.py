@@ -0,0 +1,264 @@
+"""Lightweight request tracing keyed on the middleware request_id.
+
+Spans are only recorded for sampled requests (TRACE_SAMPLE_RATE); for the
+rest span() costs one context-variable lookup. Finished spans are buffered
+and exported by a background thread as JSON lines or OTLP/HTTP JSON.
+
+Run a local OTLP collector stand-in that appends received spans to a file:
+    python -m app.core.tracing --port 4318 --out spans.jsonl
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.settings import get_settings
+
+logger = logging.getLogger("tracing")
+
+_HEX32 = re.compile(r"^[0-9a-f]{32}$")
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start_ns: int
+    end_ns: int = 0
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+@dataclass
+class _Trace:
+    trace_id: str
+    request_id: str
+
+
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("span", default=None)
+
+
+def _trace_id(request_id: str) -> str:
+    """OTLP needs 32 hex chars; uuid4().hex ids pass through, others are hashed."""
+    rid = request_id.lower()
+    return rid if _HEX32.match(rid) else hashlib.md5(request_id.encode("utf-8")).hexdigest()
+
+
+class SpanExporter:
+    """Buffers finished spans and writes them from a background thread."""
+
+    def __init__(self, target: str, max_buffer: int = 10000, flush_interval_s: float = 1.0) -> None:
+        self.target = target
+        self.max_buffer = max_buffer
+        self.flush_interval_s = flush_interval_s
+        self.dropped = 0
+        self._buffer: "deque[Span]" = deque()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append(span)
+
+    def _take(self) -> List[Span]:
+        spans = []
+        while self._buffer:
+            spans.append(self._buffer.popleft())
+        return spans
+
+    def _write(self, spans: List[Span]) -> None:
+        kind, _, dest = self.target.partition(":")
+        if kind == "jsonl":
+            with open(dest or "spans.jsonl", "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(asdict(s), ensure_ascii=False) + "\n" for s in spans))
+        elif kind == "otlp":
+            import urllib.request  # only the OTLP exporter needs it (pulls in http.client, ssl)
+
+            body = json.dumps(to_otlp(spans)).encode("utf-8")
+            req = urllib.request.Request(
+                dest or "http://127.0.0.1:4318/v1/traces",
+                data=body,
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(req, timeout=5).close()
+
+    def _flush(self) -> None:
+        spans = self._take()
+        if not spans:
+            return
+        try:
+            self._write(spans)
+        except Exception:
+            self.dropped += len(spans)
+            logger.exception("trace.export_failed", extra={"extra": {"spans": len(spans)}})
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval_s):
+            self._flush()
+        self._flush()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+
+def to_otlp(spans: List[Span]) -> Dict[str, Any]:
+    """OTLP/HTTP JSON payload for a batch of spans."""
+
+    def attr(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [attr("service.name", "ai-application-engineer-journey")]},
+            "scopeSpans": [{
+                "scope": {"name": "app.core.tracing"},
+                "spans": [
+                    {
+                        "traceId": s.trace_id,
+                        "spanId": s.span_id,
+                        **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                        "name": s.name,
+                        "kind": 2 if s.parent_id is None else 1,  # SERVER root, INTERNAL children
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": [attr(k, v) for k, v in s.attributes.items()],
+                        "status": {"code": 1 if s.status == "ok" else 2},
+                    }
+                    for s in spans
+                ],
+            }],
+        }]
+    }
+
+
+_exporter: Optional[SpanExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def _get_exporter() -> Optional[SpanExporter]:
+    global _exporter
+    target = get_settings().trace_export
+    if not target or target == "none":
+        return None
+    if _exporter is None or _exporter.target != target:
+        with _exporter_lock:
+            if _exporter is None or _exporter.target != target:
+                if _exporter is not None:
+                    _exporter.close()
+                _exporter = SpanExporter(target)
+    return _exporter
+
+
+def shutdown_tracing() -> None:
+    global _exporter
+    with _exporter_lock:
+        exporter, _exporter = _exporter, None
+    if exporter is not None:
+        exporter.close()
+
+
+def start_trace(request_id: str) -> bool:
+    """Make the sampling decision for a request; returns True if sampled."""
+    cfg = get_settings()
+    if cfg.trace_sample_rate <= 0 or random.random() >= cfg.trace_sample_rate:
+        _current_trace.set(None)
+        return False
+    _current_trace.set(_Trace(trace_id=_trace_id(request_id), request_id=request_id))
+    _current_span.set(None)
+    return True
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Record a child span of the current one, if the request is sampled."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent_id = _current_span.get()
+    s = Span(
+        trace_id=trace.trace_id,
+        span_id=os.urandom(8).hex(),
+        parent_id=parent_id,
+        name=name,
+        start_ns=time.time_ns(),
+        attributes={"request_id": trace.request_id, **attributes},
+    )
+    token = _current_span.set(s.span_id)
+    try:
+        yield s
+    except BaseException as exc:
+        s.status = "error"
+        s.attributes["error"] = type(exc).__name__
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span.reset(token)
+        exporter = _get_exporter()
+        if exporter is not None:
+            exporter.export(s)
+
+
+def _serve_collector(port: int, out: str) -> None:
+    """Minimal OTLP/HTTP JSON receiver: one JSON line per received span."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            with open(out, "a", encoding="utf-8") as f:
+                for rs in payload.get("resourceSpans", []):
+                    for ss in rs.get("scopeSpans", []):
+                        for s in ss.get("spans", []):
+                            f.write(json.dumps(s) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    print(f"collector listening on http://127.0.0.1:{port}/v1/traces -> {out}")
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local OTLP collector stand-in")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--out", default="spans.jsonl")
+    args = parser.parse_args()
+    _serve_collector(args.port, args.out)
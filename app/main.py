@@ -1,18 +1,97 @@
-from fastapi import FastAPI
+import asyncio
+import contextlib
+import logging
+import signal
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
 from app.core.logging import setup_logging
-from app.core.middleware import request_logging_middleware
+from app.core.middleware import AdmissionControlMiddleware, request_logging_middleware
+from app.core.settings import reload_settings
+from app.core.tracing import shutdown_tracing
 from app.api.ai import router as ai_router
+from app.api.health import router as health_router
+from app.api.metrics import router as metrics_router
+from app.services.ai.cache import close_cache
+from app.services.ai.prompts import PromptError
+from app.services.ai.providers import provider_registry
+from app.services.ai.ratelimit import RateLimitExceeded
+from app.services.ai.resilience import ProviderUnavailableError
+from app.services.ai.tokenizer import get_tokenizer
 
 setup_logging(level="INFO")
 
-app = FastAPI(title="AI Application Engineer Journey")
+logger = logging.getLogger("app")
+
+
+def _reload() -> None:
+    """SIGHUP: re-read SETTINGS_FILE and switch to the provider it configures."""
+    try:
+        cfg = reload_settings()
+        # Build the new provider now; the old one is closed once its calls finish
+        provider_registry.get(cfg)
+    except Exception:
+        logger.exception("settings.reload_failed")
+        return
+    logger.info("settings.reloaded")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Build the configured provider and tokenizer up front so the first
+    # request does not pay for SDK import, client setup or vocabulary loading.
+    try:
+        provider_registry.get()
+        get_tokenizer()
+    except RuntimeError:
+        logger.exception("ai.provider.warmup_failed")
+    loop = asyncio.get_running_loop()
+    # Not available on Windows or when the app is not served from the main thread
+    with contextlib.suppress(AttributeError, NotImplementedError, RuntimeError, ValueError):
+        loop.add_signal_handler(signal.SIGHUP, _reload)
+    yield
+    with contextlib.suppress(AttributeError, NotImplementedError, RuntimeError, ValueError):
+        loop.remove_signal_handler(signal.SIGHUP)
+    await provider_registry.aclose_all()
+    close_cache()
+    shutdown_tracing()
+
+
+app = FastAPI(title="AI Application Engineer Journey", lifespan=lifespan)
 
-# middleware
+# middleware; the last one added runs first, so shed requests are still logged
+app.add_middleware(AdmissionControlMiddleware)
 app.middleware("http")(request_logging_middleware)
 
+@app.exception_handler(ProviderUnavailableError)
+async def provider_unavailable_handler(_: Request, exc: ProviderUnavailableError) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, int(exc.retry_after_s)))},
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limited_handler(_: Request, exc: RateLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, int(exc.retry_after_s)))},
+    )
+
+
+@app.exception_handler(PromptError)
+async def prompt_error_handler(_: Request, exc: PromptError) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
 # routers
+app.include_router(health_router)
 app.include_router(ai_router)
+app.include_router(metrics_router)
 
 
 @app.get("/")
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
 class ChatRequest(BaseModel):
     prompt: str = Field(min_length=1)
+    template_version: Optional[int] = Field(default=None, ge=1)
 
 
 class ChatResponse(BaseModel):
@@ -13,12 +14,35 @@ class ChatResponse(BaseModel):
     provider: str
     latency_ms: int
     tokens_est: int
+    cached: bool = False
     answer: str
 
 
+class BatchChatRequest(BaseModel):
+    items: List[ChatRequest] = Field(min_length=1, max_length=1000)
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    ordered: bool = True
+
+
+class BatchChatItem(BaseModel):
+    index: int
+    ok: bool
+    latency_ms: int
+    result: Optional[ChatResponse] = None
+    error: Optional[str] = None
+
+
+class BatchChatResponse(BaseModel):
+    latency_ms: int
+    succeeded: int
+    failed: int
+    items: List[BatchChatItem]
+
+
 class ExplainRequest(BaseModel):
     topic: str = Field(min_length=1)
     context: Optional[str] = None
+    template_version: Optional[int] = Field(default=None, ge=1)
 
 
 class ExplainResponse(BaseModel):
@@ -26,6 +50,59 @@ class ExplainResponse(BaseModel):
     provider: str
     latency_ms: int
     tokens_est: int
+    cached: bool = False
+    structured: bool = False  # False when the model did not return the requested JSON
     explanation: str
     risks: List[str]
     next_steps: List[str]
+
+
+class TokenCountRequest(BaseModel):
+    texts: List[str] = Field(min_length=1, max_length=1000)
+
+
+class TokenCountResponse(BaseModel):
+    tokenizer: str
+    counts: List[int]
+    total: int
+
+
+class CacheStatsResponse(BaseModel):
+    backend: str
+    hits: int
+    misses: int
+    sets: int
+    evictions: int
+    expirations: int
+    size: int
+
+
+class SingleFlightStatsResponse(BaseModel):
+    calls: int
+    collapsed: int
+    inflight: int
+
+
+class RateLimitLaneStats(BaseModel):
+    admitted: int
+    queued: int
+    rejected: int
+    wait_ms_total: float
+    wait_ms_max: float
+
+
+class RateLimitStatsResponse(BaseModel):
+    key: str
+    queue_depth: int
+    lanes: Dict[str, RateLimitLaneStats]
+
+
+class RouterBackendStats(BaseModel):
+    label: str
+    provider: str
+    ewma_latency_ms: float
+    error_rate: float
+    inflight: int
+    calls: int
+    failures: int
+    available: bool
@@ -0,0 +1,258 @@
+"""Pre-fork multi-worker launcher for app.main:app.
+
+The app is imported once in the parent and the workers are fork()ed from
+it, so they start without re-importing anything and share the loaded code
+pages copy-on-write. All workers accept on one listening socket. Unless
+--no-shared-state is given, a sidecar process holds the response cache
+and the upstream rate-limit buckets for all workers (see
+app.services.ai.shared): adding cores does not multiply upstream calls or
+split the rate limit N ways.
+
+Usage:
+    python -m app.serve --workers 4 --host 0.0.0.0 --port 8000
+    python -m app.serve --profile-startup   # per-module import cost of app.main
+    SETTINGS_FILE=app.env python -m app.serve ...
+    kill -HUP <parent pid>   # workers re-read app.env and swap providers
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import importlib
+import logging
+import os
+import secrets
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+logger = logging.getLogger("app")
+
+# A worker that dies sooner than this after starting is crash-looping;
+# back off before replacing it
+MIN_WORKER_UPTIME_S = 5.0
+
+
+def _bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _preload_lazy_imports() -> List[str]:
+    """Import the lazily loaded modules this configuration will use.
+
+    Done in the parent so the workers inherit them instead of each paying
+    for the import on first use.
+    """
+    from app.core.settings import get_settings
+
+    cfg = get_settings()
+    names = []
+    if cfg.ai_provider == "openai" or "openai" in cfg.ai_backends:
+        names += ["httpx", "openai"]
+    if cfg.ai_backends:
+        names.append("app.services.ai.router")
+    if cfg.cache_backend == "sqlite":
+        names.append("sqlite3")
+    if cfg.semantic_cache:
+        names.append("numpy")
+    if cfg.trace_export.startswith("otlp"):
+        names.append("urllib.request")
+    loaded = []
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue  # the worker reports it when it builds the provider
+        loaded.append(name)
+    return loaded
+
+
+def _run_worker(app, sock: socket.socket, args: argparse.Namespace) -> None:
+    """Body of a forked worker; never returns."""
+    import uvicorn
+
+    from app.core.logging import setup_logging, shutdown_logging
+
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    # Ignored until the app's lifespan installs its reload handler
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # The parent's log writer thread does not survive fork(); start our own
+    setup_logging(level=args.log_level)
+    code = 0
+    try:
+        config = uvicorn.Config(
+            app,
+            # uvicorn's dictConfig would close the handlers set up above; let
+            # its loggers propagate to our JSON handler instead
+            log_config=None,
+            log_level=args.log_level.lower(),
+            access_log=False,  # request_logging_middleware already logs every request
+            timeout_graceful_shutdown=args.graceful_timeout,
+        )
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException:
+        logger.exception("serve.worker_failed")
+        code = 1
+    finally:
+        shutdown_logging()
+        os._exit(code)
+
+
+class Arbiter:
+    """Forks the workers, replaces the ones that die and stops them on SIGTERM/SIGINT.
+
+    SIGHUP is passed on to the workers, which reload their settings from
+    SETTINGS_FILE without dropping connections.
+    """
+
+    def __init__(self, app, sock: socket.socket, args: argparse.Namespace) -> None:
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers: Dict[int, float] = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(self.app, self.sock, self.args)
+        self.workers[pid] = time.monotonic()
+        logger.info("serve.worker_started", extra={"extra": {"pid": pid}})
+
+    def _stop(self, signum: int, _frame) -> None:
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _reload(self, signum: int, _frame) -> None:
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._reload)
+        for _ in range(self.args.workers):
+            self.spawn()
+        while self.workers:
+            # Poll our own pids rather than os.wait(), which would also reap
+            # the sidecar behind multiprocessing's back
+            time.sleep(0.2)
+            for pid, started in list(self.workers.items()):
+                try:
+                    done, status = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done, status = pid, 0
+                if not done:
+                    continue
+                del self.workers[pid]
+                if self.stopping:
+                    continue
+                logger.warning(
+                    "serve.worker_exited",
+                    extra={"extra": {"pid": pid, "exit_code": os.waitstatus_to_exitcode(status)}},
+                )
+                if time.monotonic() - started < MIN_WORKER_UPTIME_S:
+                    time.sleep(1.0)
+                if not self.stopping:
+                    self.spawn()
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Pre-fork multi-worker server for app.main:app")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds to drain on shutdown")
+    parser.add_argument(
+        "--no-shared-state", action="store_true",
+        help="keep caches and rate limits per worker instead of starting the sidecar",
+    )
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="report the per-module import cost of app.main in a fresh interpreter and exit",
+    )
+    parser.add_argument("--profile-top", type=int, default=20, help="rows per section of the startup report")
+    args = parser.parse_args(argv)
+
+    if args.profile_startup:
+        from app.core.importtime import profile_imports
+
+        print(profile_imports("app.main").report(top=args.profile_top))
+        return
+
+    if not hasattr(os, "fork"):
+        sys.exit("app.serve needs fork(); use uvicorn --workers on this platform")
+
+    manager = None
+    socket_dir = None
+    if not args.no_shared_state:
+        from app.services.ai.shared import start_sidecar
+
+        # Settings are read at import, so configure the workers before the app loads
+        socket_dir = tempfile.mkdtemp(prefix="ai-serve-")
+        address = os.path.join(socket_dir, "state.sock")
+        authkey = secrets.token_hex(16)
+        os.environ["SHARED_STATE_ADDRESS"] = address
+        os.environ["SHARED_STATE_AUTHKEY"] = authkey
+        if os.environ.get("CACHE_BACKEND", "memory").lower() == "memory":
+            os.environ["CACHE_BACKEND"] = "shared"
+        from app.core.settings import reload_settings
+
+        cfg = reload_settings()
+        manager = start_sidecar(address, authkey.encode(), cfg.cache_max_entries, cfg.cache_ttl_s)
+
+    from app.core.logging import setup_logging, shutdown_logging
+    from app.main import app  # preload: workers inherit the imported app
+
+    # No threads may be running across fork(), so the parent logs synchronously
+    setup_logging(level=args.log_level, async_writer=False)
+    preloaded = _preload_lazy_imports()
+    sock = _bind(args.host, args.port, args.backlog)
+    logger.info(
+        "serve.started",
+        extra={"extra": {
+            "workers": args.workers,
+            "address": f"{args.host}:{args.port}",
+            "shared_state": manager is not None,
+            "preloaded": preloaded,
+        }},
+    )
+
+    # Keep the collector from touching (and so un-sharing) the preloaded
+    # objects in every worker
+    gc.collect()
+    gc.freeze()
+    try:
+        Arbiter(app, sock, args).run()
+    finally:
+        sock.close()
+        shutdown_logging()
+        if manager is not None:
+            manager.shutdown()
+        if socket_dir is not None:
+            shutil.rmtree(socket_dir, ignore_errors=True)
+        logging.getLogger("app").info("serve.stopped")
+
+
+if __name__ == "__main__":
+    main()
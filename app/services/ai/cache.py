@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional, Protocol, Tuple
+
+from app.core.settings import Settings, get_settings
+from app.services.ai.providers import GenResult
+
+logger = logging.getLogger("ai")
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share a cache entry."""
+    return " ".join(text.split())
+
+
+def cache_key(provider: str, model: str, system: str, user_prompt: str) -> str:
+    raw = json.dumps(
+        [provider, model, system, normalize_prompt(user_prompt)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    size: int = 0
+
+
+class ResponseCache(Protocol):
+    backend: str
+    # True when get/set do I/O; the async service then calls them off the event loop
+    blocking: bool
+
+    def get(self, key: str) -> Optional[GenResult]: ...
+
+    def set(self, key: str, result: GenResult) -> None: ...
+
+    def stats(self) -> CacheStats: ...
+
+    def close(self) -> None: ...
+
+
+class NullCache:
+    backend = "none"
+    blocking = False
+
+    def __init__(self) -> None:
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> Optional[GenResult]:
+        self._stats.misses += 1
+        return None
+
+    def set(self, key: str, result: GenResult) -> None:
+        pass
+
+    def stats(self) -> CacheStats:
+        return CacheStats(**asdict(self._stats))
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL."""
+
+    backend = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 300.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[float, GenResult]]" = OrderedDict()
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> Optional[GenResult]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            expires_at, result = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats.hits += 1
+            return result
+
+    def set(self, key: str, result: GenResult) -> None:
+        expires_at = time.monotonic() + self.ttl_s
+        with self._lock:
+            self._data[key] = (expires_at, result)
+            self._data.move_to_end(key)
+            self._stats.sets += 1
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats.evictions += 1
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            stats = CacheStats(**asdict(self._stats))
+            stats.size = len(self._data)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """On-disk cache that survives restarts; LRU by last access time.
+
+    The row count is tracked in memory as an upper bound (replacing a key
+    counts as an insert) and only re-counted when it passes max_entries.
+    Evictions then remove an extra `evict_slack` rows, so the COUNT(*) and
+    the DELETE run once per that many writes rather than on every set.
+    """
+
+    backend = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl_s: float = 86400.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        import sqlite3  # imported lazily; the default backend is in memory
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY,"
+            " provider TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " tokens_est INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_response_cache_accessed_at"
+            " ON response_cache (accessed_at)"
+        )
+        self._stats = CacheStats()
+        self.evict_slack = max(1, max_entries // 20)
+        (self._size,) = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()
+
+    def get(self, key: str) -> Optional[GenResult]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT provider, text, tokens_est, expires_at FROM response_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self._stats.misses += 1
+                return None
+            provider, text, tokens_est, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self._size -= 1
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._stats.hits += 1
+        return GenResult(provider=provider, text=text, tokens_est=tokens_est)
+
+    def set(self, key: str, result: GenResult) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache"
+                " (key, provider, text, tokens_est, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, result.provider, result.text, result.tokens_est, now + self.ttl_s, now),
+            )
+            self._stats.sets += 1
+            self._size += 1
+            if self._size > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Re-count: the estimate over-counts replaced keys, and other
+        # processes may share the file
+        (self._size,) = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()
+        overflow = self._size - self.max_entries
+        if overflow <= 0:
+            return
+        deleted = self._conn.execute(
+            "DELETE FROM response_cache WHERE key IN ("
+            " SELECT key FROM response_cache ORDER BY accessed_at LIMIT ?)",
+            (min(self._size, overflow + self.evict_slack),),
+        ).rowcount
+        self._size -= deleted
+        self._stats.evictions += deleted
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            stats = CacheStats(**asdict(self._stats))
+            (stats.size,) = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+async def cache_aget(cache: ResponseCache, key: str) -> Optional[GenResult]:
+    """cache.get() from async code, in a worker thread if the backend does I/O."""
+    if cache.blocking:
+        return await asyncio.to_thread(cache.get, key)
+    return cache.get(key)
+
+
+async def cache_aset(cache: ResponseCache, key: str, result: GenResult) -> None:
+    """cache.set() from async code, in a worker thread if the backend does I/O."""
+    if cache.blocking:
+        await asyncio.to_thread(cache.set, key, result)
+    else:
+        cache.set(key, result)
+
+
+def build_cache(cfg: Settings) -> ResponseCache:
+    backend = cfg.cache_backend.lower()
+    if backend == "memory":
+        return MemoryCache(max_entries=cfg.cache_max_entries, ttl_s=cfg.cache_ttl_s)
+    if backend == "sqlite":
+        return SQLiteCache(cfg.cache_path, max_entries=cfg.cache_max_entries, ttl_s=cfg.cache_ttl_s)
+    if backend == "shared":
+        from app.services.ai.shared import SharedCache  # imports this module
+
+        return SharedCache()
+    return NullCache()
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """Return the process-wide response cache, building it on first use."""
+    global _cache
+    cache = _cache
+    if cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = build_cache(get_settings())
+                logger.info("ai.cache.created", extra={"extra": {"backend": _cache.backend}})
+            cache = _cache
+    return cache
+
+
+def close_cache() -> None:
+    global _cache
+    with _cache_lock:
+        cache, _cache = _cache, None
+    if cache is not None:
+        cache.close()
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# (field, index, value): index is None for a completed top-level field and
+# the position for an item completed inside a top-level array
+FieldEvent = Tuple[str, Optional[int], Any]
+
+
+class JSONObjectStream:
+    """Parses one top-level JSON object incrementally from text chunks.
+
+    feed() scans only the new text and reports each top-level field as soon
+    as its value is complete, plus each item of top-level arrays as it
+    completes, so callers can act on a structured answer while the model is
+    still writing it. Only the substring of each completed scalar value is
+    decoded; there is no second pass over the whole text at the end.
+
+    Model output is often wrapped in prose or a ```json fence, so anything
+    before the first "{" is skipped. A value that does not decode is recorded
+    in `errors` and skipped instead of failing the whole object.
+    """
+
+    def __init__(self) -> None:
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_start = -1
+        self._key_end = -1
+        self._key: Optional[str] = None
+        self._value_start = -1
+        self._item_start = -1  # inside a top-level array value
+        self._items: Optional[List[Any]] = None
+        self.started = False
+        self.done = False
+        self.fields: Dict[str, Any] = {}
+        self.errors: List[str] = []
+
+    def _decode(self, raw: str, label: str) -> Tuple[bool, Any]:
+        try:
+            return True, json.loads(raw)
+        except ValueError:
+            self.errors.append(label)
+            return False, None
+
+    def _finish_item(self, end: int, events: List[FieldEvent]) -> None:
+        raw = self._text[self._item_start:end].strip()
+        if raw and self._items is not None and self._key is not None:
+            ok, value = self._decode(raw, f"{self._key}[{len(self._items)}]")
+            if ok:
+                events.append((self._key, len(self._items), value))
+                self._items.append(value)
+
+    def _finish_value(self, end: int, events: List[FieldEvent]) -> None:
+        if self._key is None or self._value_start < 0:
+            return
+        if self._items is not None:
+            value: Any = self._items
+            ok = True
+        else:
+            raw = self._text[self._value_start:end].strip()
+            ok, value = self._decode(raw, self._key) if raw else (False, None)
+        if ok:
+            self.fields[self._key] = value
+            events.append((self._key, None, value))
+        self._key = None
+        self._value_start = -1
+        self._items = None
+
+    def feed(self, chunk: str) -> List[FieldEvent]:
+        """Consume more text; return the fields and array items it completed."""
+        events: List[FieldEvent] = []
+        if self.done:
+            return events
+        text = self._text = self._text + chunk
+        pos = self._pos
+        end = len(text)
+        while pos < end:
+            c = text[pos]
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                    self._depth = 1
+                    self._expect_key = True
+                pos += 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key and self._key_start >= 0:
+                        self._key_end = pos + 1
+                else:
+                    # Jump to the next quote or backslash in one step
+                    q = text.find('"', pos)
+                    b = text.find("\\", pos)
+                    nxt = min(i for i in (q, b, end) if i >= 0)
+                    pos = nxt
+                    continue
+                pos += 1
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = pos
+            elif c in "{[":
+                if self._depth == 1 and c == "[" and self._value_start >= 0 and not text[self._value_start:pos].strip():
+                    self._items = []
+                    self._item_start = pos + 1
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 2 and c == "]" and self._items is not None:
+                    self._finish_item(pos, events)
+                    self._item_start = -1
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(pos, events)
+                    self.done = True
+                    pos += 1
+                    break
+            elif c == ",":
+                if self._depth == 1:
+                    self._finish_value(pos, events)
+                    self._expect_key = True
+                elif self._depth == 2 and self._items is not None:
+                    self._finish_item(pos, events)
+                    self._item_start = pos + 1
+            elif c == ":" and self._depth == 1 and self._expect_key:
+                ok, key = self._decode(text[self._key_start:self._key_end], "<key>")
+                self._key = key if ok and isinstance(key, str) else None
+                self._expect_key = False
+                self._key_start = self._key_end = -1
+                self._value_start = pos + 1
+            pos += 1
+        self._pos = pos
+        self._compact()
+        return events
+
+    def _compact(self) -> None:
+        """Drop text that no pending key, value or item can refer to any more."""
+        marks = [i for i in (self._key_start, self._value_start, self._item_start) if i >= 0]
+        keep = min(marks) if marks else self._pos
+        if keep <= 0:
+            return
+        self._text = self._text[keep:]
+        self._pos -= keep
+        if self._key_start >= 0:
+            self._key_start -= keep
+        if self._key_end >= 0:
+            self._key_end -= keep
+        if self._value_start >= 0:
+            self._value_start -= keep
+        if self._item_start >= 0:
+            self._item_start -= keep
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Completed fields plus the items so far of an array still being written."""
+        fields = dict(self.fields)
+        if self._key is not None and self._items is not None:
+            fields[self._key] = list(self._items)
+        return fields
@@ -1,24 +1,170 @@
+from __future__ import annotations
+
+import keyword
+import string
+import threading
 from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class PromptError(ValueError):
+    """A template failed validation, or a lookup asked for an unknown name or version."""
+
 
 @dataclass(frozen=True)
 class PromptTemplate:
+    """A versioned prompt: a static system prefix plus a parameterized user template.
+
+    `params`, when given, must name exactly the fields used in `template`; it
+    turns a typo in either into a load-time error instead of a failure on
+    the first request.
+    """
+
     name: str
     template: str
+    system: str = ""
+    version: int = 1
+    params: Tuple[str, ...] = ()
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+
+class CompiledPrompt:
+    """A template parsed once and compiled to a plain render function.
+
+    Like collections.namedtuple, the template is turned into source for a
+    function with one keyword-only argument per field that joins the
+    literal segments and the values in a single call. render(**params) is
+    that function, so it never re-parses the template and a missing or
+    unknown parameter is a TypeError, as it would be for any function call.
+    The system prefix has no parameters and is kept as a ready-made string.
+    """
+
+    __slots__ = ("template", "params", "system", "segments", "render")
+
+    def __init__(self, template: PromptTemplate) -> None:
+        self.template = template
+        self.system = template.system
+        self.segments = _merge(_parse(template.template, template.key))
+        self.params = frozenset(field_name for _, field_name in self.segments if field_name is not None)
+
+        if _fields(template.system, template.key):
+            raise PromptError(f"{template.key}: the system prefix cannot take parameters")
+        if template.params and set(template.params) != self.params:
+            raise PromptError(
+                f"{template.key}: declared params {sorted(template.params)} "
+                f"do not match template fields {sorted(self.params)}"
+            )
+        self.render: Callable[..., str] = _compile(self.segments, self.params)
+
+    @property
+    def key(self) -> str:
+        return self.template.key
+
+
+def _parse(text: str, key: str) -> List[Tuple[str, Optional[str]]]:
+    """(literal, field) pairs; only plain named fields are allowed."""
+    segments = []
+    try:
+        parsed = list(string.Formatter().parse(text))
+    except ValueError as exc:
+        raise PromptError(f"{key}: {exc}") from exc
+    for literal, field_name, format_spec, conversion in parsed:
+        if field_name is not None:
+            if not field_name.isidentifier() or keyword.iskeyword(field_name):
+                raise PromptError(f"{key}: field {{{field_name}}} must be a plain name")
+            if format_spec or conversion:
+                raise PromptError(f"{key}: field {{{field_name}}} cannot use a conversion or format spec")
+        segments.append((literal, field_name))
+    return segments
+
+
+def _fields(text: str, key: str) -> List[str]:
+    return [field_name for _, field_name in _parse(text, key) if field_name is not None]
+
+
+def _merge(segments: List[Tuple[str, Optional[str]]]) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """Fold literal-only segments (escaped braces split literals) into their neighbours."""
+    merged: List[Tuple[str, Optional[str]]] = []
+    for literal, field_name in segments:
+        if merged and merged[-1][1] is None:
+            literal = merged.pop()[0] + literal
+        if literal or field_name is not None:
+            merged.append((literal, field_name))
+    return tuple(merged)
+
+
+def _compile(segments: Tuple[Tuple[str, Optional[str]], ...], params: frozenset) -> Callable[..., str]:
+    """Build `def render(*, a, b): return "".join(("lit", a, "lit", b))` for the segments."""
+    items: List[str] = []
+    for literal, field_name in segments:
+        if literal:
+            items.append(repr(literal))
+        if field_name is not None:
+            items.append(field_name)
+    signature = f"*, {', '.join(sorted(params))}" if params else ""
+    body = f"''.join(({', '.join(items)},))" if items else "''"
+    source = f"def render({signature}):\n    return {body}\n"
+    namespace: Dict[str, Any] = {}
+    exec(source, namespace)  # inputs are repr()'d literals and validated identifiers only
+    return namespace["render"]
+
+
+class PromptRegistry:
+    """Compiled templates by name and version.
+
+    Templates are validated and compiled when registered, so a broken
+    template fails at import time. get() without a version returns the
+    latest one registered under that name.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, Dict[int, CompiledPrompt]] = {}
+        self._latest: Dict[str, CompiledPrompt] = {}
+
+    def register(self, template: PromptTemplate) -> CompiledPrompt:
+        compiled = CompiledPrompt(template)
+        with self._lock:
+            versions = self._prompts.setdefault(template.name, {})
+            if template.version in versions:
+                raise PromptError(f"{template.key} is already registered")
+            versions[template.version] = compiled
+            self._latest[template.name] = versions[max(versions)]
+        return compiled
+
+    def get(self, name: str, version: Optional[int] = None) -> CompiledPrompt:
+        if version is None:
+            compiled = self._latest.get(name)
+        else:
+            compiled = self._prompts.get(name, {}).get(version)
+        if compiled is None:
+            raise PromptError(f"unknown prompt template {name}@v{version or 'latest'}")
+        return compiled
+
+    def versions(self, name: str) -> List[int]:
+        return sorted(self._prompts.get(name, {}))
+
 
 CHAT_V1 = PromptTemplate(
-    name="chat_v1",
+    name="chat",
+    version=1,
+    system="You are a helpful assistant.",
     template=(
-        "You are a helpful assistant.\n"
         "User prompt:\n"
         "{prompt}\n"
         "Return a concise answer."
     ),
+    params=("prompt",),
 )
 
 EXPLAIN_V1 = PromptTemplate(
-    name="explain_v1",
+    name="explain",
+    version=1,
+    system="You are an AI application engineer.",
     template=(
-        "You are an AI application engineer.\n"
         "Task: Explain the topic clearly for a developer.\n"
         "Topic: {topic}\n"
         "Context: {context}\n"
@@ -28,8 +174,24 @@ EXPLAIN_V1 = PromptTemplate(
         "- risks: array of strings (<=5)\n"
         "- next_steps: array of strings (<=5)\n"
     ),
+    params=("topic", "context"),
 )
 
+prompt_registry = PromptRegistry()
+prompt_registry.register(CHAT_V1)
+prompt_registry.register(EXPLAIN_V1)
+
+
+def get_prompt(name: str, version: Optional[int] = None) -> CompiledPrompt:
+    return prompt_registry.get(name, version)
+
 
 def render(template: PromptTemplate, **params: str) -> str:
-    return template.template.format(**params)    
\ No newline at end of file
+    """Render via the registry's compiled copy; unregistered templates are compiled ad hoc."""
+    try:
+        compiled = prompt_registry.get(template.name, template.version)
+    except PromptError:
+        compiled = None
+    if compiled is None or compiled.template != template:
+        compiled = CompiledPrompt(template)
+    return compiled.render(**params)
@@ -1,9 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Protocol
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Protocol, Tuple
 
-from app.core.settings import settings
+from app.core.settings import Settings, get_settings
+from app.services.ai.tokenizer import get_tokenizer
+
+logger = logging.getLogger("ai")
+
+# Output ceiling per call; also the worst-case completion size for budgeting
+MAX_OUTPUT_TOKENS = 256
 
 
 @dataclass
@@ -18,45 +31,189 @@ class AIProvider(Protocol):
 
     def generate(self, system: str, user_prompt: str) -> GenResult: ...
 
+    def close(self) -> None: ...
+
+
+class AsyncAIProvider(Protocol):
+    """Provider that can serve a call without holding a worker thread."""
+
+    name: str
+
+    async def agenerate(self, system: str, user_prompt: str) -> GenResult: ...
+
+    def generate_stream(self, system: str, user_prompt: str) -> AsyncIterator[str]:
+        """Yield text deltas as the upstream produces them."""
+        ...
+
+    async def aclose(self) -> None: ...
+
 
 class StubProvider:
     name = "stub"
+    text = (
+        "Vibe Coding means using rapid AI-assisted iteration to prototype, "
+        "refactor, and ship features with tight feedback loops."
+    )
+    # Returned when the prompt asks for JSON (e.g. the explain template)
+    json_text = (
+        '{"summary": "Vibe Coding means using rapid AI-assisted iteration to prototype, '
+        'refactor, and ship features with tight feedback loops.", '
+        '"risks": ["Model output may be inaccurate or incomplete.", '
+        '"Provided context may be insufficient for the intended task."], '
+        '"next_steps": ["Add retries/timeouts and basic rate limiting.", '
+        '"Add response caching for repeated prompts.", '
+        '"Add eval tests for regressions (golden prompts)."]}'
+    )
 
-    def generate(self, system: str, user_prompt: str) -> GenResult:
-        tokens_est = max(1, (len(system) + len(user_prompt)) // 4)
-        text = (
-            "Vibe Coding means using rapid AI-assisted iteration to prototype, "
-            "refactor, and ship features with tight feedback loops."
-        )
+    def __init__(self, delay_s: float = 0.0, chunk_delay_s: float = 0.0) -> None:
+        # Synthetic upstream latency, used to exercise concurrency offline
+        self.delay_s = delay_s
+        self.chunk_delay_s = chunk_delay_s
+
+    def _text_for(self, user_prompt: str) -> str:
+        return self.json_text if "Return JSON" in user_prompt else self.text
+
+    def _result(self, system: str, user_prompt: str) -> GenResult:
+        text = self._text_for(user_prompt)
+        tokenizer = get_tokenizer()
+        tokens_est = tokenizer.count_messages(system, user_prompt) + tokenizer.count(text)
         return GenResult(provider=self.name, text=text, tokens_est=tokens_est)
 
+    def _chunks(self, user_prompt: str) -> List[str]:
+        # Word-sized pieces, roughly what a real model streams per event
+        return re.findall(r"\S+\s*", self._text_for(user_prompt))
+
+    def generate(self, system: str, user_prompt: str) -> GenResult:
+        if self.delay_s > 0:
+            time.sleep(self.delay_s)
+        return self._result(system, user_prompt)
+
+    async def agenerate(self, system: str, user_prompt: str) -> GenResult:
+        if self.delay_s > 0:
+            await asyncio.sleep(self.delay_s)
+        return self._result(system, user_prompt)
+
+    async def generate_stream(self, system: str, user_prompt: str) -> AsyncIterator[str]:
+        if self.delay_s > 0:
+            await asyncio.sleep(self.delay_s)
+        for chunk in self._chunks(user_prompt):
+            if self.chunk_delay_s > 0:
+                await asyncio.sleep(self.chunk_delay_s)
+            yield chunk
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+
+class FaultyStubProvider(StubProvider):
+    """Stub that injects failures and hangs, for exercising resilience policies."""
+
+    def __init__(self, failure_rate: float = 0.0, hang_rate: float = 0.0, hang_s: float = 3600.0, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+
+    def _fault(self) -> str:
+        r = random.random()
+        if r < self.failure_rate:
+            return "fail"
+        if r < self.failure_rate + self.hang_rate:
+            return "hang"
+        return ""
+
+    def generate(self, system: str, user_prompt: str) -> GenResult:
+        fault = self._fault()
+        if fault == "fail":
+            raise ConnectionError("injected upstream failure")
+        if fault == "hang":
+            time.sleep(self.hang_s)
+        return super().generate(system, user_prompt)
+
+    async def agenerate(self, system: str, user_prompt: str) -> GenResult:
+        fault = self._fault()
+        if fault == "fail":
+            raise ConnectionError("injected upstream failure")
+        if fault == "hang":
+            await asyncio.sleep(self.hang_s)
+        return await super().agenerate(system, user_prompt)
+
+    async def generate_stream(self, system: str, user_prompt: str) -> AsyncIterator[str]:
+        fault = self._fault()
+        if fault == "fail":
+            raise ConnectionError("injected upstream failure")
+        if fault == "hang":
+            await asyncio.sleep(self.hang_s)
+        async for chunk in super().generate_stream(system, user_prompt):
+            yield chunk
+
 
 class OpenAIProvider:
     name = "openai"
 
-    def __init__(self) -> None:
-        if not settings.openai_api_key:
+    def __init__(self, cfg: Settings) -> None:
+        if not cfg.openai_api_key:
             raise RuntimeError("OPENAI_API_KEY is not set")
 
         # Official OpenAI SDK client
-        from openai import OpenAI  # imported lazily to avoid import cost when using stub
+        import httpx
+        # imported lazily to avoid import cost when using stub
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 
-        self._client = OpenAI(api_key=settings.openai_api_key)
+        self.model = cfg.openai_model
+        limits = httpx.Limits(
+            max_connections=cfg.openai_max_connections,
+            max_keepalive_connections=cfg.openai_max_keepalive,
+        )
+        # One keep-alive pool per provider instance; the registry keeps the
+        # instance alive so TLS sessions are reused across requests.
+        # Retries are owned by ResilientProvider when enabled; SDK retries on
+        # top of ours would multiply upstream load during an outage.
+        max_retries = 0 if cfg.ai_resilience else 2
+        self._client = OpenAI(
+            api_key=cfg.openai_api_key,
+            timeout=cfg.openai_timeout_s,
+            max_retries=max_retries,
+            http_client=DefaultHttpxClient(limits=limits),
+        )
+        self._aclient = AsyncOpenAI(
+            api_key=cfg.openai_api_key,
+            timeout=cfg.openai_timeout_s,
+            max_retries=max_retries,
+            http_client=DefaultAsyncHttpxClient(limits=limits),
+        )
 
-    def generate(self, system: str, user_prompt: str) -> GenResult:
+    def _request(self, system: str, user_prompt: str) -> dict:
         # Use Responses API (recommended for new projects)
         # https://platform.openai.com/docs/guides/text
-        resp = self._client.responses.create(
-            model=settings.openai_model,
-            input=[
+        return {
+            "model": self.model,
+            "input": [
                 {"role": "system", "content": system},
                 {"role": "user", "content": user_prompt},
             ],
             # A conservative ceiling; tune later
-            max_output_tokens=256,
-            # Many SDKs accept timeout at client-level; keep code minimal here.
-        )
+            "max_output_tokens": MAX_OUTPUT_TOKENS,
+        }
+
+    def generate(self, system: str, user_prompt: str) -> GenResult:
+        resp = self._client.responses.create(**self._request(system, user_prompt))
+        return self._to_result(resp, system, user_prompt)
+
+    async def agenerate(self, system: str, user_prompt: str) -> GenResult:
+        resp = await self._aclient.responses.create(**self._request(system, user_prompt))
+        return self._to_result(resp, system, user_prompt)
 
+    async def generate_stream(self, system: str, user_prompt: str) -> AsyncIterator[str]:
+        stream = await self._aclient.responses.create(**self._request(system, user_prompt), stream=True)
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+
+    def _to_result(self, resp, system: str, user_prompt: str) -> GenResult:
         # The SDK provides a convenience field for text output in many examples
         text = getattr(resp, "output_text", None)
         if not text:
@@ -69,12 +226,232 @@ class OpenAIProvider:
         if usage:
             tokens_est = int(getattr(usage, "total_tokens", 0) or 0)
         if tokens_est <= 0:
-            tokens_est = max(1, (len(system) + len(user_prompt) + len(text)) // 4)
+            tokenizer = get_tokenizer()
+            tokens_est = tokenizer.count_messages(system, user_prompt) + tokenizer.count(text)
 
         return GenResult(provider=self.name, text=text, tokens_est=tokens_est)
 
+    def close(self) -> None:
+        self._client.close()
+
+    async def aclose(self) -> None:
+        await self._aclient.close()
+
+
+def _resilience_key(cfg: Settings) -> Tuple:
+    if not cfg.ai_resilience:
+        return ()
+    return (
+        cfg.ai_attempt_timeout_s,
+        cfg.ai_deadline_s,
+        cfg.ai_max_attempts,
+        cfg.ai_backoff_base_ms,
+        cfg.ai_backoff_max_ms,
+        cfg.ai_retry_budget_ratio,
+        cfg.ai_breaker_failures,
+        cfg.ai_breaker_reset_s,
+        cfg.ai_hedge_after_ms,
+    )
+
+
+def _provider_key(cfg: Settings) -> Tuple:
+    """Configuration that identifies a distinct provider instance."""
+    if cfg.ai_backends:
+        from app.services.ai.router import backend_settings, parse_backends
+
+        return ("router",) + tuple(
+            _provider_key(backend_settings(cfg, spec)) for spec in parse_backends(cfg.ai_backends)
+        )
+    name = cfg.ai_provider.lower()
+    if name == "openai":
+        return (
+            name,
+            cfg.openai_model,
+            cfg.openai_api_key,
+            cfg.openai_timeout_s,
+            cfg.openai_max_connections,
+            cfg.openai_max_keepalive,
+        ) + _resilience_key(cfg)
+    return (
+        "stub",
+        cfg.stub_delay_ms,
+        cfg.stub_chunk_delay_ms,
+        cfg.stub_failure_rate,
+        cfg.stub_hang_rate,
+    ) + _resilience_key(cfg)
+
+
+def _build_provider(cfg: Settings) -> AIProvider:
+    if cfg.ai_backends:
+        # imported here: the router depends on this module
+        from app.services.ai.router import build_router
+
+        return build_router(cfg, _build_provider)
+
+    provider: AIProvider
+    if cfg.ai_provider.lower() == "openai":
+        provider = OpenAIProvider(cfg)
+    elif cfg.stub_failure_rate > 0 or cfg.stub_hang_rate > 0:
+        provider = FaultyStubProvider(
+            failure_rate=cfg.stub_failure_rate,
+            hang_rate=cfg.stub_hang_rate,
+            delay_s=cfg.stub_delay_ms / 1000,
+            chunk_delay_s=cfg.stub_chunk_delay_ms / 1000,
+        )
+    else:
+        provider = StubProvider(
+            delay_s=cfg.stub_delay_ms / 1000,
+            chunk_delay_s=cfg.stub_chunk_delay_ms / 1000,
+        )
+
+    if cfg.ai_resilience:
+        # imported here: resilience depends on this module
+        from app.services.ai.resilience import ResilienceConfig, ResilientProvider
+
+        provider = ResilientProvider(provider, ResilienceConfig.from_settings(cfg))
+    return provider
+
+
+class ProviderRegistry:
+    """Process-wide pool of provider instances keyed on their configuration.
+
+    Providers are built once and reused so their HTTP clients keep connections
+    alive between requests. When the settings snapshot changes (see
+    reload_settings()), the next lookup builds or reuses the instance for the
+    new configuration and retires the one it replaces. Calls made through
+    use() are counted, and a retired provider is closed once the last of them
+    finishes.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._providers: Dict[Tuple, AIProvider] = {}
+        # (settings snapshot, provider) swapped as one tuple so the lock-free
+        # fast path never pairs a snapshot with another snapshot's provider.
+        self._active: Optional[Tuple[Settings, AIProvider]] = None
+        self._inflight: Dict[int, int] = {}  # id(provider) -> calls in use()
+        self._retired: Dict[int, AIProvider] = {}  # superseded, still in use
+        self._closing: set = set()  # aclose() tasks, kept referenced until done
+
+    def get(self, cfg: Optional[Settings] = None) -> AIProvider:
+        cfg = cfg or get_settings()
+        active = self._active
+        if active is not None and active[0] is cfg:
+            return active[1]
+
+        with self._lock:
+            provider, retired = self._lookup(cfg)
+        self._close_retired(retired)
+        return provider
+
+    @contextmanager
+    def use(self, cfg: Optional[Settings] = None) -> Iterator[AIProvider]:
+        """Yield the current provider, keeping it open until the block exits."""
+        with self._lock:
+            provider, retired = self._lookup(cfg or get_settings())
+            self._inflight[id(provider)] = self._inflight.get(id(provider), 0) + 1
+        self._close_retired(retired)
+        try:
+            yield provider
+        finally:
+            self._release(provider)
+
+    def _lookup(self, cfg: Settings) -> Tuple[AIProvider, List[AIProvider]]:
+        """Provider for cfg plus the instances it superseded that are now idle.
+
+        Called with the lock held.
+        """
+        active = self._active
+        if active is not None and active[0] is cfg:
+            return active[1], []
+
+        key = _provider_key(cfg)
+        provider = self._providers.get(key)
+        if provider is None:
+            provider = _build_provider(cfg)
+            self._providers[key] = provider
+            logger.info("ai.provider.created", extra={"extra": {"provider": provider.name}})
+        self._active = (cfg, provider)
+
+        idle = []
+        for old_key, old in list(self._providers.items()):
+            if old is provider:
+                continue
+            del self._providers[old_key]
+            if self._inflight.get(id(old)):
+                self._retired[id(old)] = old
+            else:
+                idle.append(old)
+        return provider, idle
+
+    def _release(self, provider: AIProvider) -> None:
+        with self._lock:
+            remaining = self._inflight.get(id(provider), 0) - 1
+            if remaining > 0:
+                self._inflight[id(provider)] = remaining
+                return
+            self._inflight.pop(id(provider), None)
+            retired = self._retired.pop(id(provider), None)
+        if retired is not None:
+            self._close_retired([retired])
+
+    def _close_retired(self, providers: List[AIProvider]) -> None:
+        for provider in providers:
+            logger.info("ai.provider.retired", extra={"extra": {"provider": provider.name}})
+            try:
+                provider.close()
+            except Exception:
+                logger.exception("ai.provider.close_failed", extra={"extra": {"provider": provider.name}})
+                continue
+            aclose = getattr(provider, "aclose", None)
+            if aclose is None:
+                continue
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                continue  # no loop, so no async client was ever used from this thread
+            task = loop.create_task(self._aclose(provider))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _aclose(provider: AIProvider) -> None:
+        try:
+            await provider.aclose()
+        except Exception:
+            logger.exception("ai.provider.close_failed", extra={"extra": {"provider": provider.name}})
+
+    def _drain(self) -> list:
+        with self._lock:
+            providers = list(self._providers.values()) + list(self._retired.values())
+            self._providers.clear()
+            self._retired.clear()
+            self._active = None
+        return providers
+
+    def close_all(self) -> None:
+        for provider in self._drain():
+            try:
+                provider.close()
+            except Exception:
+                logger.exception("ai.provider.close_failed", extra={"extra": {"provider": provider.name}})
+
+    async def aclose_all(self) -> None:
+        """Close sync and async clients; used from the app lifespan."""
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+        for provider in self._drain():
+            try:
+                provider.close()
+                aclose = getattr(provider, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            except Exception:
+                logger.exception("ai.provider.close_failed", extra={"extra": {"provider": provider.name}})
+
+
+provider_registry = ProviderRegistry()
+
 
 def get_provider() -> AIProvider:
-    if settings.ai_provider.lower() == "openai":
-        return OpenAIProvider()
-    return StubProvider()
+    return provider_registry.get()
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.core.settings import Settings, get_settings
+
+logger = logging.getLogger("ai")
+
+# Priority lanes: lower value is served first
+INTERACTIVE = 0
+BATCH = 1
+LANES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+class RateLimitExceeded(RuntimeError):
+    """Call rejected by the client-side upstream limiter."""
+
+    def __init__(self, message: str, retry_after_s: float = 1.0) -> None:
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class TokenBucket:
+    """Classic token bucket; `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float, ahead: float = 0.0) -> float:
+        """Seconds until `amount` tokens are available (0 if available now).
+
+        `ahead` is demand that will be served first and has to be refilled
+        before this one.
+        """
+        self._refill(now)
+        # A request bigger than the bucket is admitted once the bucket is full
+        amount = ahead + min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        # May go negative when settling actual usage; later callers wait it out
+        self._tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateBuckets:
+    """The requests/min and tokens/min buckets of one provider/model.
+
+    reserve() checks and takes in one step, so an implementation shared
+    between processes (see shared.SharedBuckets) can do it atomically.
+    Implementations whose calls do I/O set blocking = True and the limiter
+    calls them from a worker thread.
+    """
+
+    blocking = False
+
+    def __init__(self, rpm: int, tpm: int) -> None:
+        self._requests = TokenBucket(rpm / 60, rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm / 60, tpm) if tpm > 0 else None
+
+    def wait_time(self, tokens: int, calls_ahead: int = 0, tokens_ahead: int = 0) -> float:
+        """Seconds until a call costing `tokens` fits behind the given queued demand."""
+        now = time.monotonic()
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now, ahead=calls_ahead))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(tokens, now, ahead=tokens_ahead))
+        return wait
+
+    def reserve(self, tokens: int) -> float:
+        """Take capacity for one call if available now; else return the wait."""
+        wait = self.wait_time(tokens)
+        if wait == 0:
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(tokens)
+        return wait
+
+    def adjust(self, tokens: int) -> None:
+        """Take (positive) or refund (negative) tokens once actual usage is known."""
+        if self._tokens is None or tokens == 0:
+            return
+        if tokens > 0:
+            self._tokens.take(tokens)
+        else:
+            self._tokens.refund(-tokens)
+
+
+@dataclass
+class LaneStats:
+    admitted: int = 0
+    queued: int = 0
+    rejected: int = 0
+    wait_ms_total: float = 0.0
+    wait_ms_max: float = 0.0
+
+
+@dataclass
+class LimiterStats:
+    key: str
+    queue_depth: int
+    lanes: Dict[str, LaneStats] = field(default_factory=dict)
+
+
+class UpstreamLimiter:
+    """Requests/min and tokens/min limiter for one provider/model.
+
+    Calls are admitted immediately when both buckets allow it and nobody is
+    queued; otherwise they wait in a priority queue (interactive before
+    batch, FIFO within a lane) drained by a single pump task. Calls are
+    rejected when the queue is full or their wait would exceed max_wait_s.
+    """
+
+    def __init__(self, key: str, buckets: RateBuckets, max_queue: int, max_wait_s: float) -> None:
+        self.key = key
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self._buckets = buckets
+        self._queue: List[Tuple[int, int, int, asyncio.Future]] = []
+        # Callers still waiting in _queue and the tokens they asked for; the
+        # heap itself may still hold entries whose caller gave up
+        self._waiting = 0
+        self._waiting_tokens = 0
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._stats = {lane: LaneStats() for lane in LANES}
+
+    def _record_wait(self, priority: int, wait_s: float) -> None:
+        lane = self._stats[priority]
+        lane.admitted += 1
+        wait_ms = wait_s * 1000
+        lane.wait_ms_total += wait_ms
+        lane.wait_ms_max = max(lane.wait_ms_max, wait_ms)
+
+    def _reject(self, priority: int, reason: str, retry_after_s: float) -> RateLimitExceeded:
+        self._stats[priority].rejected += 1
+        logger.warning(
+            "ai.ratelimit.rejected",
+            extra={"extra": {"key": self.key, "lane": LANES[priority], "reason": reason}},
+        )
+        return RateLimitExceeded(f"upstream rate limit: {reason}", retry_after_s=retry_after_s)
+
+    async def _reserve(self, tokens: int) -> float:
+        if self._buckets.blocking:
+            return await asyncio.to_thread(self._buckets.reserve, tokens)
+        return self._buckets.reserve(tokens)
+
+    async def _wait_time(self, tokens: int) -> float:
+        args = (tokens, self._waiting, self._waiting_tokens)
+        if self._buckets.blocking:
+            return await asyncio.to_thread(self._buckets.wait_time, *args)
+        return self._buckets.wait_time(*args)
+
+    async def acquire(self, tokens: int, priority: int = INTERACTIVE) -> float:
+        """Wait for capacity for one call costing `tokens`; return seconds waited."""
+        if not self._waiting and await self._reserve(tokens) == 0:
+            self._record_wait(priority, 0.0)
+            return 0.0
+
+        if self._waiting >= self.max_queue:
+            raise self._reject(priority, "queue full", self.max_wait_s)
+        # Everyone already queued is served first (batch callers even behind
+        # later interactive ones, so this is a lower bound for them)
+        estimate = await self._wait_time(tokens)
+        if estimate > self.max_wait_s:
+            raise self._reject(priority, "wait too long", estimate)
+
+        t0 = time.monotonic()
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), tokens, fut))
+        self._waiting += 1
+        self._waiting_tokens += tokens
+        self._stats[priority].queued += 1
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.ensure_future(self._pump())
+        try:
+            await asyncio.wait_for(fut, timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            raise self._reject(priority, "timed out in queue", self.max_wait_s) from None
+        finally:
+            self._waiting -= 1
+            self._waiting_tokens -= tokens
+        waited = time.monotonic() - t0
+        self._record_wait(priority, waited)
+        return waited
+
+    async def _pump(self) -> None:
+        while self._queue:
+            entry = self._queue[0]
+            tokens, fut = entry[2], entry[3]
+            if fut.done():  # caller gave up or was cancelled
+                heapq.heappop(self._queue)
+                continue
+            wait = await self._reserve(tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            # reserve() may have yielded to the loop: the entry can have been
+            # overtaken by a higher-priority one or abandoned meanwhile
+            if self._queue[0] is entry:
+                heapq.heappop(self._queue)
+            else:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            if fut.done():
+                self.settle(tokens, 0)
+            else:
+                fut.set_result(None)
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Correct the token bucket once the real usage is known."""
+        tokens = actual - estimated
+        if tokens and self._buckets.blocking:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                # Nobody waits on the result; keep the round trip off the loop
+                loop.run_in_executor(None, self._buckets.adjust, tokens)
+                return
+        self._buckets.adjust(tokens)
+
+    def stats(self) -> LimiterStats:
+        return LimiterStats(
+            key=self.key,
+            queue_depth=self._waiting,
+            lanes={LANES[p]: LaneStats(**vars(s)) for p, s in self._stats.items()},
+        )
+
+
+_limiters: Dict[Tuple[str, str], UpstreamLimiter] = {}
+_limiters_cfg: Optional[Settings] = None
+
+
+def get_limiter(provider: str, model: str, cfg: Optional[Settings] = None) -> Optional[UpstreamLimiter]:
+    """Return the limiter for a provider/model, or None when limits are off."""
+    global _limiters_cfg
+    cfg = cfg or get_settings()
+    if cfg.ai_rpm <= 0 and cfg.ai_tpm <= 0:
+        return None
+    if _limiters_cfg is not cfg:
+        # Rebuilt when settings are reloaded, so new AI_RPM/AI_TPM take effect
+        _limiters.clear()
+        _limiters_cfg = cfg
+    key = (provider, model)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        label = f"{provider}:{model}" if model else provider
+        buckets: RateBuckets
+        if cfg.shared_state_address:
+            # Workers started by app.serve share the buckets via the sidecar
+            from app.services.ai.shared import SharedBuckets
+
+            buckets = SharedBuckets(label, rpm=cfg.ai_rpm, tpm=cfg.ai_tpm)
+        else:
+            buckets = RateBuckets(rpm=cfg.ai_rpm, tpm=cfg.ai_tpm)
+        limiter = UpstreamLimiter(
+            label,
+            buckets,
+            max_queue=cfg.ai_queue_max,
+            max_wait_s=cfg.ai_queue_max_wait_s,
+        )
+        _limiters[key] = limiter
+    return limiter
+
+
+def limiter_stats() -> List[LimiterStats]:
+    return [limiter.stats() for limiter in _limiters.values()]
@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, NoReturn, Optional
+
+from app.core.settings import Settings
+from app.services.ai.providers import AIProvider, GenResult
+
+logger = logging.getLogger("ai")
+
+
+class ProviderUnavailableError(RuntimeError):
+    """The provider could not serve the call; safe to retry later."""
+
+    def __init__(self, message: str, retry_after_s: float = 1.0) -> None:
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    pass
+
+
+class DeadlineExceededError(ProviderUnavailableError):
+    pass
+
+
+# SDK exception class names worth retrying, matched by name so the openai
+# package stays an optional, lazily imported dependency.
+_RETRYABLE_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "RateLimitError",
+    "InternalServerError",
+}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in _RETRYABLE_NAMES:
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+@dataclass
+class ResilienceConfig:
+    attempt_timeout_s: float = 30.0  # per upstream attempt
+    deadline_s: float = 60.0  # whole call, retries included
+    max_attempts: int = 3
+    backoff_base_s: float = 0.1
+    backoff_max_s: float = 2.0
+    retry_budget_ratio: float = 0.2  # retries allowed per first attempt
+    breaker_failures: int = 5  # consecutive failures that open the circuit
+    breaker_reset_s: float = 30.0
+    hedge_after_s: float = 0.0  # 0 disables hedging
+
+    @classmethod
+    def from_settings(cls, cfg: Settings) -> "ResilienceConfig":
+        return cls(
+            attempt_timeout_s=cfg.ai_attempt_timeout_s,
+            deadline_s=cfg.ai_deadline_s,
+            max_attempts=cfg.ai_max_attempts,
+            backoff_base_s=cfg.ai_backoff_base_ms / 1000,
+            backoff_max_s=cfg.ai_backoff_max_ms / 1000,
+            retry_budget_ratio=cfg.ai_retry_budget_ratio,
+            breaker_failures=cfg.ai_breaker_failures,
+            breaker_reset_s=cfg.ai_breaker_reset_s,
+            hedge_after_s=cfg.ai_hedge_after_ms / 1000,
+        )
+
+
+class RetryBudget:
+    """Caps retries to a fraction of traffic so retries cannot amplify an outage.
+
+    Every first attempt deposits `ratio` tokens (up to `max_tokens`); every
+    retry withdraws one.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open after a cool-down.
+
+    In half-open state a single probe call is let through; its outcome closes
+    or re-opens the circuit. A probe that ends without an outcome (cancelled,
+    stream closed early, non-retryable error) must hand the slot back with
+    release_probe(), otherwise no further probe would ever be admitted.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout_s: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout_s:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError if the call is refused; return True if it is the half-open probe."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self.reset_timeout_s - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError("provider circuit is open", retry_after_s=max(remaining, 1.0))
+            self._probing = True
+            return True
+
+    def release_probe(self) -> None:
+        """Free the probe slot without counting a success or a failure."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning("ai.circuit.open", extra={"extra": {"failures": self._failures}})
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class ResilientProvider:
+    """Wraps any AIProvider with deadlines, retries, a circuit breaker and hedging.
+
+    The async path enforces per-attempt timeouts and the overall deadline.
+    The sync path relies on the client-level timeout and only retries.
+    Streams are guarded by the breaker but never retried once output started.
+    """
+
+    def __init__(self, inner: AIProvider, config: ResilienceConfig) -> None:
+        self.inner = inner
+        self.name = inner.name
+        self.model = getattr(inner, "model", "")
+        self.config = config
+        self.breaker = CircuitBreaker(config.breaker_failures, config.breaker_reset_s)
+        self.budget = RetryBudget(config.retry_budget_ratio)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        cap = min(self.config.backoff_max_s, self.config.backoff_base_s * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def _should_retry(self, exc: BaseException, attempt: int, remaining_s: float) -> Optional[float]:
+        """Return the backoff delay if another attempt is allowed, else None."""
+        if attempt + 1 >= self.config.max_attempts or not is_retryable(exc):
+            return None
+        delay = self._backoff(attempt)
+        if delay >= remaining_s or not self.budget.withdraw():
+            return None
+        return delay
+
+    def _record_error(self, exc: BaseException) -> None:
+        # A 4xx or validation error proves nothing about upstream health.
+        if is_retryable(exc):
+            self.breaker.record_failure()
+
+    def _give_up(self, exc: Exception, attempt: int) -> NoReturn:
+        """Re-raise the final error; transient ones become ProviderUnavailableError (503)."""
+        if isinstance(exc, asyncio.TimeoutError):
+            raise DeadlineExceededError("provider call timed out") from exc
+        if is_retryable(exc):
+            raise ProviderUnavailableError(f"provider call failed after {attempt + 1} attempt(s)") from exc
+        raise exc
+
+    def generate(self, system: str, user_prompt: str) -> GenResult:
+        probe = self.breaker.before_call()
+        try:
+            self.budget.deposit()
+            deadline = time.monotonic() + self.config.deadline_s
+            attempt = 0
+            while True:
+                try:
+                    result = self.inner.generate(system=system, user_prompt=user_prompt)
+                except Exception as exc:
+                    self._record_error(exc)
+                    delay = self._should_retry(exc, attempt, deadline - time.monotonic())
+                    if delay is None:
+                        self._give_up(exc, attempt)
+                    logger.info("ai.retry", extra={"extra": {"provider": self.name, "attempt": attempt + 1, "error": repr(exc)}})
+                    time.sleep(delay)
+                    probe = self.breaker.before_call()
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                return result
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    async def _attempt(self, system: str, user_prompt: str) -> GenResult:
+        agenerate = getattr(self.inner, "agenerate", None)
+        if agenerate is not None:
+            return await agenerate(system=system, user_prompt=user_prompt)
+        return await asyncio.to_thread(self.inner.generate, system=system, user_prompt=user_prompt)
+
+    async def _hedged(self, call: Callable[[], Awaitable[GenResult]]) -> GenResult:
+        """Start a backup attempt if the first is slower than hedge_after_s; first success wins."""
+        first = asyncio.ensure_future(call())
+        tasks = {first}
+        try:
+            if self.config.hedge_after_s <= 0:
+                return await first
+            done, _ = await asyncio.wait({first}, timeout=self.config.hedge_after_s)
+            if done:
+                return first.result()
+
+            logger.info("ai.hedge", extra={"extra": {"provider": self.name}})
+            tasks.add(asyncio.ensure_future(call()))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            assert error is not None
+            raise error
+        finally:
+            # Also covers the outer wait_for cancelling us mid-wait.
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def agenerate(self, system: str, user_prompt: str) -> GenResult:
+        probe = self.breaker.before_call()
+        try:
+            self.budget.deposit()
+            deadline = time.monotonic() + self.config.deadline_s
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    result = await asyncio.wait_for(
+                        self._hedged(lambda: self._attempt(system, user_prompt)),
+                        timeout=min(self.config.attempt_timeout_s, remaining),
+                    )
+                except Exception as exc:
+                    self._record_error(exc)
+                    delay = self._should_retry(exc, attempt, deadline - time.monotonic())
+                    if delay is None:
+                        self._give_up(exc, attempt)
+                    logger.info("ai.retry", extra={"extra": {"provider": self.name, "attempt": attempt + 1, "error": repr(exc)}})
+                    await asyncio.sleep(delay)
+                    probe = self.breaker.before_call()
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                return result
+        finally:
+            # Cancelled or otherwise outcome-less probes must not wedge the breaker open.
+            if probe:
+                self.breaker.release_probe()
+
+    async def generate_stream(self, system: str, user_prompt: str) -> AsyncIterator[str]:
+        """Stream chunks; the first chunk must arrive within attempt_timeout_s."""
+        probe = self.breaker.before_call()
+        generate_stream = getattr(self.inner, "generate_stream", None)
+        stream: Optional[AsyncIterator[str]] = None
+        try:
+            if generate_stream is None:
+                result = await asyncio.wait_for(
+                    self._attempt(system, user_prompt), timeout=self.config.attempt_timeout_s
+                )
+                yield result.text
+            else:
+                stream = generate_stream(system=system, user_prompt=user_prompt)
+                try:
+                    first = await asyncio.wait_for(stream.__anext__(), timeout=self.config.attempt_timeout_s)
+                except StopAsyncIteration:
+                    pass
+                else:
+                    yield first
+                    async for chunk in stream:
+                        yield chunk
+        except asyncio.TimeoutError as exc:
+            self.breaker.record_failure()
+            raise DeadlineExceededError("provider stream produced no output in time") from exc
+        except Exception as exc:
+            self._record_error(exc)
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            # Also reached when the client disconnects and the stream is closed early.
+            if probe:
+                self.breaker.release_probe()
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def close(self) -> None:
+        self.inner.close()
+
+    async def aclose(self) -> None:
+        aclose = getattr(self.inner, "aclose", None)
+        if aclose is not None:
+            await aclose()
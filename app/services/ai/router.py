@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, Callable, List, Optional
+
+from pydantic import ValidationError
+
+from app.core.settings import Settings
+from app.services.ai.providers import MAX_OUTPUT_TOKENS, AIProvider, GenResult
+from app.services.ai.ratelimit import INTERACTIVE, RateLimitExceeded, UpstreamLimiter, get_limiter
+from app.services.ai.tokenizer import get_tokenizer
+
+logger = logging.getLogger("ai")
+
+EWMA_ALPHA = 0.2
+# A backend that answers 401/403 is skipped for this long before it is retried
+UNAUTHORIZED_RETRY_S = 60.0
+
+# 4xx statuses that depend on the backend (its key, model or quota) rather
+# than on the request, so another backend may still succeed
+_BACKEND_SPECIFIC_STATUSES = {401, 403, 404, 408, 409, 429}
+
+
+def is_client_error(exc: BaseException) -> bool:
+    """A bad request that would fail the same way on every backend."""
+    if isinstance(exc, ValidationError):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in _BACKEND_SPECIFIC_STATUSES
+
+
+@dataclass
+class BackendSpec:
+    """One entry of AI_BACKENDS: kind[:model][@API_KEY_ENV]."""
+
+    kind: str
+    model: str = ""
+    key_env: str = ""
+
+    @property
+    def label(self) -> str:
+        label = f"{self.kind}:{self.model}" if self.model else self.kind
+        return f"{label}@{self.key_env}" if self.key_env else label
+
+
+def parse_backends(raw: str) -> List[BackendSpec]:
+    specs = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        item, _, key_env = item.partition("@")
+        kind, _, model = item.partition(":")
+        specs.append(BackendSpec(kind=kind.lower(), model=model, key_env=key_env))
+    return specs
+
+
+def backend_settings(cfg: Settings, spec: BackendSpec) -> Settings:
+    """Settings snapshot for a single backend of the router."""
+    overrides = {"ai_provider": spec.kind, "ai_backends": ""}
+    if spec.model:
+        overrides["openai_model"] = spec.model
+    if spec.key_env:
+        overrides["openai_api_key"] = os.getenv(spec.key_env, "")
+    return replace(cfg, **overrides)
+
+
+@dataclass
+class BackendStats:
+    label: str
+    provider: str
+    ewma_latency_ms: float
+    error_rate: float
+    inflight: int
+    calls: int
+    failures: int
+    available: bool
+
+
+class _Backend:
+    def __init__(self, label: str, provider: AIProvider, failure_latency_s: float = 30.0) -> None:
+        self.label = label
+        self.provider = provider
+        # Latency charged for a failed call, so a backend that fails fast
+        # does not look fast; defaults to the attempt timeout
+        self.failure_latency_s = failure_latency_s
+        self.ewma_latency_s: Optional[float] = None
+        self.ewma_error = 0.0
+        self.inflight = 0
+        self.calls = 0
+        self.failures = 0
+        self._unauthorized_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        if time.monotonic() < self._unauthorized_until:
+            return False
+        breaker = getattr(self.provider, "breaker", None)
+        return breaker is None or breaker.state != "open"
+
+    def score(self) -> float:
+        # Unmeasured backends score 0 so they get explored first
+        latency = self.ewma_latency_s or 0.0
+        return (latency + self.failure_latency_s * self.ewma_error) * (1 + self.inflight)
+
+    def record(self, latency_s: float, error: Optional[BaseException] = None) -> None:
+        self.calls += 1
+        if error is not None:
+            self.failures += 1
+            latency_s = max(latency_s, self.failure_latency_s)
+            # A rejected key or model fails every call; the breaker ignores
+            # 4xx, so take the backend out of rotation here
+            if getattr(error, "status_code", None) in (401, 403):
+                self._unauthorized_until = time.monotonic() + UNAUTHORIZED_RETRY_S
+        else:
+            self._unauthorized_until = 0.0
+        prev = self.ewma_latency_s
+        self.ewma_latency_s = latency_s if prev is None else prev + EWMA_ALPHA * (latency_s - prev)
+        self.ewma_error += EWMA_ALPHA * ((0.0 if error is None else 1.0) - self.ewma_error)
+
+    def stats(self) -> BackendStats:
+        return BackendStats(
+            label=self.label,
+            provider=self.provider.name,
+            ewma_latency_ms=round((self.ewma_latency_s or 0.0) * 1000, 2),
+            error_rate=round(self.ewma_error, 4),
+            inflight=self.inflight,
+            calls=self.calls,
+            failures=self.failures,
+            available=self.available,
+        )
+
+
+class ProviderRouter:
+    """Spreads calls over several backends, preferring fast, healthy, idle ones.
+
+    Each call ranks backends by EWMA latency plus an EWMA error-rate penalty,
+    scaled by in-flight count (failures count as slow calls; backends with an
+    open circuit or a rejected API key go last) and tries them in that order,
+    falling back to the next on failure. Streams fall back only
+    until the first chunk has been sent. Client errors (see is_client_error)
+    are raised straight away instead of being replayed on every backend.
+
+    Each backend has its own AI_RPM/AI_TPM limiter keyed on its label, so
+    every extra backend or API key adds capacity; a backend whose limiter
+    rejects the call is skipped like a failed one.
+    """
+
+    name = "router"
+    # The service must not wrap the router in a single shared limiter
+    limits_per_backend = True
+
+    def __init__(self, backends: List[_Backend]) -> None:
+        if not backends:
+            raise RuntimeError("AI_BACKENDS is empty")
+        self._backends = backends
+        self._lock = threading.Lock()
+        self.model = ",".join(b.label for b in backends)
+
+    def _ranked(self) -> List[_Backend]:
+        with self._lock:
+            # Shuffle first so equal scores (e.g. cold start) spread load
+            backends = random.sample(self._backends, len(self._backends))
+            return sorted(backends, key=lambda b: (not b.available, b.score()))
+
+    def _start(self, backend: _Backend) -> float:
+        with self._lock:
+            backend.inflight += 1
+        return time.perf_counter()
+
+    def _finish(self, backend: _Backend, t0: float, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            backend.inflight -= 1
+            backend.record(time.perf_counter() - t0, error)
+
+    def _release(self, backend: _Backend) -> None:
+        """Drop the in-flight slot without recording an outcome (caller went away)."""
+        with self._lock:
+            backend.inflight -= 1
+
+    def _fallback(self, backend: _Backend, exc: Exception) -> None:
+        logger.warning(
+            "ai.router.fallback",
+            extra={"extra": {"backend": backend.label, "error": repr(exc)}},
+        )
+
+    def _limiter(self, backend: _Backend) -> Optional[UpstreamLimiter]:
+        return get_limiter(self.name, backend.label)
+
+    @staticmethod
+    def _prompt_tokens(system: str, user_prompt: str) -> int:
+        return get_tokenizer().count_messages(system, user_prompt)
+
+    def _call(self, attempt: Callable[[_Backend], GenResult]) -> GenResult:
+        # The sync path has no limiter; it is only used by sync callers
+        error: Optional[Exception] = None
+        for backend in self._ranked():
+            t0 = self._start(backend)
+            try:
+                result = attempt(backend)
+            except Exception as exc:
+                if is_client_error(exc):
+                    # Says nothing about the backend's health
+                    self._release(backend)
+                    raise
+                self._finish(backend, t0, exc)
+                self._fallback(backend, exc)
+                error = exc
+                continue
+            self._finish(backend, t0)
+            return result
+        assert error is not None
+        raise error
+
+    def generate(self, system: str, user_prompt: str) -> GenResult:
+        return self._call(lambda b: b.provider.generate(system=system, user_prompt=user_prompt))
+
+    async def agenerate(self, system: str, user_prompt: str, priority: int = INTERACTIVE) -> GenResult:
+        prompt_tokens = self._prompt_tokens(system, user_prompt)
+        estimated = prompt_tokens + MAX_OUTPUT_TOKENS
+        error: Optional[Exception] = None
+        for backend in self._ranked():
+            limiter = self._limiter(backend)
+            if limiter is not None:
+                try:
+                    await limiter.acquire(estimated, priority)
+                except RateLimitExceeded as exc:
+                    self._fallback(backend, exc)
+                    error = exc
+                    continue
+            actual = prompt_tokens
+            t0 = self._start(backend)
+            try:
+                agenerate = getattr(backend.provider, "agenerate", None)
+                if agenerate is not None:
+                    result = await agenerate(system=system, user_prompt=user_prompt)
+                else:
+                    result = await asyncio.to_thread(
+                        backend.provider.generate, system=system, user_prompt=user_prompt
+                    )
+                actual = result.tokens_est
+            except Exception as exc:
+                if is_client_error(exc):
+                    self._release(backend)
+                    raise
+                self._finish(backend, t0, exc)
+                self._fallback(backend, exc)
+                error = exc
+                continue
+            except BaseException:
+                self._release(backend)
+                raise
+            finally:
+                if limiter is not None:
+                    limiter.settle(estimated, actual)
+            self._finish(backend, t0)
+            return result
+        assert error is not None
+        raise error
+
+    async def generate_stream(self, system: str, user_prompt: str) -> AsyncIterator[str]:
+        tokenizer = get_tokenizer()
+        prompt_tokens = self._prompt_tokens(system, user_prompt)
+        estimated = prompt_tokens + MAX_OUTPUT_TOKENS
+        error: Optional[Exception] = None
+        for backend in self._ranked():
+            generate_stream = getattr(backend.provider, "generate_stream", None)
+            if generate_stream is None:
+                continue
+            limiter = self._limiter(backend)
+            if limiter is not None:
+                try:
+                    await limiter.acquire(estimated, INTERACTIVE)
+                except RateLimitExceeded as exc:
+                    self._fallback(backend, exc)
+                    error = exc
+                    continue
+            t0 = self._start(backend)
+            chunks: List[str] = []
+            try:
+                async for chunk in generate_stream(system=system, user_prompt=user_prompt):
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as exc:
+                if is_client_error(exc):
+                    self._release(backend)
+                    raise
+                self._finish(backend, t0, exc)
+                if chunks:
+                    raise
+                self._fallback(backend, exc)
+                error = exc
+                continue
+            except BaseException:
+                self._release(backend)
+                raise
+            finally:
+                if limiter is not None:
+                    limiter.settle(estimated, prompt_tokens + tokenizer.count("".join(chunks)))
+            self._finish(backend, t0)
+            return
+        if error is not None:
+            raise error
+        result = await self.agenerate(system, user_prompt)
+        yield result.text
+
+    def stats(self) -> List[BackendStats]:
+        with self._lock:
+            return [b.stats() for b in self._backends]
+
+    def close(self) -> None:
+        for backend in self._backends:
+            backend.provider.close()
+
+    async def aclose(self) -> None:
+        for backend in self._backends:
+            aclose = getattr(backend.provider, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+def build_router(cfg: Settings, build_backend: Callable[[Settings], AIProvider]) -> ProviderRouter:
+    backends = []
+    for spec in parse_backends(cfg.ai_backends):
+        try:
+            provider = build_backend(backend_settings(cfg, spec))
+        except RuntimeError:
+            # e.g. a missing API key; keep serving with the remaining backends
+            logger.exception("ai.router.backend_failed", extra={"extra": {"backend": spec.label}})
+            continue
+        backends.append(_Backend(spec.label, provider, failure_latency_s=cfg.ai_attempt_timeout_s))
+    return ProviderRouter(backends)
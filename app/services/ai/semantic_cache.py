@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from app.core.settings import Settings, get_settings
+from app.services.ai.providers import GenResult
+
+logger = logging.getLogger("ai")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Dropped anywhere; they never change what is being asked
+_STOPWORDS = frozenset("a an the please".split())
+# Definitional framings, dropped only at the start of a prompt so that
+# "what is X?", "explain X" and "X" share an embedding. Interrogatives,
+# modals and negations elsewhere are kept: "how"/"why" or "can"/"should"
+# ask different questions.
+_FRAMINGS = sorted(
+    (
+        tuple(phrase.split())
+        for phrase in (
+            "what is", "what are", "what s", "whats", "explain", "describe", "define",
+            "tell me about", "can you explain", "could you explain",
+        )
+    ),
+    key=len,
+    reverse=True,
+)
+
+
+def _np():
+    # numpy is only needed when the semantic cache is enabled
+    import numpy as np
+
+    return np
+
+
+class Embedder(Protocol):
+    dim: int
+
+    def embed(self, texts: List[str]) -> Any:
+        """Return an (n, dim) float32 array of L2-normalized vectors."""
+        ...
+
+
+class HashingEmbedder:
+    """Dependency-free embedder: signed feature hashing of words, word bigrams and char trigrams.
+
+    Captures lexical overlap, which is enough to match rephrasings that share
+    most of their words ("what is vibe coding?" / "explain vibe coding").
+    Bigrams make it order-sensitive, so "celsius to fahrenheit" and
+    "fahrenheit to celsius" do not collide; trigrams are weighted low so
+    they add typo tolerance without drowning out word order.
+    """
+
+    WORD_WEIGHT = 1.0
+    BIGRAM_WEIGHT = 1.5
+    TRIGRAM_WEIGHT = 0.35
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+        self._np = _np()
+
+    def _words(self, text: str) -> List[str]:
+        words = [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+        for framing in _FRAMINGS:
+            if tuple(words[: len(framing)]) == framing:
+                return words[len(framing):]
+        return words
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        words = self._words(text)
+        feats: List[Tuple[str, float]] = [("w:" + w, self.WORD_WEIGHT) for w in words]
+        feats.extend(("b:" + a + " " + b, self.BIGRAM_WEIGHT) for a, b in zip(words, words[1:]))
+        for w in words:
+            padded = f"#{w}#"
+            feats.extend(("c:" + padded[i:i + 3], self.TRIGRAM_WEIGHT) for i in range(len(padded) - 2))
+        return feats
+
+    def embed(self, texts: List[str]) -> Any:
+        np = self._np
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feat, weight in self._features(text):
+                # blake2b rather than crc32: CRC is linear, so swapped word
+                # pairs of equal length collide far more often than chance.
+                # Two signed buckets per feature make a full collision rarer still.
+                h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+                for part in (h & 0xFFFFFFFF, h >> 32):
+                    out[row, part % self.dim] += weight if part >> 31 else -weight
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU embedding model via sentence-transformers (optional dependency)."""
+
+    def __init__(self, model_name: str) -> None:
+        from sentence_transformers import SentenceTransformer  # imported lazily; heavy
+
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.dim = int(self._model.get_sentence_embedding_dimension())
+
+    def embed(self, texts: List[str]) -> Any:
+        vecs = self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return vecs.astype(_np().float32, copy=False)
+
+
+class FlatIndex:
+    """Exact inner-product search over a ring buffer of vectors.
+
+    The buffer starts small and doubles as it fills, up to capacity, so a
+    scope that only ever sees a few prompts does not hold capacity * dim
+    floats. When full, the oldest slot is overwritten (FIFO eviction).
+    """
+
+    initial_rows = 1024
+
+    def __init__(self, dim: int, capacity: int) -> None:
+        np = _np()
+        self.dim = dim
+        self.capacity = capacity
+        self._vecs = np.zeros((min(capacity, self.initial_rows), dim), dtype=np.float32)
+        self._count = 0
+        self._next = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _grow(self) -> None:
+        np = _np()
+        rows = min(self.capacity, 2 * len(self._vecs))
+        vecs = np.zeros((rows, self.dim), dtype=np.float32)
+        vecs[: self._count] = self._vecs[: self._count]
+        self._vecs = vecs
+
+    def add(self, vec: Any) -> Tuple[int, Optional[int]]:
+        """Store vec; return (slot, evicted slot or None)."""
+        slot = self._next
+        if slot == len(self._vecs):
+            self._grow()
+        evicted = slot if self._count == self.capacity else None
+        self._vecs[slot] = vec
+        self._next = (slot + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return slot, evicted
+
+    def remove(self, slot: int) -> None:
+        """Zero the slot so it never matches again; it is reused when the ring wraps."""
+        self._vecs[slot] = 0.0
+
+    def search(self, vec: Any) -> Tuple[int, float]:
+        """Return (slot, cosine score) of the nearest vector, or (-1, -1.0) if empty."""
+        if self._count == 0:
+            return -1, -1.0
+        scores = self._vecs[: self._count] @ vec
+        slot = int(scores.argmax())
+        return slot, float(scores[slot])
+
+
+class IVFIndex(FlatIndex):
+    """Inverted-file index: vectors are bucketed by nearest k-means centroid.
+
+    Search scans only the nprobe closest buckets. Until train_size vectors
+    have been added the index falls back to flat search; centroids are then
+    fitted once with a few rounds of Lloyd's algorithm. Fitting is split out
+    of add() (needs_training / training_sample / fit / install) so the owner
+    can run the k-means outside its lock.
+    """
+
+    def __init__(self, dim: int, capacity: int, nlist: int = 256, nprobe: int = 8, train_size: int = 4096) -> None:
+        super().__init__(dim, capacity)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = max(train_size, nlist)
+        self._centroids: Any = None
+        self._lists: List[List[int]] = []
+        self._slot_list: Dict[int, int] = {}
+        self._training = False
+
+    def needs_training(self) -> bool:
+        return self._centroids is None and not self._training and self._count >= self.train_size
+
+    def training_sample(self) -> Any:
+        """Copy of the stored vectors to fit on; marks training as started."""
+        self._training = True
+        return self._vecs[: self._count].copy()
+
+    def fit(self, data: Any) -> Any:
+        """k-means centroids for `data`; touches no index state."""
+        np = _np()
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(len(data), self.nlist, replace=False)].copy()
+        for _ in range(10):
+            assign = (data @ centroids.T).argmax(axis=1)
+            for c in range(self.nlist):
+                members = data[assign == c]
+                if len(members):
+                    mean = members.mean(axis=0)
+                    centroids[c] = mean / (np.linalg.norm(mean) or 1.0)
+        return centroids
+
+    def install(self, centroids: Any) -> None:
+        """Bucket every stored vector, including ones added while fitting."""
+        self._lists = [[] for _ in range(self.nlist)]
+        self._slot_list = {}
+        assign = (self._vecs[: self._count] @ centroids.T).argmax(axis=1)
+        for slot, c in enumerate(assign.tolist()):
+            self._lists[c].append(slot)
+            self._slot_list[slot] = c
+        self._centroids = centroids
+        self._training = False
+
+    def add(self, vec: Any) -> Tuple[int, Optional[int]]:
+        slot, evicted = super().add(vec)
+        if self._centroids is None:
+            return slot, evicted
+        if evicted is not None and evicted in self._slot_list:
+            self._lists[self._slot_list.pop(evicted)].remove(evicted)
+        c = int((self._centroids @ vec).argmax())
+        self._lists[c].append(slot)
+        self._slot_list[slot] = c
+        return slot, evicted
+
+    def search(self, vec: Any) -> Tuple[int, float]:
+        if self._centroids is None:
+            return super().search(vec)
+        np = _np()
+        probes = np.argpartition(-(self._centroids @ vec), self.nprobe - 1)[: self.nprobe]
+        slots = [s for c in probes.tolist() for s in self._lists[c]]
+        if not slots:
+            return -1, -1.0
+        candidates = np.fromiter(slots, dtype=np.int64, count=len(slots))
+        scores = self._vecs[candidates] @ vec
+        best = int(scores.argmax())
+        return int(candidates[best]), float(scores[best])
+
+
+class _Scope:
+    """One scope's index and stored answers, guarded by their own lock."""
+
+    def __init__(self, index: FlatIndex) -> None:
+        self.index = index
+        self.results: Dict[int, Tuple[float, GenResult]] = {}
+        self.lock = threading.Lock()
+
+
+class SemanticCache:
+    """Nearest-neighbour answer cache scoped by (provider, model, system).
+
+    Entries expire after ttl_s like the exact cache (0 keeps them until the
+    ring buffer overwrites them). Expired slots are zeroed on lookup so they
+    stop shadowing live neighbours. Each scope has its own lock, so a scan
+    in one scope never waits on another; self._lock only guards the scope
+    table and the hit counters.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        index_kind: str = "flat",
+        threshold: float = 0.9,
+        max_entries: int = 100000,
+        ttl_s: float = 0.0,
+    ) -> None:
+        self.embedder = embedder
+        self.index_kind = index_kind
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._scopes: Dict[Tuple[str, str, str], _Scope] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _scope(self, scope: Tuple[str, str, str]) -> _Scope:
+        state = self._scopes.get(scope)
+        if state is None:
+            with self._lock:
+                state = self._scopes.get(scope)
+                if state is None:
+                    if self.index_kind == "ivf":
+                        index: FlatIndex = IVFIndex(self.embedder.dim, self.max_entries)
+                    else:
+                        index = FlatIndex(self.embedder.dim, self.max_entries)
+                    state = self._scopes[scope] = _Scope(index)
+        return state
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def embed(self, text: str) -> Any:
+        return self.embedder.embed([text])[0]
+
+    def lookup(self, scope: Tuple[str, str, str], vec: Any) -> Optional[Tuple[GenResult, float]]:
+        state = self._scopes.get(scope)
+        if state is None:
+            # Nothing was ever stored here; don't allocate an index just to miss
+            self._count(hit=False)
+            return None
+        with state.lock:
+            slot, score = state.index.search(vec)
+            found = None
+            if slot >= 0 and score >= self.threshold:
+                expires_at, result = state.results[slot]
+                if expires_at > time.monotonic():
+                    found = result, score
+                else:
+                    state.index.remove(slot)
+                    del state.results[slot]
+        self._count(hit=found is not None)
+        return found
+
+    def add(self, scope: Tuple[str, str, str], vec: Any, result: GenResult) -> None:
+        expires_at = time.monotonic() + self.ttl_s if self.ttl_s > 0 else float("inf")
+        state = self._scope(scope)
+        index = state.index
+        with state.lock:
+            slot, _ = index.add(vec)
+            state.results[slot] = (expires_at, result)
+            sample = index.training_sample() if isinstance(index, IVFIndex) and index.needs_training() else None
+        if sample is not None:
+            # k-means takes a while; lookups keep using flat search meanwhile
+            centroids = index.fit(sample)
+            with state.lock:
+                index.install(centroids)
+
+    def size(self) -> int:
+        with self._lock:
+            scopes = list(self._scopes.values())
+        return sum(len(state.index) for state in scopes)
+
+
+def build_semantic_cache(cfg: Settings) -> SemanticCache:
+    if cfg.semantic_cache_embedder == "hashing":
+        embedder: Embedder = HashingEmbedder()
+    else:
+        embedder = SentenceTransformerEmbedder(cfg.semantic_cache_embedder)
+    return SemanticCache(
+        embedder,
+        index_kind=cfg.semantic_cache_index,
+        threshold=cfg.semantic_cache_threshold,
+        max_entries=cfg.semantic_cache_max_entries,
+        ttl_s=cfg.cache_ttl_s,
+    )
+
+
+_semantic_cache: Optional[SemanticCache] = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, or None when disabled."""
+    global _semantic_cache
+    if not get_settings().semantic_cache:
+        return None
+    if _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                _semantic_cache = build_semantic_cache(get_settings())
+                logger.info(
+                    "ai.semantic_cache.created",
+                    extra={"extra": {"index": _semantic_cache.index_kind, "threshold": _semantic_cache.threshold}},
+                )
+    return _semantic_cache
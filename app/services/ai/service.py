@@ -1,77 +1,564 @@
 from __future__ import annotations
 
+import asyncio
 import time
 import uuid
 import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from app.services.ai.providers import get_provider
+from pydantic import TypeAdapter, ValidationError
+
+from app.core.metrics import registry
+from app.core.settings import get_settings
+from app.core.tracing import span
+from app.schemas.ai import ExplainResponse
+from app.services.ai.cache import cache_aget, cache_aset, cache_key, get_cache
+from app.services.ai.jsonstream import JSONObjectStream
+from app.services.ai.prompts import CompiledPrompt, get_prompt
+from app.services.ai.providers import MAX_OUTPUT_TOKENS, AIProvider, GenResult, provider_registry
+from app.services.ai.ratelimit import BATCH, INTERACTIVE, UpstreamLimiter, get_limiter, limiter_stats
+from app.services.ai.semantic_cache import get_semantic_cache
+from app.services.ai.tokenizer import get_tokenizer
 
 logger = logging.getLogger("ai")
 
+provider_latency = registry.histogram(
+    "ai_provider_duration_seconds", "Upstream generate() latency by provider.", ("provider",)
+)
+provider_errors = registry.counter("ai_provider_errors_total", "Failed upstream calls by provider.", ("provider",))
+provider_tokens = registry.counter("ai_tokens_total", "Estimated tokens used by provider.", ("provider",))
+
+
+@dataclass
+class SingleFlightStats:
+    calls: int = 0  # upstream calls actually made
+    collapsed: int = 0  # callers that joined an in-flight call instead
+    inflight: int = 0
+
+
+class SingleFlight:
+    """Collapse concurrent identical calls onto one in-flight upstream call.
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it runs await the same task. The task is shielded so a cancelled
+    caller (e.g. a disconnected client) does not fail the others.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._calls = 0
+        self._collapsed = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[GenResult]]) -> Tuple[GenResult, bool]:
+        """Return (result, shared); shared is True when another caller's call was reused."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self._collapsed += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        self._calls += 1
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            calls=self._calls,
+            collapsed=self._collapsed,
+            inflight=len(self._inflight),
+        )
+
+
+single_flight = SingleFlight()
+
 
-def chat(prompt: str) -> dict:
-    request_id = uuid.uuid4().hex
+async def _agenerate(provider: AIProvider, system: str, user_prompt: str, priority: int = INTERACTIVE) -> GenResult:
+    """Call the provider without blocking the event loop.
+
+    Providers implementing AsyncAIProvider are awaited directly; sync-only
+    providers fall back to a worker thread. Providers that rate-limit their
+    own backends (ProviderRouter) are handed the priority lane.
+    """
+    agenerate = getattr(provider, "agenerate", None)
+    if agenerate is not None:
+        if getattr(provider, "limits_per_backend", False):
+            return await agenerate(system=system, user_prompt=user_prompt, priority=priority)
+        return await agenerate(system=system, user_prompt=user_prompt)
+    return await asyncio.to_thread(provider.generate, system=system, user_prompt=user_prompt)
+
+
+def _prompt_tokens(system: str, user_prompt: str) -> int:
+    return get_tokenizer().count_messages(system, user_prompt)
+
+
+def _limiter(provider: AIProvider) -> Optional[UpstreamLimiter]:
+    if getattr(provider, "limits_per_backend", False):
+        return None  # each backend is limited separately
+    return get_limiter(provider.name, getattr(provider, "model", ""))
+
+
+async def _agenerate_measured(
+    provider: AIProvider, system: str, user_prompt: str, priority: int = INTERACTIVE
+) -> GenResult:
     t0 = time.perf_counter()
+    try:
+        with span("provider.generate", provider=provider.name):
+            result = await _agenerate(provider, system=system, user_prompt=user_prompt, priority=priority)
+    except Exception:
+        provider_errors.labels(provider.name).inc()
+        raise
+    provider_latency.labels(result.provider).observe(time.perf_counter() - t0)
+    provider_tokens.labels(result.provider).inc(result.tokens_est)
+    return result
 
-    provider = get_provider()
-    system = "You are a helpful assistant."
-    result = provider.generate(system=system, user_prompt=prompt)
 
-    latency_ms = int((time.perf_counter() - t0) * 1000)
+async def _agenerate_limited(provider: AIProvider, system: str, user_prompt: str, priority: int) -> GenResult:
+    """_agenerate() behind the provider/model rate limiter, if one is configured.
+
+    The limiter reserves the worst case (prompt plus output ceiling) and is
+    settled with the real usage afterwards; a call that fails or is
+    cancelled is charged its prompt tokens only.
+    """
+    limiter = _limiter(provider)
+    if limiter is None:
+        return await _agenerate_measured(provider, system, user_prompt, priority)
+    prompt_tokens = _prompt_tokens(system, user_prompt)
+    estimated = prompt_tokens + MAX_OUTPUT_TOKENS
+    await limiter.acquire(estimated, priority)
+    actual = prompt_tokens
+    try:
+        result = await _agenerate_measured(provider, system, user_prompt)
+        actual = result.tokens_est
+        return result
+    finally:
+        limiter.settle(estimated, actual)
+
+
+async def _astream(provider: AIProvider, system: str, user_prompt: str) -> AsyncIterator[str]:
+    """Yield text deltas; providers without streaming yield one final chunk.
+
+    Goes through the same limiter and provider metrics as _agenerate_limited;
+    usage is settled with the prompt plus whatever output was produced,
+    also when the client disconnects mid-stream.
+    """
+    limiter = _limiter(provider)
+    tokenizer = get_tokenizer()
+    prompt_tokens = _prompt_tokens(system, user_prompt)
+    estimated = prompt_tokens + MAX_OUTPUT_TOKENS
+    if limiter is not None:
+        await limiter.acquire(estimated, INTERACTIVE)
+    chunks: List[str] = []
+    failed = False
+    t0 = time.perf_counter()
+    try:
+        generate_stream = getattr(provider, "generate_stream", None)
+        if generate_stream is not None:
+            async for chunk in generate_stream(system=system, user_prompt=user_prompt):
+                chunks.append(chunk)
+                yield chunk
+        else:
+            result = await _agenerate(provider, system=system, user_prompt=user_prompt)
+            chunks.append(result.text)
+            yield result.text
+    except Exception:
+        failed = True
+        provider_errors.labels(provider.name).inc()
+        raise
+    finally:
+        actual = prompt_tokens + tokenizer.count("".join(chunks))
+        if limiter is not None:
+            limiter.settle(estimated, actual)
+        if not failed:
+            provider_latency.labels(provider.name).observe(time.perf_counter() - t0)
+            provider_tokens.labels(provider.name).inc(actual)
 
+
+def _key(provider: AIProvider, system: str, user_prompt: str) -> str:
+    return cache_key(provider.name, getattr(provider, "model", ""), system, user_prompt)
+
+
+async def _agenerate_cached(
+    provider: AIProvider, system: str, user_prompt: str, use_cache: bool, priority: int = INTERACTIVE
+) -> Tuple[GenResult, bool]:
+    """Serve from the response cache when possible.
+
+    With use_cache=False the lookup is skipped but the fresh result is still
+    stored, so a bypassing request refreshes the entry. Misses go through
+    single-flight so a burst of identical prompts makes one upstream call.
+    """
+    cache = get_cache()
+    key = _key(provider, system, user_prompt)
+    if use_cache:
+        with span("cache.lookup", backend=cache.backend) as s:
+            hit = await cache_aget(cache, key)
+            if s is not None:
+                s.attributes["hit"] = hit is not None
+        if hit is not None:
+            return hit, True
+
+    async def call() -> GenResult:
+        result = await _agenerate_limited(provider, system, user_prompt, priority)
+        await cache_aset(cache, key, result)
+        return result
+
+    result, _ = await single_flight.do(key, call)
+    return result, False
+
+
+def _render(template: CompiledPrompt, **params: str) -> str:
+    """Render the user prompt, truncating the largest parameter if it would not fit.
+
+    Truncating a parameter rather than the rendered prompt keeps the
+    template's instructions intact. The token counts are cached, so the
+    limiter's estimate for the same prompt afterwards is a cache hit.
+    """
+    with span("prompt.render", template=template.key):
+        user_prompt = template.render(**params)
+        limit = get_settings().ai_max_input_tokens
+        if limit <= 0:
+            return user_prompt
+        tokenizer = get_tokenizer()
+        over = tokenizer.count_messages(template.system, user_prompt) - limit
+        if over <= 0:
+            return user_prompt
+        name = max(params, key=lambda n: len(params[n]))
+        original = tokenizer.count(params[name])
+        params[name] = tokenizer.truncate(params[name], original - over)
+        logger.warning(
+            "ai.prompt.truncated",
+            extra={"extra": {"template": template.key, "param": name, "tokens": original, "over": over}},
+        )
+        return template.render(**params)
+
+
+def _log(event: str, request_id: str, result: GenResult, latency_ms: int, cached: bool = False) -> None:
     logger.info(
-        "ai.chat",
+        event,
         extra={"extra": {
             "request_id": request_id,
             "provider": result.provider,
             "latency_ms": latency_ms,
             "tokens_est": result.tokens_est,
+            "cached": cached,
         }},
     )
 
+
+def _chat_payload(request_id: str, result: GenResult, latency_ms: int, cached: bool) -> dict:
     return {
         "request_id": request_id,
         "provider": result.provider,
         "latency_ms": latency_ms,
         "tokens_est": result.tokens_est,
+        "cached": cached,
         "answer": result.text,
     }
 
 
-def explain(topic: str, context: str | None = None) -> dict:
-    request_id = uuid.uuid4().hex
-    t0 = time.perf_counter()
+# Keys EXPLAIN_V1 asks the model for, and the ExplainResponse field each fills
+EXPLAIN_FIELDS = {"summary": "explanation", "risks": "risks", "next_steps": "next_steps"}
+EXPLAIN_MAX_ITEMS = 5
+_explain_validators = {
+    key: TypeAdapter(ExplainResponse.model_fields[target].annotation) for key, target in EXPLAIN_FIELDS.items()
+}
 
-    provider = get_provider()
-    system = "You are a senior software engineer. Explain clearly and concisely."
-    user_prompt = f"Topic: {topic}\nContext: {context or ''}".strip()
-    result = provider.generate(system=system, user_prompt=user_prompt)
 
-    latency_ms = int((time.perf_counter() - t0) * 1000)
+def _explain_field(key: str, value: Any) -> Any:
+    """Value validated for its ExplainResponse field, or None if the model got it wrong."""
+    validator = _explain_validators.get(key)
+    if validator is None:
+        return None
+    try:
+        value = validator.validate_python(value)
+    except ValidationError:
+        logger.warning("ai.explain.invalid_field", extra={"extra": {"field": key}})
+        return None
+    return value[:EXPLAIN_MAX_ITEMS] if isinstance(value, list) else value
 
-    logger.info(
-        "ai.explain",
-        extra={"extra": {
-            "request_id": request_id,
-            "provider": result.provider,
-            "latency_ms": latency_ms,
-            "tokens_est": result.tokens_est,
-        }},
-    )
 
+def _explain_fields(parser: JSONObjectStream, text: str) -> Tuple[dict, bool]:
+    """ExplainResponse fields from what the parser has seen; (fields, structured).
+
+    Output that is not the requested JSON, or is cut off, still produces an
+    answer: the raw text stands in for a missing summary and missing lists
+    are empty, so malformed output never costs another upstream call.
+    """
+    fields: dict = {"explanation": None, "risks": [], "next_steps": []}
+    for key, value in parser.snapshot().items():
+        value = _explain_field(key, value)
+        if value is not None:
+            fields[EXPLAIN_FIELDS[key]] = value
+    structured = fields["explanation"] is not None
+    if not structured:
+        fields["explanation"] = text.strip()
+    return fields, structured
+
+
+def _parse_explain(text: str) -> Tuple[dict, bool]:
+    parser = JSONObjectStream()
+    with span("explain.parse"):
+        parser.feed(text)
+    return _explain_fields(parser, text)
+
+
+def _explain_payload(request_id: str, result: GenResult, latency_ms: int, cached: bool) -> dict:
+    fields, structured = _parse_explain(result.text)
     return {
         "request_id": request_id,
         "provider": result.provider,
         "latency_ms": latency_ms,
         "tokens_est": result.tokens_est,
-        "explanation": result.text,
-        "risks": [
-            "Model output may be inaccurate or incomplete.",
-            "Provided context may be insufficient for the intended task.",
-        ],
-        "next_steps": [
-            "Add retries/timeouts and basic rate limiting.",
-            "Add response caching for repeated prompts.",
-            "Add eval tests for regressions (golden prompts).",
-        ],
+        "cached": cached,
+        "structured": structured,
+        **fields,
+    }
+
+
+async def _asemantic_chat(
+    provider: AIProvider, template: CompiledPrompt, prompt: str, use_cache: bool, priority: int
+) -> Tuple[GenResult, bool]:
+    """Exact cache path with a nearest-neighbour lookup in front when enabled.
+
+    The semantic index embeds the raw prompt, not the rendered template, and
+    is scoped per template version so versions never answer for each other.
+    """
+    user_prompt = _render(template, prompt=prompt)
+    semantic = get_semantic_cache()
+    if semantic is None:
+        return await _agenerate_cached(provider, template.system, user_prompt, use_cache, priority)
+
+    scope = (provider.name, getattr(provider, "model", ""), template.key)
+    # Embedding and index scans are numpy-bound; keep them off the event loop
+    vec = await asyncio.to_thread(semantic.embed, prompt)
+    if use_cache:
+        with span("semantic_cache.lookup"):
+            hit = await asyncio.to_thread(semantic.lookup, scope, vec)
+        if hit is not None:
+            return hit[0], True
+
+    result, cached = await _agenerate_cached(provider, template.system, user_prompt, use_cache, priority)
+    if not cached:
+        # Takes the index lock (and may fit IVF centroids); keep it off the loop too
+        await asyncio.to_thread(semantic.add, scope, vec, result)
+    return result, cached
+
+
+async def achat(
+    prompt: str,
+    use_cache: bool = True,
+    priority: int = INTERACTIVE,
+    request_id: Optional[str] = None,
+    template_version: Optional[int] = None,
+) -> dict:
+    request_id = request_id or uuid.uuid4().hex
+    t0 = time.perf_counter()
+
+    template = get_prompt("chat", template_version)
+    with provider_registry.use() as provider:
+        result, cached = await _asemantic_chat(provider, template, prompt, use_cache, priority)
+
+    latency_ms = int((time.perf_counter() - t0) * 1000)
+    _log("ai.chat", request_id, result, latency_ms, cached)
+    return _chat_payload(request_id, result, latency_ms, cached)
+
+
+async def aexplain(
+    topic: str,
+    context: str | None = None,
+    use_cache: bool = True,
+    request_id: Optional[str] = None,
+    template_version: Optional[int] = None,
+) -> dict:
+    request_id = request_id or uuid.uuid4().hex
+    t0 = time.perf_counter()
+
+    template = get_prompt("explain", template_version)
+    user_prompt = _render(template, topic=topic, context=context or "")
+    with provider_registry.use() as provider:
+        result, cached = await _agenerate_cached(provider, template.system, user_prompt, use_cache)
+
+    latency_ms = int((time.perf_counter() - t0) * 1000)
+    _log("ai.explain", request_id, result, latency_ms, cached)
+    return _explain_payload(request_id, result, latency_ms, cached)
+
+
+async def achat_stream(
+    prompt: str,
+    request_id: Optional[str] = None,
+    template_version: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, dict]]:
+    """Stream a chat answer as (event, data) pairs.
+
+    Emits one "chunk" event per text delta and a trailing "done" event with the
+    request id, token estimate and total latency.
+    """
+    request_id = request_id or uuid.uuid4().hex
+    t0 = time.perf_counter()
+
+    template = get_prompt("chat", template_version)
+    user_prompt = _render(template, prompt=prompt)
+    chunks: List[str] = []
+    first_chunk_ms = None
+    with provider_registry.use() as provider:
+        async for chunk in _astream(provider, system=template.system, user_prompt=user_prompt):
+            if first_chunk_ms is None:
+                first_chunk_ms = int((time.perf_counter() - t0) * 1000)
+            chunks.append(chunk)
+            yield "chunk", {"text": chunk}
+
+    latency_ms = int((time.perf_counter() - t0) * 1000)
+    tokenizer = get_tokenizer()
+    tokens_est = tokenizer.count_messages(template.system, user_prompt) + tokenizer.count("".join(chunks))
+    result = GenResult(provider=provider.name, text="", tokens_est=tokens_est)
+    _log("ai.chat.stream", request_id, result, latency_ms)
+    yield "done", {
+        "request_id": request_id,
+        "provider": provider.name,
+        "tokens_est": tokens_est,
+        "latency_ms": latency_ms,
+        "first_chunk_ms": first_chunk_ms,
     }
+
+
+async def aexplain_stream(
+    topic: str,
+    context: str | None = None,
+    request_id: Optional[str] = None,
+    template_version: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, dict]]:
+    """Stream an explanation as (event, data) pairs, parsing the JSON as it arrives.
+
+    Emits a "field" event when a top-level field is complete and an "item"
+    event for each risk or next step as soon as it is complete, so clients
+    can render partial results early. The trailing "done" event carries the
+    full validated payload, built from the same incremental parse.
+    """
+    request_id = request_id or uuid.uuid4().hex
+    t0 = time.perf_counter()
+
+    template = get_prompt("explain", template_version)
+    user_prompt = _render(template, topic=topic, context=context or "")
+    parser = JSONObjectStream()
+    chunks: List[str] = []
+    first_field_ms = None
+    with provider_registry.use() as provider:
+        async for chunk in _astream(provider, system=template.system, user_prompt=user_prompt):
+            chunks.append(chunk)
+            for key, index, value in parser.feed(chunk):
+                if index is not None:
+                    if key in ("risks", "next_steps") and isinstance(value, str) and index < EXPLAIN_MAX_ITEMS:
+                        yield "item", {"field": key, "index": index, "value": value}
+                    continue
+                value = _explain_field(key, value)
+                if value is None:
+                    continue
+                if first_field_ms is None:
+                    first_field_ms = int((time.perf_counter() - t0) * 1000)
+                yield "field", {"field": EXPLAIN_FIELDS[key], "value": value}
+
+    text = "".join(chunks)
+    fields, structured = _explain_fields(parser, text)
+    latency_ms = int((time.perf_counter() - t0) * 1000)
+    tokenizer = get_tokenizer()
+    tokens_est = tokenizer.count_messages(template.system, user_prompt) + tokenizer.count(text)
+    result = GenResult(provider=provider.name, text=text, tokens_est=tokens_est)
+    _log("ai.explain.stream", request_id, result, latency_ms)
+    yield "done", {
+        "request_id": request_id,
+        "provider": provider.name,
+        "latency_ms": latency_ms,
+        "tokens_est": tokens_est,
+        "cached": False,
+        "structured": structured,
+        "first_field_ms": first_field_ms,
+        **fields,
+    }
+
+
+async def achat_batch(
+    prompts: List[str],
+    concurrency: Optional[int] = None,
+    ordered: bool = True,
+    use_cache: bool = True,
+    template_versions: Optional[List[Optional[int]]] = None,
+) -> AsyncIterator[dict]:
+    """Run many chat prompts with bounded fan-out, yielding one item per prompt.
+
+    Items are yielded in input order when ordered=True, otherwise as they
+    complete. A failing prompt yields an error item instead of failing the
+    batch. Pending calls are cancelled if the consumer stops early.
+    template_versions, if given, pins a chat template version per prompt.
+    """
+    cfg = get_settings()
+    limit = min(concurrency or cfg.batch_concurrency, cfg.batch_max_concurrency)
+    sem = asyncio.Semaphore(max(1, limit))
+
+    versions = template_versions or [None] * len(prompts)
+
+    async def run(index: int, prompt: str) -> dict:
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                result = await achat(
+                    prompt, use_cache=use_cache, priority=BATCH, template_version=versions[index]
+                )
+            except Exception as exc:
+                logger.warning(
+                    "ai.chat.batch_item_failed",
+                    extra={"extra": {"index": index, "error": repr(exc)}},
+                )
+                return {
+                    "index": index,
+                    "ok": False,
+                    "latency_ms": int((time.perf_counter() - t0) * 1000),
+                    "error": f"{type(exc).__name__}: {exc}",
+                }
+            return {
+                "index": index,
+                "ok": True,
+                "latency_ms": int((time.perf_counter() - t0) * 1000),
+                "result": result,
+            }
+
+    tasks = [asyncio.ensure_future(run(i, p)) for i, p in enumerate(prompts)]
+    try:
+        for next_item in (tasks if ordered else asyncio.as_completed(tasks)):
+            yield await next_item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _cache_samples():
+    stats = get_cache().stats()
+    backend = get_cache().backend
+    for result, value in (("hit", stats.hits), ("miss", stats.misses)):
+        yield "ai_cache_lookups_total", {"layer": "exact", "backend": backend, "result": result}, value
+    semantic = get_semantic_cache()
+    if semantic is not None:
+        for result, value in (("hit", semantic.hits), ("miss", semantic.misses)):
+            yield "ai_cache_lookups_total", {"layer": "semantic", "backend": semantic.index_kind, "result": result}, value
+
+
+def _singleflight_samples():
+    stats = single_flight.stats()
+    yield "ai_singleflight_calls_total", {"outcome": "upstream"}, stats.calls
+    yield "ai_singleflight_calls_total", {"outcome": "collapsed"}, stats.collapsed
+
+
+def _ratelimit_samples():
+    for stats in limiter_stats():
+        yield "ai_ratelimit_queue_depth", {"key": stats.key}, stats.queue_depth
+
+
+registry.register_collector(
+    "ai_cache_lookups_total", "counter", "Response cache lookups by layer and result.", _cache_samples
+)
+registry.register_collector(
+    "ai_singleflight_calls_total", "counter", "Calls that went upstream vs joined an in-flight call.", _singleflight_samples
+)
+registry.register_collector(
+    "ai_ratelimit_queue_depth", "gauge", "Calls waiting in the upstream rate limiter.", _ratelimit_samples
+)
@@ -0,0 +1,146 @@
+"""State shared by the workers of a multi-worker server (see app.serve).
+
+A sidecar process hosts one SharedState, served by a multiprocessing
+manager on a Unix socket. Workers reach it through a proxy, so the response
+cache and the upstream rate-limit buckets are global to the host instead of
+per process. Each call is one local socket round trip.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from multiprocessing.managers import BaseManager
+from typing import Dict, Optional, Tuple
+
+from app.core.settings import get_settings
+from app.services.ai.cache import CacheStats, MemoryCache
+from app.services.ai.providers import GenResult
+from app.services.ai.ratelimit import RateBuckets
+
+
+class SharedState:
+    """Lives in the sidecar; the manager calls it from one thread per worker connection."""
+
+    def __init__(self, cache_max_entries: int, cache_ttl_s: float) -> None:
+        self._cache = MemoryCache(max_entries=cache_max_entries, ttl_s=cache_ttl_s)
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, int, int], RateBuckets] = {}
+
+    def cache_get(self, key: str) -> Optional[GenResult]:
+        return self._cache.get(key)
+
+    def cache_set(self, key: str, result: GenResult) -> None:
+        self._cache.set(key, result)
+
+    def cache_stats(self) -> CacheStats:
+        return self._cache.stats()
+
+    def _bucket(self, key: str, rpm: int, tpm: int) -> RateBuckets:
+        buckets = self._buckets.get((key, rpm, tpm))
+        if buckets is None:
+            buckets = self._buckets[(key, rpm, tpm)] = RateBuckets(rpm=rpm, tpm=tpm)
+        return buckets
+
+    def wait_time(self, key: str, rpm: int, tpm: int, tokens: int, calls_ahead: int, tokens_ahead: int) -> float:
+        with self._lock:
+            return self._bucket(key, rpm, tpm).wait_time(tokens, calls_ahead, tokens_ahead)
+
+    def reserve(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        with self._lock:
+            return self._bucket(key, rpm, tpm).reserve(tokens)
+
+    def adjust(self, key: str, rpm: int, tpm: int, tokens: int) -> None:
+        with self._lock:
+            self._bucket(key, rpm, tpm).adjust(tokens)
+
+
+class StateManager(BaseManager):
+    pass
+
+
+_state: Optional[SharedState] = None
+
+
+def _get_state() -> SharedState:
+    assert _state is not None, "only called inside the sidecar"
+    return _state
+
+
+def _init_sidecar(cache_max_entries: int, cache_ttl_s: float) -> None:
+    global _state
+    _state = SharedState(cache_max_entries, cache_ttl_s)
+
+
+StateManager.register("state", callable=_get_state)
+
+
+def start_sidecar(address: str, authkey: bytes, cache_max_entries: int, cache_ttl_s: float) -> StateManager:
+    """Start the sidecar process serving SharedState on a Unix socket."""
+    manager = StateManager(address=address, authkey=authkey)
+    manager.start(initializer=_init_sidecar, initargs=(cache_max_entries, cache_ttl_s))
+    return manager
+
+
+_proxy: Optional[Tuple[int, SharedState]] = None
+_proxy_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedState:
+    """Proxy to the sidecar's SharedState, connected lazily once per process."""
+    global _proxy
+    proxy = _proxy
+    # A proxy inherited across fork() shares its socket with the parent; reconnect
+    if proxy is None or proxy[0] != os.getpid():
+        with _proxy_lock:
+            proxy = _proxy
+            if proxy is None or proxy[0] != os.getpid():
+                cfg = get_settings()
+                if not cfg.shared_state_address:
+                    raise RuntimeError("SHARED_STATE_ADDRESS is not set; start the server with app.serve")
+                manager = StateManager(address=cfg.shared_state_address, authkey=cfg.shared_state_authkey.encode())
+                manager.connect()
+                proxy = _proxy = (os.getpid(), manager.state())
+    return proxy[1]
+
+
+class SharedCache:
+    """ResponseCache backed by the sidecar's LRU; hits and stats are host-wide."""
+
+    backend = "shared"
+    # every call is a socket round trip to the sidecar
+    blocking = True
+
+    def get(self, key: str) -> Optional[GenResult]:
+        return get_shared_state().cache_get(key)
+
+    def set(self, key: str, result: GenResult) -> None:
+        get_shared_state().cache_set(key, result)
+
+    def stats(self) -> CacheStats:
+        return get_shared_state().cache_stats()
+
+    def close(self) -> None:
+        pass
+
+
+class SharedBuckets(RateBuckets):
+    """RateBuckets whose state lives in the sidecar, so limits hold across workers."""
+
+    # every call is a socket round trip to the sidecar
+    blocking = True
+
+    def __init__(self, key: str, rpm: int, tpm: int) -> None:
+        self._key = key
+        self._rpm = rpm
+        self._tpm = tpm
+
+    def wait_time(self, tokens: int, calls_ahead: int = 0, tokens_ahead: int = 0) -> float:
+        return get_shared_state().wait_time(self._key, self._rpm, self._tpm, tokens, calls_ahead, tokens_ahead)
+
+    def reserve(self, tokens: int) -> float:
+        return get_shared_state().reserve(self._key, self._rpm, self._tpm, tokens)
+
+    def adjust(self, tokens: int) -> None:
+        if tokens:
+            get_shared_state().adjust(self._key, self._rpm, self._tpm, tokens)
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import functools
+import logging
+import re
+import threading
+from typing import List, Optional, Protocol, Sequence
+
+from app.core.settings import Settings, get_settings
+
+logger = logging.getLogger("ai")
+
+# Chat framing per message (role and separators) plus the reply primer,
+# as counted by OpenAI's chat models
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+# cl100k/o200k-style pre-tokenizer with the stdlib re module: contractions,
+# letter runs with one leading non-letter, up to 3 digits, punctuation runs
+# and whitespace
+_PRETOKENIZE = re.compile(
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+)
+
+
+class TokenCounter(Protocol):
+    name: str
+
+    def count(self, text: str) -> int: ...
+
+    def truncate(self, text: str, max_tokens: int) -> str: ...
+
+
+class EstimatingCounter:
+    """Offline approximation of a byte-level BPE tokenizer.
+
+    Splits text the way the GPT pre-tokenizer does and prices each piece:
+    common words are one token, long words and punctuation runs a few, CJK
+    roughly one token per character. Typically within ~10% of the real
+    count for English prose and code, which is what budgeting needs.
+    """
+
+    name = "estimate"
+
+    @staticmethod
+    def _piece_cost(piece: str) -> int:
+        if piece.isascii():
+            word = piece.strip()
+            if not word:
+                return 1
+            if word[-1].isalpha():
+                return 1 + (len(word) - 1) // 8
+            return (len(word) + 1) // 2 if not word[0].isdigit() else 1
+        wide = sum(1 for c in piece if ord(c) >= 0x2E80)
+        return wide + (len(piece) - wide + 2) // 3
+
+    def _pieces(self, text: str) -> List[str]:
+        return _PRETOKENIZE.findall(text)
+
+    def count(self, text: str) -> int:
+        return sum(self._piece_cost(piece) for piece in self._pieces(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        used = 0
+        end = 0
+        for match in _PRETOKENIZE.finditer(text):
+            used += self._piece_cost(match.group())
+            if used > max_tokens:
+                break
+            end = match.end()
+        return text[:end]
+
+
+class TiktokenCounter:
+    """Exact counts with tiktoken's BPE vocabulary."""
+
+    name = "tiktoken"
+
+    def __init__(self, encoding: str) -> None:
+        import tiktoken  # optional dependency
+
+        # Loads (and on first use downloads) the vocabulary; point
+        # TIKTOKEN_CACHE_DIR at a directory holding it to run offline
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode_ordinary(text))
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [len(tokens) for tokens in self._encoding.encode_ordinary_batch(list(texts))]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self._encoding.encode_ordinary(text)
+        if len(tokens) <= max_tokens:
+            return text
+        # Dropping a partial multi-byte character at the cut is fine here
+        return self._encoding.decode(tokens[:max_tokens], errors="ignore")
+
+
+class Tokenizer:
+    """Token counting for budgeting, with an LRU cache in front.
+
+    System prompts, templates and hot prompts repeat across requests, so
+    counts are memoized per text. Texts longer than cache_max_chars are
+    counted without caching; they rarely repeat and would crowd out the
+    short ones.
+    """
+
+    def __init__(self, counter: TokenCounter, cache_entries: int = 4096, cache_max_chars: int = 4096) -> None:
+        self.counter = counter
+        self.name = counter.name
+        self.cache_max_chars = cache_max_chars
+        self._cached_count = functools.lru_cache(maxsize=cache_entries)(counter.count)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if len(text) > self.cache_max_chars:
+            return self.counter.count(text)
+        return self._cached_count(text)
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        """Counts for many texts; uncached long texts are encoded in one batch when supported."""
+        count_batch = getattr(self.counter, "count_batch", None)
+        long_texts = [t for t in texts if len(t) > self.cache_max_chars]
+        if count_batch is None or len(long_texts) < 2:
+            return [self.count(t) for t in texts]
+        long_counts = iter(count_batch(long_texts))
+        return [next(long_counts) if len(t) > self.cache_max_chars else self.count(t) for t in texts]
+
+    def count_messages(self, system: str, user_prompt: str) -> int:
+        """Prompt tokens for a system + user message pair, including chat framing."""
+        return self.count(system) + self.count(user_prompt) + 2 * TOKENS_PER_MESSAGE + TOKENS_PER_REPLY
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of text that fits in max_tokens."""
+        if max_tokens <= 0:
+            return ""
+        return self.counter.truncate(text, max_tokens)
+
+    def cache_info(self):
+        return self._cached_count.cache_info()
+
+
+def build_tokenizer(cfg: Settings) -> Tokenizer:
+    kind = cfg.tokenizer.lower()
+    counter: Optional[TokenCounter] = None
+    if kind in ("auto", "tiktoken"):
+        try:
+            counter = TiktokenCounter(cfg.tokenizer_encoding)
+        except Exception:
+            # Not installed, unknown encoding or vocabulary not downloadable
+            if kind == "tiktoken":
+                raise RuntimeError(f"tiktoken encoding {cfg.tokenizer_encoding!r} is unavailable")
+            logger.warning(
+                "ai.tokenizer.fallback",
+                extra={"extra": {"encoding": cfg.tokenizer_encoding, "tokenizer": "estimate"}},
+            )
+    elif kind != "estimate":
+        raise RuntimeError(f"Unknown TOKENIZER={cfg.tokenizer}")
+    return Tokenizer(counter or EstimatingCounter(), cache_entries=cfg.tokenizer_cache_entries)
+
+
+_tokenizer: Optional[Tokenizer] = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer() -> Tokenizer:
+    """Return the process-wide tokenizer, built on first use."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                _tokenizer = build_tokenizer(get_settings())
+                logger.info("ai.tokenizer.created", extra={"extra": {"tokenizer": _tokenizer.name}})
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count(text)
@@ -0,0 +1,280 @@
+"""Fixed-rate load test for app.main:app against the stub provider.
+
+Drives /ai/chat, /ai/explain, / and /health at a fixed request rate
+(open loop, so a slow server cannot slow the arrival rate) with a cap on
+concurrent requests, then reports throughput and latency percentiles per
+endpoint as JSON. Pass --baseline to print the change against an earlier
+run, e.g. from the previous commit. Needs httpx, which the app itself
+does not depend on.
+
+Usage:
+    python -m benchmarks.loadtest --rps 200 --duration 10 --stub-delay-ms 50 --out run.json
+    python -m benchmarks.loadtest --mode uvicorn --workers 1 --rps 500 --baseline run.json
+    python -m benchmarks.loadtest --mode serve --workers 4 --rps 1000
+    python -m benchmarks.loadtest --no-unique-prompts   # cache-warm: repeats one prompt
+
+Prompts are unique by default, so every AI call goes to the provider;
+--no-unique-prompts measures the response cache instead and the report
+labels those numbers as cache-warm.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+ENDPOINTS = {
+    "chat": ("POST", "/ai/chat"),
+    "explain": ("POST", "/ai/explain"),
+    "root": ("GET", "/"),
+    "health": ("GET", "/health"),
+}
+
+
+@dataclass
+class EndpointResult:
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[str, int] = field(default_factory=dict)
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _body(name: str, seq: int, unique: bool) -> Optional[Dict[str, Any]]:
+    suffix = f" #{seq}" if unique else ""
+    if name == "chat":
+        return {"prompt": f"What is vibe coding?{suffix}"}
+    if name == "explain":
+        return {"topic": f"vibe coding{suffix}", "context": "load test"}
+    return None
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+@asynccontextmanager
+async def _inprocess_client() -> AsyncIterator[httpx.AsyncClient]:
+    from app.main import app
+
+    # Per-request access logs would compete with the load for the event loop
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # ASGITransport does not run lifespan events; drive them ourselves
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+
+
+@asynccontextmanager
+async def _server_client(mode: str, port: int, workers: int, limit: int) -> AsyncIterator[httpx.AsyncClient]:
+    if mode == "serve":
+        # Pre-fork launcher with the shared cache/rate-limit sidecar
+        cmd = [
+            sys.executable, "-m", "app.serve", "--port", str(port),
+            "--workers", str(workers), "--log-level", "WARNING",
+        ]
+    else:
+        cmd = [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        limits = httpx.Limits(max_connections=limit, max_keepalive_connections=limit)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/health")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not become ready")
+            yield client
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+async def _drive(
+    client: httpx.AsyncClient,
+    endpoints: List[str],
+    rps: float,
+    duration_s: float,
+    concurrency: int,
+    unique: bool,
+    first_seq: int = 0,
+) -> Tuple[Dict[str, EndpointResult], float, int]:
+    results = {name: EndpointResult() for name in endpoints}
+    sem = asyncio.Semaphore(concurrency)
+    skipped = 0
+    tasks: List[asyncio.Task] = []
+
+    async def one(name: str, seq: int) -> None:
+        method, path = ENDPOINTS[name]
+        result = results[name]
+        status = "error"
+        t0 = time.perf_counter()
+        try:
+            resp = await client.request(method, path, json=_body(name, seq, unique))
+            status = str(resp.status_code)
+            if resp.status_code >= 400:
+                result.errors += 1
+        except Exception as exc:
+            status = type(exc).__name__
+            result.errors += 1
+        finally:
+            sem.release()
+        result.latencies_ms.append((time.perf_counter() - t0) * 1000)
+        result.statuses[status] = result.statuses.get(status, 0) + 1
+
+    interval = 1.0 / rps
+    start = time.perf_counter()
+    for seq, name in zip(itertools.count(), itertools.cycle(endpoints)):
+        due = start + seq * interval
+        if due - start >= duration_s:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if sem.locked():
+            # At the concurrency cap: count the miss instead of queueing, so
+            # arrivals stay on schedule
+            skipped += 1
+            continue
+        await sem.acquire()
+        tasks.append(asyncio.ensure_future(one(name, first_seq + seq)))
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - start, skipped
+
+
+def _summarize(results: Dict[str, EndpointResult], elapsed_s: float) -> Dict[str, Dict[str, Any]]:
+    summary = {}
+    for name, result in results.items():
+        ordered = sorted(result.latencies_ms)
+        summary[name] = {
+            "requests": len(ordered),
+            "errors": result.errors,
+            "statuses": result.statuses,
+            "throughput_rps": round(len(ordered) / elapsed_s, 2),
+            "p50_ms": round(_percentile(ordered, 50), 2),
+            "p90_ms": round(_percentile(ordered, 90), 2),
+            "p99_ms": round(_percentile(ordered, 99), 2),
+            "max_ms": round(ordered[-1], 2) if ordered else 0.0,
+        }
+    return summary
+
+
+def _compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Dict[str, str]]:
+    """Relative change per endpoint metric; positive latency deltas are regressions."""
+    diff: Dict[str, Dict[str, str]] = {}
+    for name, stats in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            continue
+        diff[name] = {}
+        for metric in ("throughput_rps", "p50_ms", "p99_ms"):
+            if base[metric]:
+                change = (stats[metric] - base[metric]) / base[metric] * 100
+                diff[name][metric] = f"{change:+.1f}%"
+    return diff
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.mode in ("uvicorn", "serve"):
+        client_cm = _server_client(args.mode, args.port, args.workers, args.concurrency)
+    else:
+        client_cm = _inprocess_client()
+    # Measured prompts must not repeat the warm-up's, or they would hit the cache
+    warmup_requests = int(args.rps * args.warmup_s) + 1
+    async with client_cm as client:
+        if args.warmup_s > 0:
+            await _drive(client, args.endpoints, args.rps, args.warmup_s, args.concurrency, args.unique_prompts)
+        results, elapsed, skipped = await _drive(
+            client, args.endpoints, args.rps, args.duration, args.concurrency, args.unique_prompts,
+            first_seq=warmup_requests,
+        )
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "mode": args.mode,
+            "workers": args.workers if args.mode != "inprocess" else 1,
+            "target_rps": args.rps,
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "stub_delay_ms": args.stub_delay_ms,
+            "unique_prompts": args.unique_prompts,
+            "prompts": "unique" if args.unique_prompts else "repeated (cache-warm)",
+        },
+        "elapsed_s": round(elapsed, 3),
+        "skipped_at_concurrency_cap": skipped,
+        "endpoints": _summarize(results, elapsed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn", "serve"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="server workers (uvicorn and serve modes)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rps", type=float, default=200)
+    parser.add_argument("--duration", type=float, default=10, help="seconds of measured load")
+    parser.add_argument("--warmup-s", type=float, default=1)
+    parser.add_argument("--concurrency", type=int, default=256, help="max requests in flight")
+    parser.add_argument("--stub-delay-ms", type=int, default=50, help="synthetic provider latency")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument(
+        "--unique-prompts", action=argparse.BooleanOptionalAction, default=True,
+        help="vary prompts so every AI call misses the response cache (default); "
+        "--no-unique-prompts repeats one prompt and measures cache hits",
+    )
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    # Settings are read from the environment, so configure the stub before
+    # the app is imported (in-process) or spawned (uvicorn)
+    os.environ["AI_PROVIDER"] = "stub"
+    os.environ["STUB_DELAY_MS"] = str(args.stub_delay_ms)
+
+    report = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["vs_baseline"] = _compare(report, json.load(f))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Per-record logging overhead on the calling thread: sync StreamHandler vs async writer.
+
+Records go to /dev/null through a sink that adds --write-us of blocking per
+write, approximating a stdout pipe drained by a container log collector.
+
+Usage:
+    python -m benchmarks.logging_overhead --records 100000 --out logging.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from typing import Dict, List
+
+from app.core.logging import AsyncQueueHandler, JsonFormatter
+
+
+def _record_extra(i: int) -> Dict[str, object]:
+    # Same shape as the http.request line from request_logging_middleware
+    return {
+        "extra": {
+            "request_id": f"{i:032x}",
+            "method": "POST",
+            "path": "/ai/chat",
+            "query": "",
+            "status_code": 200,
+            "latency_ms": 12,
+            "client": "127.0.0.1",
+        }
+    }
+
+
+class SlowSink:
+    """Stand-in for a stdout pipe that blocks briefly on every write."""
+
+    def __init__(self, target, write_us: float) -> None:
+        self.target = target
+        self.write_s = write_us / 1e6
+
+    def write(self, text: str) -> int:
+        t_end = time.perf_counter() + self.write_s
+        while time.perf_counter() < t_end:
+            pass
+        return self.target.write(text)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+
+def run(mode: str, records: int, sink) -> Dict[str, float]:
+    logger = logging.getLogger(f"bench.{mode}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    if mode == "async":
+        handler: logging.Handler = AsyncQueueHandler(sink, queue_size=records + 1)
+    else:
+        handler = logging.StreamHandler(sink)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+
+    samples: List[float] = []
+    t_start = time.perf_counter()
+    for i in range(records):
+        t0 = time.perf_counter()
+        logger.info("http.request", extra=_record_extra(i))
+        samples.append((time.perf_counter() - t0) * 1e6)
+    caller_s = time.perf_counter() - t_start
+    handler.close()
+    drained_s = time.perf_counter() - t_start
+    logger.removeHandler(handler)
+
+    samples.sort()
+    return {
+        "mode": mode,
+        "records": records,
+        "caller_us_mean": round(statistics.fmean(samples), 2),
+        "caller_us_p50": round(samples[len(samples) // 2], 2),
+        "caller_us_p99": round(samples[int(len(samples) * 0.99)], 2),
+        "caller_total_s": round(caller_s, 3),
+        "drained_total_s": round(drained_s, 3),
+        "dropped": getattr(handler, "dropped", 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--write-us", type=float, default=20.0, help="simulated cost of one stream write")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        sink = SlowSink(devnull, args.write_us)
+        results = [run(mode, args.records, sink) for mode in ("sync", "async")]
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
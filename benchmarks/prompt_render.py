@@ -0,0 +1,58 @@
+"""Prompt rendering micro-benchmark: compiled templates vs str.format.
+
+Usage:
+    python -m benchmarks.prompt_render --number 200000 --out prompt_render.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+from typing import Dict
+
+from app.services.ai.prompts import CHAT_V1, EXPLAIN_V1, get_prompt
+
+CASES = {
+    "chat": (CHAT_V1, {"prompt": "What is vibe coding and why does it matter?"}),
+    "explain": (EXPLAIN_V1, {"topic": "vibe coding", "context": "a FastAPI service calling an LLM"}),
+}
+
+
+def _ns_per_op(fn, number: int, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e9
+
+
+def run(number: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, (template, params) in CASES.items():
+        compiled = get_prompt(template.name, template.version)
+        assert compiled.render(**params) == template.template.format(**params)
+        fmt = template.template.format
+        format_ns = _ns_per_op(lambda: fmt(**params), number, repeat)
+        compiled_ns = _ns_per_op(lambda: compiled.render(**params), number, repeat)
+        results[name] = {
+            "str_format_ns": round(format_ns, 1),
+            "compiled_ns": round(compiled_ns, 1),
+            "speedup": round(format_ns / compiled_ns, 2),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200000, help="renders per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs; the fastest is reported")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.number, args.repeat)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
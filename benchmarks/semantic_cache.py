@@ -0,0 +1,127 @@
+"""Semantic cache benchmark: hit rate and lookup latency at 100k entries.
+
+Usage:
+    python -m benchmarks.semantic_cache --entries 100000 --queries 2000 --out semantic_cache.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from app.services.ai.providers import GenResult
+from app.services.ai.semantic_cache import HashingEmbedder, SemanticCache
+
+SCOPE = ("stub", "", "system")
+# Rephrasings that ask the same thing; each should hit the stored topic
+FRAMINGS = ["what is {}?", "explain {}", "tell me about {}", "{}", "can you explain {}", "describe {} please"]
+# Near misses: lexically close prompts with different answers; none may hit
+NEAR_MISSES = [
+    ("convert celsius to fahrenheit", "convert fahrenheit to celsius"),
+    ("python faster than java", "java faster than python"),
+    ("How do I install numpy?", "Why do I install numpy?"),
+    ("Can you delete the branch", "Should you delete the branch"),
+    ("is it safe", "it is safe"),
+    ("is it safe to rebase", "is it not safe to rebase"),
+    ("how does tcp work", "how does udp work"),
+    ("should I use tabs", "should I not use tabs"),
+]
+
+
+def _vocab(rng: random.Random, size: int = 20000) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(index_kind: str, entries: int, queries: int, threshold: float, seed: int = 0) -> Dict[str, float]:
+    rng = random.Random(seed)
+    vocab = _vocab(rng)
+    topics = [" ".join(rng.sample(vocab, rng.randint(2, 4))) for _ in range(entries)]
+
+    embedder = HashingEmbedder()
+    cache = SemanticCache(embedder, index_kind=index_kind, threshold=threshold, max_entries=entries)
+
+    t0 = time.perf_counter()
+    vecs = embedder.embed([rng.choice(FRAMINGS).format(t) for t in topics])
+    embed_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i, vec in enumerate(vecs):
+        cache.add(SCOPE, vec, GenResult(provider="stub", text=str(i), tokens_est=1))
+    insert_s = time.perf_counter() - t0
+
+    # Half the queries rephrase a stored topic, half are unseen topics
+    lookups: List[float] = []
+    true_hits = false_hits = 0
+    half = queries // 2
+    for q in range(queries):
+        if q < half:
+            target = rng.randrange(entries)
+            text = rng.choice(FRAMINGS).format(topics[target])
+        else:
+            target = -1
+            text = rng.choice(FRAMINGS).format(" ".join(rng.sample(vocab, 3)))
+        vec = cache.embed(text)
+        t0 = time.perf_counter()
+        hit = cache.lookup(SCOPE, vec)
+        lookups.append((time.perf_counter() - t0) * 1000)
+        if hit is not None:
+            if q < half and hit[0].text == str(target):
+                true_hits += 1
+            else:
+                false_hits += 1
+
+    # Near misses: fixed pairs in their own scope, plus stored topics asked
+    # with their words reversed (same bag of words, different order)
+    near_scope = ("stub", "", "near-miss")
+    for i, (stored, _) in enumerate(NEAR_MISSES):
+        cache.add(near_scope, cache.embed(stored), GenResult(provider="stub", text=f"near{i}", tokens_est=1))
+    near_false_hits = sum(cache.lookup(near_scope, cache.embed(query)) is not None for _, query in NEAR_MISSES)
+    reordered = [t for t in rng.sample(topics, min(half, entries)) if len(t.split()) > 1]
+    reorder_false_hits = sum(
+        cache.lookup(SCOPE, cache.embed(" ".join(reversed(t.split())))) is not None for t in reordered
+    )
+
+    return {
+        "index": index_kind,
+        "entries": entries,
+        "threshold": threshold,
+        "embed_us_per_entry": round(embed_s / entries * 1e6, 2),
+        "insert_us_per_entry": round(insert_s / entries * 1e6, 2),
+        "hit_rate_paraphrase": round(true_hits / max(1, half), 4),
+        "false_hit_rate": round(false_hits / max(1, queries), 4),
+        "near_miss_false_hits": f"{near_false_hits}/{len(NEAR_MISSES)}",
+        "reordered_false_hit_rate": round(reorder_false_hits / max(1, len(reordered)), 4),
+        "lookup_ms_p50": round(statistics.median(lookups), 3),
+        "lookup_ms_p99": round(_percentile(lookups, 99), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--index", choices=["flat", "ivf", "both"], default="both")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    kinds = ["flat", "ivf"] if args.index == "both" else [args.index]
+    results = [run(kind, args.entries, args.queries, args.threshold) for kind in kinds]
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Cold-start import budget for app.main.
+
+Imports app.main in fresh interpreters and checks the result against an
+import-time budget, so a change that makes cold starts (and so
+autoscaling) slower fails loudly instead of creeping in:
+
+- the median wall time of `import app.main` must stay under --budget-ms;
+- with --baseline, it must not grow by more than --max-regression over an
+  earlier run (e.g. from the previous commit), which holds on any machine;
+- modules that are meant to load lazily (provider SDKs, optional backends)
+  must not be imported by app.main at all.
+
+Exits 1 when a check fails, so it can gate CI. Also writes the per-package
+breakdown from -X importtime to find what to make lazy next.
+
+Usage:
+    python -m benchmarks.startup --out startup.json
+    python -m benchmarks.startup --baseline startup.json --max-regression 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+from typing import Any, Dict, List
+
+from app.core.importtime import loaded_modules, measure_import_ms, profile_imports
+
+MODULE = "app.main"
+
+# Generous for a laptop or CI runner; FastAPI and pydantic alone take ~400 ms
+DEFAULT_BUDGET_MS = 1000.0
+
+# Loaded on first use only; importing any of these from app.main is a regression
+LAZY_MODULES = (
+    "openai",
+    "httpx",
+    "tiktoken",
+    "numpy",
+    "sentence_transformers",
+    "sqlite3",
+    "urllib.request",
+    "multiprocessing",
+    "uvicorn",
+    "app.services.ai.router",
+    "app.services.ai.shared",
+)
+
+
+def run(runs: int, top: int) -> Dict[str, Any]:
+    wall_ms = measure_import_ms(MODULE, runs=runs)
+    profile = profile_imports(MODULE)
+    loaded = set(loaded_modules(MODULE))
+    return {
+        "module": MODULE,
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "wall_ms": {
+            "median": round(statistics.median(wall_ms), 1),
+            "min": round(min(wall_ms), 1),
+            "max": round(max(wall_ms), 1),
+        },
+        "importtime_ms": round(profile.total_us / 1000, 1),
+        "own_ms": round(profile.own_us / 1000, 1),
+        "modules": len(profile.records),
+        "by_package_ms": {k: round(v / 1000, 1) for k, v in list(profile.by_package().items())[:top]},
+        "eager": sorted(m for m in LAZY_MODULES if m in loaded),
+    }
+
+
+def check(report: Dict[str, Any], budget_ms: float, baseline: Dict[str, Any] | None, max_regression: float) -> List[str]:
+    failures = []
+    median = report["wall_ms"]["median"]
+    if budget_ms and median > budget_ms:
+        failures.append(f"import {MODULE} took {median} ms (median), over the {budget_ms} ms budget")
+    if baseline is not None:
+        allowed = baseline["wall_ms"]["median"] * (1 + max_regression)
+        if median > allowed:
+            failures.append(
+                f"import {MODULE} took {median} ms (median), more than {max_regression:.0%} over "
+                f"the baseline's {baseline['wall_ms']['median']} ms"
+            )
+    if report["eager"]:
+        failures.append(f"import {MODULE} eagerly loads {', '.join(report['eager'])}; import them on first use")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7, help="fresh interpreters to time; the median is checked")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="0 disables the absolute budget")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed growth over --baseline")
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the breakdown")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    report = run(args.runs, args.top)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    failures = check(report, args.budget_ms, baseline, args.max_regression)
+    report["failures"] = failures
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Concurrency and resilience of the AI service, against the stub providers only."""
+
+import asyncio
+import time
+
+import pytest
+
+from app.core.settings import reload_settings
+from app.services.ai import service
+from app.services.ai.providers import FaultyStubProvider
+from app.services.ai.resilience import CircuitOpenError, ProviderUnavailableError, ResilienceConfig, ResilientProvider
+
+STUB_DELAY_MS = 200
+
+
+@pytest.fixture
+def stub_settings(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    monkeypatch.setenv("AI_BACKENDS", "")
+    monkeypatch.setenv("STUB_DELAY_MS", str(STUB_DELAY_MS))
+    monkeypatch.setenv("TOKENIZER", "estimate")
+    monkeypatch.setenv("SEMANTIC_CACHE", "0")
+    monkeypatch.setenv("AI_RPM", "0")
+    monkeypatch.setenv("AI_TPM", "0")
+    yield reload_settings()
+    monkeypatch.undo()
+    reload_settings()
+
+
+class CountingFaultyStub(FaultyStubProvider):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.calls = 0
+
+    async def agenerate(self, system: str, user_prompt: str):
+        self.calls += 1
+        return await super().agenerate(system, user_prompt)
+
+
+def _resilient(inner, **overrides) -> ResilientProvider:
+    config = ResilienceConfig(backoff_base_s=0.001, backoff_max_s=0.001, **overrides)
+    return ResilientProvider(inner, config)
+
+
+def test_concurrent_chats_overlap(stub_settings):
+    n = 20
+
+    async def run():
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(service.achat(f"question {i}", use_cache=False) for i in range(n)))
+        return results, time.perf_counter() - t0
+
+    results, elapsed = asyncio.run(run())
+    assert len(results) == n
+    assert all(r["provider"] == "stub" for r in results)
+    # Serialized calls would take n delays; overlapping ones take about one
+    assert STUB_DELAY_MS / 1000 <= elapsed < 3 * STUB_DELAY_MS / 1000
+
+
+def test_breaker_opens_after_consecutive_failures():
+    inner = CountingFaultyStub(failure_rate=1.0)
+    provider = _resilient(inner, max_attempts=1, breaker_failures=3, breaker_reset_s=60)
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(ProviderUnavailableError):
+                await provider.agenerate("system", "prompt")
+        with pytest.raises(CircuitOpenError):
+            await provider.agenerate("system", "prompt")
+
+    asyncio.run(run())
+    assert provider.breaker.state == "open"
+    assert inner.calls == 3  # the refused call never reached upstream
+
+
+def test_retries_stay_within_budget():
+    inner = CountingFaultyStub(failure_rate=1.0)
+    provider = _resilient(inner, max_attempts=3, retry_budget_ratio=0.0, breaker_failures=1000)
+    initial_tokens = provider.budget.max_tokens
+    n = 20
+
+    async def run():
+        for _ in range(n):
+            with pytest.raises(ProviderUnavailableError):
+                await provider.agenerate("system", "prompt")
+
+    asyncio.run(run())
+    # Unbudgeted, every call would make max_attempts attempts
+    assert inner.calls == n + initial_tokens
+    assert inner.calls < n * provider.config.max_attempts
+
+
+def test_cancelled_probe_is_released():
+    inner = FaultyStubProvider(hang_rate=1.0, hang_s=60)
+    provider = _resilient(inner, breaker_failures=1, breaker_reset_s=0.05)
+    provider.breaker.record_failure()
+    assert provider.breaker.state == "open"
+
+    async def run():
+        await asyncio.sleep(0.06)
+        assert provider.breaker.state == "half_open"
+        probe = asyncio.ensure_future(provider.agenerate("system", "prompt"))
+        await asyncio.sleep(0.01)
+        # The hanging probe holds the only half-open slot
+        with pytest.raises(CircuitOpenError):
+            await provider.agenerate("system", "prompt")
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(run())
+    # The next caller gets to probe instead of being refused forever
+    assert provider.breaker.before_call() is True
+
@@ -0,0 +1,263 @@
+"""JSON 接口：单条的增删改查、批量新建、切换、删除，以及流式导入。
+
+读接口带 ETag。ETag 由数据库的数据版本号生成（见 caching.py），客户端带
+If-None-Match 轮询时，数据没变就直接返回 304，不查表也不序列化。
+"""
+
+import codecs
+import csv
+import json
+from typing import Callable, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from pydantic import ValidationError
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from caching import current_etag, etag_matches, not_modified
+from crud import MAX_PAGE_SIZE, PAGE_SIZE, create_todos, delete_todos, list_todos, toggle_todos, update_todo
+from database import engine, write_session
+from models import (
+    BulkCreate,
+    BulkIds,
+    BulkResult,
+    ImportResult,
+    Todo,
+    TodoCreate,
+    TodoList,
+    TodoRead,
+    TodoUpdate,
+)
+
+router = APIRouter(prefix="/api/todos", tags=["api"])
+
+# 导入时每攒够这么多行就在一个事务里写入；写锁只在写入这一批时持有，
+# 上传慢的客户端不会长时间挡住其他写请求
+IMPORT_BATCH_SIZE = 1000
+# 导入结果里最多列出的错误条数
+MAX_IMPORT_ERRORS = 20
+
+TRUE_VALUES = {"1", "true", "yes", "y", "是", "已完成"}
+FALSE_VALUES = {"", "0", "false", "no", "n", "否", "未完成"}
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"}
+
+
+def _set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    # 允许缓存，但每次使用前都要带 If-None-Match 回来确认
+    response.headers["Cache-Control"] = "no-cache"
+
+
+@router.get("", response_model=TodoList)
+def read_todos(
+    request: Request,
+    response: Response,
+    status: str = Query("all", pattern="^(all|active|completed)$"),
+    q: str = "",
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """按筛选条件分页列出待办，翻页方式和首页相同。"""
+
+    # 先取版本再查询：查询期间有写入时，客户端拿到的是旧版本号，下次轮询会重新取
+    etag = current_etag()
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    with Session(engine) as session:
+        page = list_todos(session, status=status, q=q, after=after, before=before, limit=limit)
+        result = TodoList(
+            todos=[TodoRead.model_validate(todo) for todo in page.todos],
+            prev_cursor=page.prev_cursor,
+            next_cursor=page.next_cursor,
+        )
+    _set_etag(response, etag)
+    return result
+
+
+@router.post("", response_model=TodoRead, status_code=201)
+def create_todo(payload: TodoCreate) -> TodoRead:
+    """新建一条待办。"""
+
+    with write_session() as session:
+        [todo_id] = create_todos(session, [payload.model_dump()])
+        session.commit()
+    return TodoRead(id=todo_id, **payload.model_dump())
+
+
+@router.get("/{todo_id}", response_model=TodoRead)
+def read_todo(todo_id: int, request: Request, response: Response):
+    """读取一条待办。"""
+
+    etag = current_etag()
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    with Session(engine) as session:
+        todo = session.get(Todo, todo_id)
+        if todo is None:
+            raise HTTPException(status_code=404, detail="待办不存在")
+        result = TodoRead.model_validate(todo)
+    _set_etag(response, etag)
+    return result
+
+
+@router.patch("/{todo_id}", response_model=TodoRead)
+def patch_todo(todo_id: int, payload: TodoUpdate) -> TodoRead:
+    """修改一条待办的标题或完成状态。"""
+
+    with write_session() as session:
+        todo = update_todo(session, todo_id, payload.model_dump(exclude_unset=True, exclude_none=True))
+        if todo is None:
+            raise HTTPException(status_code=404, detail="待办不存在")
+        result = TodoRead.model_validate(todo)
+        session.commit()
+    return result
+
+
+@router.delete("/{todo_id}", status_code=204)
+def remove_todo(todo_id: int) -> Response:
+    """删除一条待办。"""
+
+    with write_session() as session:
+        deleted = delete_todos(session, [todo_id])
+        session.commit()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="待办不存在")
+    return Response(status_code=204)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=201)
+def bulk_create(payload: BulkCreate) -> BulkResult:
+    """在一个事务里新建多条待办。"""
+
+    with write_session() as session:
+        ids = create_todos(session, [todo.model_dump() for todo in payload.todos])
+        session.commit()
+    return BulkResult(count=len(ids), ids=ids)
+
+
+@router.post("/bulk/toggle", response_model=BulkResult)
+def bulk_toggle(payload: BulkIds) -> BulkResult:
+    """用一条 UPDATE ... SET completed = NOT completed 切换多条待办。"""
+
+    with write_session() as session:
+        count = toggle_todos(session, payload.ids)
+        session.commit()
+    return BulkResult(count=count)
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+def bulk_delete(payload: BulkIds) -> BulkResult:
+    """用一条 DELETE ... WHERE id IN (...) 删除多条待办。"""
+
+    with write_session() as session:
+        count = delete_todos(session, payload.ids)
+        session.commit()
+    return BulkResult(count=count)
+
+
+def _parse_bool(value: str) -> bool:
+    text = value.strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"无法识别的完成状态 {value!r}")
+
+
+class CsvRowParser:
+    """逐行解析 CSV：第一行是表头，必须有 title 列，completed 列可选。
+
+    每条记录占一行，不支持引号内换行。
+    """
+
+    def __init__(self) -> None:
+        self.columns: Optional[List[str]] = None
+
+    def __call__(self, line: str) -> Optional[Dict[str, object]]:
+        try:
+            values = next(csv.reader([line]))
+        except csv.Error as exc:
+            # 例如行中间的回车、超长字段；表头坏了整个文件都没法解析
+            if self.columns is None:
+                raise HTTPException(status_code=400, detail=f"CSV 表头无法解析：{exc}") from exc
+            raise ValueError(f"CSV 格式错误：{exc}") from exc
+        if self.columns is None:
+            self.columns = [value.strip().lower() for value in values]
+            if "title" not in self.columns:
+                raise HTTPException(status_code=400, detail="CSV 表头缺少 title 列")
+            return None
+        row = dict(zip(self.columns, values))
+        return {"title": row.get("title", ""), "completed": _parse_bool(row.get("completed", ""))}
+
+
+def parse_ndjson_row(line: str) -> Dict[str, object]:
+    """每行一个 JSON 对象，例如 {"title": "买菜", "completed": false}。"""
+
+    row = json.loads(line)
+    if not isinstance(row, dict):
+        raise ValueError("每行必须是一个 JSON 对象")
+    return row
+
+
+@router.post("/import", response_model=ImportResult)
+async def import_todos(request: Request) -> ImportResult:
+    """流式导入 CSV（text/csv）或 NDJSON（application/x-ndjson）。
+
+    边接收边解析，内存里只保留当前这一批；每批在一个事务里写入。
+    格式不对的行会被跳过并在结果里报告，已写入的批次不会回滚。
+    """
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    parse: Callable[[str], Optional[Dict[str, object]]]
+    if content_type == "text/csv":
+        parse = CsvRowParser()
+    elif content_type in NDJSON_TYPES:
+        parse = parse_ndjson_row
+    else:
+        raise HTTPException(status_code=415, detail="只支持 text/csv 和 application/x-ndjson")
+
+    def insert_batch(rows: List[Dict[str, object]]) -> None:
+        with write_session() as session:
+            create_todos(session, rows, returning=False)
+            session.commit()
+
+    result = ImportResult(imported=0, skipped=0)
+    batch: List[Dict[str, object]] = []
+    line_no = 0
+
+    def handle(line: str) -> None:
+        nonlocal line_no
+        line_no += 1
+        line = line.rstrip("\r")
+        if not line.strip():
+            return
+        try:
+            row = parse(line)
+            if row is not None:
+                batch.append(TodoCreate.model_validate(row).model_dump())
+        except (ValueError, ValidationError) as exc:
+            result.skipped += 1
+            if len(result.errors) < MAX_IMPORT_ERRORS:
+                message = exc.errors()[0]["msg"] if isinstance(exc, ValidationError) else str(exc)
+                result.errors.append(f"第 {line_no} 行：{message}")
+
+    # utf-8-sig 顺便去掉 Excel 导出的 BOM；增量解码不会切坏跨块的多字节字符
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    try:
+        async for chunk in request.stream():
+            *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+            for line in lines:
+                handle(line)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await run_in_threadpool(insert_batch, batch)
+                result.imported += len(batch)
+                batch = []
+        handle(pending + decoder.decode(b"", final=True))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="请求体不是合法的 UTF-8") from None
+    if batch:
+        await run_in_threadpool(insert_batch, batch)
+        result.imported += len(batch)
+    return result
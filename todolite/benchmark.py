@@ -0,0 +1,105 @@
+"""首页分页基准测试。
+
+在临时数据库里逐步灌入 1 万、10 万、100 万条待办，每个规模下测首页、
+深翻页、按状态筛选和标题搜索的页面耗时（经过完整的请求和模板渲染），
+用来确认游标分页的页面耗时不随表的大小增长。加 --compare-full 时
+顺带测一次旧做法（一次读出所有行）作对比。
+
+在 todolite 目录下运行：
+    python benchmark.py --rows 10000,100000,1000000 --out bench.json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+
+def seed(path: str, start: int, stop: int) -> None:
+    """直接用 sqlite3 批量插入 id 在 [start, stop) 的行，比逐条走 ORM 快几个数量级。"""
+
+    rows = (
+        # 每 1000 条有一条标题含 "urgent"，用来测低命中率的搜索
+        (i, f"任务 {i} urgent" if i % 1000 == 0 else f"任务 {i}", i % 3 == 0)
+        for i in range(start, stop)
+    )
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany("INSERT INTO todo (id, title, completed) VALUES (?, ?, ?)", rows)
+    conn.close()
+
+
+def timed(fn, repeat: int) -> float:
+    """运行 repeat 次，返回耗时中位数（毫秒）。"""
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="TodoLite 分页基准测试")
+    parser.add_argument("--rows", default="10000,100000,1000000", help="逗号分隔的数据规模，递增")
+    parser.add_argument("--repeat", type=int, default=20, help="每个场景的重复次数，取中位数")
+    parser.add_argument("--compare-full", action="store_true", help="同时测一次读出全部行的旧做法")
+    parser.add_argument("--db", help="数据库文件路径，默认用临时文件")
+    parser.add_argument("--out", help="把结果以 JSON 写到这个文件")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="todolite-bench-"), "bench.db")
+    # 必须在导入 main 之前设置，database.py 在导入时创建 engine
+    os.environ["TODOLITE_DB"] = path
+
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session, select
+
+    from database import engine
+    from main import app
+    from models import Todo
+
+    sizes = [int(n) for n in args.rows.split(",")]
+    results: Dict[str, Dict[str, float]] = {}
+    with TestClient(app) as client:
+
+        def get(url: str) -> None:
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+
+        seeded = 0
+        for size in sizes:
+            seed(path, seeded + 1, size + 1)
+            seeded = size
+            scenarios = {
+                "first_page": "/",
+                "middle_page": f"/?after={size // 2}",
+                "last_page": f"/?before={size + 1}",
+                "completed_filter": f"/?status=completed&after={size // 2}",
+                "search_rare": "/?q=urgent",
+                "search_common": "/?q=任务",
+            }
+            timings = {name: timed(lambda url=url: get(url), args.repeat) for name, url in scenarios.items()}
+            if args.compare_full:
+
+                def load_all() -> None:
+                    with Session(engine) as session:
+                        session.exec(select(Todo)).all()
+
+                timings["load_all_rows"] = timed(load_all, 1)
+            results[str(size)] = timings
+            print(json.dumps({"rows": size, "ms": timings}, ensure_ascii=False))
+
+    report = {"db": path, "repeat": args.repeat, "results_ms": results}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""并发读写吞吐基准测试。
+
+用多个线程模拟同步路由在线程池里并发处理请求：按比例混合新增、
+切换状态（写）和读取首页（读），分别在默认引擎和调优后的引擎
+（WAL、PRAGMA、连接池、busy timeout、进程内写锁）上运行，报告吞吐、延迟分位数
+和 "database is locked" 错误数。每种配置使用单独的新数据库文件。
+
+在 todolite 目录下运行：
+    python benchmark_concurrency.py --threads 16 --duration 5 --write-ratio 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 2)
+
+
+def run_profile(tuned: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    from sqlalchemy.exc import OperationalError
+    from sqlmodel import Session, SQLModel
+
+    from database import make_engine, write_session
+    from crud import STATUS_FILTERS, list_todos
+    from models import Todo
+
+    path = os.path.join(tempfile.mkdtemp(prefix="todolite-bench-"), "bench.db")
+    engine = make_engine(f"sqlite:///{path}", tuned=tuned)
+    # 默认配置对照的是最初的写法：每个写请求直接开会话，靠 SQLite 自己的锁排队
+    open_write_session = (lambda: write_session(engine)) if tuned else (lambda: Session(engine))
+    SQLModel.metadata.create_all(engine)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO todo (title, completed) VALUES (?, ?)",
+            ((f"任务 {i}", i % 3 == 0) for i in range(args.rows)),
+        )
+    conn.close()
+
+    deadline = time.perf_counter() + args.duration
+    lock = threading.Lock()
+    latencies: Dict[str, List[float]] = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        local: Dict[str, List[float]] = {"read": [], "write": []}
+        local_errors = {"read": 0, "write": 0}
+        while time.perf_counter() < deadline:
+            kind = "write" if rng.random() < args.write_ratio else "read"
+            t0 = time.perf_counter()
+            try:
+                if kind == "read":
+                    with Session(engine) as session:
+                        list_todos(session, status=rng.choice(["all", *STATUS_FILTERS]))
+                else:
+                    with open_write_session() as session:
+                        if rng.random() < 0.5:
+                            session.add(Todo(title=f"新任务 {seed}"))
+                        else:
+                            todo = session.get(Todo, rng.randint(1, args.rows))
+                            if todo is not None:
+                                todo.completed = not todo.completed
+                                session.add(todo)
+                        session.commit()
+            except OperationalError:
+                local_errors[kind] += 1
+                continue
+            local[kind].append((time.perf_counter() - t0) * 1000)
+        with lock:
+            for key in latencies:
+                latencies[key].extend(local[key])
+                errors[key] += local_errors[key]
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for future in [pool.submit(worker, i) for i in range(args.threads)]:
+            future.result()
+    engine.dispose()
+
+    result: Dict[str, Any] = {}
+    for kind, values in latencies.items():
+        values.sort()
+        result[kind] = {
+            "ops": len(values),
+            "ops_per_s": round(len(values) / args.duration, 1),
+            "errors": errors[kind],
+            "p50_ms": percentile(values, 50),
+            "p99_ms": percentile(values, 99),
+        }
+    with sqlite3.connect(path) as conn:
+        result["journal_mode"] = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="TodoLite 并发读写基准测试")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0, help="每种配置运行的秒数")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="写操作占比")
+    parser.add_argument("--rows", type=int, default=10000, help="预先灌入的行数")
+    parser.add_argument("--out", help="把结果以 JSON 写到这个文件")
+    args = parser.parse_args()
+
+    report = {
+        "threads": args.threads,
+        "write_ratio": args.write_ratio,
+        "default": run_profile(False, args),
+        "tuned": run_profile(True, args),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
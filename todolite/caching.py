@@ -0,0 +1,120 @@
+"""条件请求和页面缓存：都以数据库的数据版本号为准。
+
+SQLite 的 PRAGMA data_version 在别的连接每次提交后都会变，读取它只看
+共享内存里的 WAL 索引，不读任何表，几微秒就能完成。用一个专门的连接
+读取它（这个连接自己从不写），应用里任何写操作、批量导入甚至外部工具的
+修改都会让版本号变化。
+
+版本号只在同一个连接上可比，所以 ETag 里带上本进程的启动标识：多进程
+部署时，别的进程签发的 ETag 只会对不上而返回 200，不会误返回 304。
+
+渲染好的页面也按这个版本号缓存，版本号一变整个缓存作废，所以写路径
+不需要自己记得清缓存。
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from fastapi import Request, Response
+
+from database import sqlite_file_name
+
+
+class DataVersion:
+    """数据库当前数据版本，写入提交后即变化。"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> str:
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return f"{self._boot_id}-{version}"
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+data_version = DataVersion(sqlite_file_name)
+
+
+def current_etag() -> str:
+    """当前数据对应的 ETag；所有待办接口共用，数据不变它就不变。"""
+
+    return f'"{data_version.current()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """请求的 If-None-Match 是否包含这个 ETag（忽略弱校验前缀 W/）。"""
+
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+# 每个进程最多缓存的渲染结果数（不同的筛选、搜索和翻页参数各占一条）
+PAGE_CACHE_SIZE = int(os.getenv("TODOLITE_PAGE_CACHE_SIZE", "256"))
+
+
+class PageCache:
+    """渲染结果的 LRU 缓存，只保存当前数据版本下的页面。"""
+
+    def __init__(self, max_entries: int = PAGE_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._version: Optional[str] = None
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: str, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, version: str, key: Hashable, body: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            # 渲染期间数据已经变了：这份结果不属于当前版本，丢掉
+            if version != self._version:
+                return
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+
+page_cache = PageCache()
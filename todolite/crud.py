@@ -0,0 +1,152 @@
+"""待办的数据访问函数，页面路由和 JSON 接口共用。
+
+写操作都是集合式的 SQL（多值 INSERT、UPDATE/DELETE ... WHERE id IN），
+不先读再写，也不逐行提交；调用方在 write_session() 里一次提交。
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, List, Mapping, Optional, Sequence
+
+from sqlalchemy import delete, insert, not_, update
+from sqlmodel import Session, select
+
+from models import Todo
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# 筛选参数到 completed 取值的映射，"all" 表示不筛选
+STATUS_FILTERS = {"active": False, "completed": True}
+
+
+@dataclass
+class TodoPage:
+    """一页待办和前后翻页用的游标。"""
+
+    todos: List[Todo]
+    prev_cursor: Optional[int] = None
+    next_cursor: Optional[int] = None
+
+
+def list_todos(
+    session: Session,
+    status: str = "all",
+    q: str = "",
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = PAGE_SIZE,
+) -> TodoPage:
+    """按 id 做游标（keyset）分页，只读取一页数据。
+
+    用 "id > 游标" 而不是 OFFSET 翻页，数据库直接从索引定位到起点，
+    所以无论翻到第几页、表里有多少行，每页的开销都一样。多查一行
+    用来判断是否还有下一页，避免额外的 COUNT。
+    """
+
+    statement = select(Todo)
+    completed = STATUS_FILTERS.get(status)
+    if completed is not None:
+        statement = statement.where(Todo.completed == completed)
+    keyword = q.strip()
+    if keyword:
+        # 子串匹配用不上 B-tree 索引，但会沿主键顺序扫描，凑满一页就停
+        statement = statement.where(Todo.title.contains(keyword, autoescape=True))
+
+    if before is not None:
+        rows = session.exec(statement.where(Todo.id < before).order_by(Todo.id.desc()).limit(limit + 1)).all()
+        todos = list(reversed(rows[:limit]))
+        return TodoPage(
+            todos=todos,
+            prev_cursor=todos[0].id if len(rows) > limit else None,
+            next_cursor=todos[-1].id if todos else None,
+        )
+
+    if after is not None:
+        statement = statement.where(Todo.id > after)
+    rows = session.exec(statement.order_by(Todo.id).limit(limit + 1)).all()
+    todos = list(rows[:limit])
+    return TodoPage(
+        todos=todos,
+        prev_cursor=todos[0].id if after is not None and todos else None,
+        next_cursor=todos[-1].id if len(rows) > limit else None,
+    )
+
+
+# 单条语句的 id 数量上限，远低于 SQLite 的绑定参数上限（32766）
+ID_CHUNK = 500
+
+
+def _chunks(ids: Sequence[int]) -> Iterable[Sequence[int]]:
+    unique = sorted(set(ids))
+    for start in range(0, len(unique), ID_CHUNK):
+        yield unique[start:start + ID_CHUNK]
+
+
+def create_todos(session: Session, rows: Sequence[Mapping[str, object]], returning: bool = True) -> List[int]:
+    """插入多条待办，返回新 id（与 rows 顺序一致）；returning=False 时不取回 id。
+
+    rows 的每一项包含 title，可选 completed。SQLAlchemy 会把它们合并成
+    多值 INSERT 语句批量执行。
+    """
+
+    if not rows:
+        return []
+    values = [{"title": row["title"], "completed": bool(row.get("completed", False))} for row in rows]
+    if not returning:
+        session.execute(insert(Todo), values)
+        return []
+    statement = insert(Todo).returning(Todo.id, sort_by_parameter_order=True)
+    return list(session.execute(statement, values).scalars())
+
+
+def update_todo(session: Session, todo_id: int, values: Mapping[str, object]) -> Optional[Todo]:
+    """用一条 UPDATE ... RETURNING 修改一条待办，返回修改后的行；不存在时返回 None。"""
+
+    if not values:
+        return session.get(Todo, todo_id)
+    statement = (
+        update(Todo)
+        .where(Todo.id == todo_id)
+        .values(**values)
+        .returning(Todo)
+        .execution_options(synchronize_session=False)
+    )
+    return session.execute(statement).scalar_one_or_none()
+
+
+def toggle_todo(session: Session, todo_id: int) -> Optional[Todo]:
+    """切换一条待办的完成状态，用 UPDATE ... RETURNING 一条语句取回新的行；不存在时返回 None。"""
+
+    statement = (
+        update(Todo)
+        .where(Todo.id == todo_id)
+        .values(completed=not_(Todo.completed))
+        .returning(Todo)
+        .execution_options(synchronize_session=False)
+    )
+    return session.execute(statement).scalar_one_or_none()
+
+
+def toggle_todos(session: Session, ids: Sequence[int]) -> int:
+    """把这些 id 的完成状态取反，返回实际更新的行数。"""
+
+    updated = 0
+    for chunk in _chunks(ids):
+        statement = (
+            update(Todo)
+            .where(Todo.id.in_(chunk))
+            .values(completed=not_(Todo.completed))
+            # 会话很短，不需要同步内存里的对象
+            .execution_options(synchronize_session=False)
+        )
+        updated += session.execute(statement).rowcount
+    return updated
+
+
+def delete_todos(session: Session, ids: Sequence[int]) -> int:
+    """删除这些 id 的待办，返回实际删除的行数。"""
+
+    deleted = 0
+    for chunk in _chunks(ids):
+        statement = delete(Todo).where(Todo.id.in_(chunk)).execution_options(synchronize_session=False)
+        deleted += session.execute(statement).rowcount
+    return deleted
@@ -1,15 +1,22 @@
 """应用入口和页面路由。"""
 
+import os
 from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlencode
 
-from fastapi import FastAPI, Form, Request
+from fastapi import FastAPI, Form, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
 
-from database import create_db_and_tables, engine
-from models import Todo
+from api import router as api_router
+from caching import current_etag, etag_matches, not_modified, page_cache
+from crud import MAX_PAGE_SIZE, PAGE_SIZE, STATUS_FILTERS, create_todos, delete_todos, list_todos, toggle_todo
+from database import create_db_and_tables, engine, write_session
+from models import TodoRead
 
 
 @asynccontextmanager
@@ -22,61 +29,134 @@ async def lifespan(_: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
+app.include_router(api_router)
 templates = Jinja2Templates(directory="templates")
+# 默认每次取模板都要检查文件修改时间；修改模板时设 TODOLITE_TEMPLATE_RELOAD=1
+templates.env.auto_reload = os.getenv("TODOLITE_TEMPLATE_RELOAD", "0") == "1"
+# 导入时就编译好，第一个请求不用再解析模板
+index_template = templates.get_template("index.html")
+todo_item_template = templates.get_template("_todo_item.html")
+
+
+@app.exception_handler(OperationalError)
+async def database_busy_handler(_: Request, exc: OperationalError) -> PlainTextResponse:
+    """等待写锁超过 busy timeout 时返回 503，让客户端稍后重试，而不是 500。"""
+
+    if "locked" not in str(exc.orig) and "busy" not in str(exc.orig):
+        raise exc
+    return PlainTextResponse("数据库繁忙，请稍后重试。", status_code=503, headers={"Retry-After": "1"})
+
+
+def page_url(status: str, q: str, limit: int, **cursor: Optional[int]) -> str:
+    """生成保留筛选条件的翻页链接，省略默认值。"""
+
+    params = {"status": status if status != "all" else None, "q": q or None}
+    params["limit"] = limit if limit != PAGE_SIZE else None
+    params.update(cursor)
+    query = urlencode({key: value for key, value in params.items() if value is not None})
+    return f"/?{query}" if query else "/"
+
+
+def wants_fragment(request: Request) -> bool:
+    """页面脚本（或 htmx）发来的请求只需要变化的那一条待办的 HTML。"""
+
+    return request.headers.get("hx-request") == "true"
+
+
+def render_todo_item(todo: TodoRead) -> HTMLResponse:
+    return HTMLResponse(todo_item_template.render(todo=todo))
 
 
 @app.get("/", response_class=HTMLResponse)
-def read_index(request: Request) -> HTMLResponse:
-    """渲染首页并显示所有待办。"""
+def read_index(
+    request: Request,
+    status: str = "all",
+    q: str = "",
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+) -> HTMLResponse:
+    """渲染首页，按筛选条件分页显示待办。
+
+    数据没变时返回 304；浏览器没有缓存时，同样的参数直接用缓存里渲染好的页面，
+    不查表也不渲染。
+    """
+
+    etag = current_etag()
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if status not in STATUS_FILTERS:
+        status = "all"
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    key = (status, q, after, before, limit)
+    body = page_cache.get(etag, key)
+    if body is not None:
+        return HTMLResponse(body, headers=headers)
 
     with Session(engine) as session:
-        todos = session.exec(select(Todo)).all()
-
-    return templates.TemplateResponse(
-        request=request,
-        name="index.html",
-        context={"todos": todos},
-    )
+        page = list_todos(session, status=status, q=q, after=after, before=before, limit=limit)
+
+    prev_url = next_url = None
+    if page.prev_cursor is not None:
+        prev_url = page_url(status, q, limit, before=page.prev_cursor)
+    if page.next_cursor is not None:
+        next_url = page_url(status, q, limit, after=page.next_cursor)
+
+    body = index_template.render(
+        todos=page.todos,
+        status=status,
+        q=q,
+        filtered=status != "all" or bool(q.strip()),
+        prev_url=prev_url,
+        next_url=next_url,
+    ).encode()
+    page_cache.put(etag, key, body)
+    return HTMLResponse(body, headers=headers)
 
 
 @app.post("/todos")
-def create_todo(title: str = Form(...)) -> RedirectResponse:
-    """新增一条待办。"""
+def create_todo(request: Request, title: str = Form(...)) -> Response:
+    """新增一条待办；局部更新时返回新待办的 HTML 片段。"""
 
     clean_title = title.strip()
     if not clean_title:
+        if wants_fragment(request):
+            return HTMLResponse("")
         return RedirectResponse(url="/", status_code=303)
 
-    with Session(engine) as session:
-        todo = Todo(title=clean_title)
-        session.add(todo)
+    with write_session() as session:
+        [todo_id] = create_todos(session, [{"title": clean_title}])
         session.commit()
 
+    if wants_fragment(request):
+        return render_todo_item(TodoRead(id=todo_id, title=clean_title, completed=False))
     return RedirectResponse(url="/", status_code=303)
 
 
 @app.post("/todos/{todo_id}/toggle")
-def toggle_todo(todo_id: int) -> RedirectResponse:
-    """切换待办的完成状态。"""
+def toggle_todo_status(request: Request, todo_id: int) -> Response:
+    """切换待办的完成状态；局部更新时只返回这一条待办的 HTML 片段。"""
 
-    with Session(engine) as session:
-        todo = session.get(Todo, todo_id)
-        if todo is not None:
-            todo.completed = not todo.completed
-            session.add(todo)
-            session.commit()
+    with write_session() as session:
+        todo = toggle_todo(session, todo_id)
+        item = TodoRead.model_validate(todo) if todo is not None else None
+        session.commit()
 
-    return RedirectResponse(url="/", status_code=303)
+    if not wants_fragment(request):
+        return RedirectResponse(url="/", status_code=303)
+    if item is None:
+        return HTMLResponse("", status_code=404)
+    return render_todo_item(item)
 
 
 @app.post("/todos/{todo_id}/delete")
-def delete_todo(todo_id: int) -> RedirectResponse:
-    """删除一条待办。"""
+def delete_todo(request: Request, todo_id: int) -> Response:
+    """删除一条待办；局部更新时返回空内容，由页面移除这一条。"""
 
-    with Session(engine) as session:
-        todo = session.get(Todo, todo_id)
-        if todo is not None:
-            session.delete(todo)
-            session.commit()
+    with write_session() as session:
+        delete_todos(session, [todo_id])
+        session.commit()
 
+    if wants_fragment(request):
+        return HTMLResponse("")
     return RedirectResponse(url="/", status_code=303)
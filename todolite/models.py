@@ -1,7 +1,8 @@
-"""定义待办数据模型。"""
+"""定义待办数据模型，以及 JSON 接口的请求和响应结构。"""
 
-from typing import Optional
+from typing import List, Optional
 
+from pydantic import field_validator
 from sqlmodel import Field, SQLModel
 
 
@@ -10,4 +11,85 @@ class Todo(SQLModel, table=True):
 
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
+    # 按完成状态筛选时走这个索引；SQLite 的二级索引自带 rowid，
+    # 所以 "completed = ? AND id > ? ORDER BY id" 也能直接按索引顺序分页
+    completed: bool = Field(default=False, index=True)
+
+
+# 单次批量请求最多处理的条数
+MAX_BULK_ITEMS = 10000
+
+
+class TodoCreate(SQLModel):
+    """新建待办的请求体。"""
+
+    title: str = Field(min_length=1, max_length=500)
     completed: bool = False
+
+    @field_validator("title")
+    @classmethod
+    def strip_title(cls, value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError("标题不能为空")
+        return value
+
+
+class TodoUpdate(SQLModel):
+    """修改待办的请求体，只更新传了的字段。"""
+
+    title: Optional[str] = Field(default=None, min_length=1, max_length=500)
+    completed: Optional[bool] = None
+
+    @field_validator("title")
+    @classmethod
+    def strip_title(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return value
+        value = value.strip()
+        if not value:
+            raise ValueError("标题不能为空")
+        return value
+
+
+class TodoRead(SQLModel):
+    """接口返回的一条待办。"""
+
+    id: int
+    title: str
+    completed: bool
+
+
+class TodoList(SQLModel):
+    """接口返回的一页待办和前后翻页用的游标。"""
+
+    todos: List[TodoRead]
+    prev_cursor: Optional[int] = None
+    next_cursor: Optional[int] = None
+
+
+class BulkCreate(SQLModel):
+    """批量新建的请求体。"""
+
+    todos: List[TodoCreate] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class BulkIds(SQLModel):
+    """按 id 批量操作的请求体。"""
+
+    ids: List[int] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+
+class BulkResult(SQLModel):
+    """批量操作的结果：影响的行数，新建时还有新 id。"""
+
+    count: int
+    ids: List[int] = []
+
+
+class ImportResult(SQLModel):
+    """导入结果：成功导入和跳过的行数，以及前几条错误。"""
+
+    imported: int
+    skipped: int
+    errors: List[str] = []
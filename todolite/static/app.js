@@ -0,0 +1,49 @@
+// 局部更新：带 data-swap 的表单改用 fetch 提交，请求头带 HX-Request，
+// 服务端只返回变化的那一条待办的 HTML，这里把它换进页面，不再整页刷新。
+// 没有 JavaScript 时表单照常提交并重定向回首页。
+
+document.addEventListener("submit", async (event) => {
+  const form = event.target;
+  const swap = form.dataset.swap;
+  if (!swap) {
+    return;
+  }
+  const list = document.querySelector(".todo-list");
+  const item = form.closest(".todo-item");
+  // 新增的待办排在最后；只有当前显示的就是未筛选的最后一页时才能直接追加
+  if (swap === "append" && (!list || list.dataset.append !== "true")) {
+    return;
+  }
+  event.preventDefault();
+
+  let response;
+  try {
+    response = await fetch(form.action, {
+      method: "POST",
+      body: new FormData(form),
+      headers: { "HX-Request": "true" },
+    });
+  } catch {
+    form.submit();
+    return;
+  }
+  if (!response.ok) {
+    window.location.reload();
+    return;
+  }
+  const html = await response.text();
+
+  if (swap === "remove") {
+    item.remove();
+  } else if (swap === "replace") {
+    // 按状态筛选时，切换后的待办已经不属于当前列表
+    if (list.dataset.status === "all") {
+      item.outerHTML = html;
+    } else {
+      item.remove();
+    }
+  } else if (swap === "append" && html) {
+    list.insertAdjacentHTML("beforeend", html);
+    form.reset();
+  }
+});